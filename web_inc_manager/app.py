@@ -1,28 +1,79 @@
 import os
 import json
 import re
-import socket
+import math
+import calendar
 import logging
 import chardet
 from datetime import datetime, timedelta
 from io import BytesIO
 import base64
+import tempfile
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, session, Response
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, session, Response, jsonify, stream_with_context, abort, send_from_directory, make_response
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 import csv
-from models import db, User, INC, LayoutSetting, Fornecedor, RotinaInspecao
+import uuid
+import click
+from models import (db, User, INC, LayoutSetting, Fornecedor, RotinaInspecao, PrintJob, ApiToken, ChangeLog,
+                    RotinaCompartilhada, FornecedorAlias, Item, cnpj_digitos, data_iso)
 from config import Config
+from utils.print_spooler import spooler, job_status, ensure_print_job_columns
+from utils.zpl import render_inc_label, render_inc_labels
+from utils.pdf_export import inc_to_dict, render_incs_pdf, build_consolidated_pdf
+from utils.xlsx_export import escrever_incs_xlsx
+from utils.columnar_export import (escrever_parquet, stream_arrow, disponivel as exportacao_colunar_disponivel,
+                                   ENTIDADES as ENTIDADES_COLUNARES, FORMATOS as FORMATOS_COLUNARES,
+                                   MIMETYPES as MIMETYPES_COLUNARES)
+from utils.upload_delivery import upload_url, send_upload
+from utils.compression import compress
+from utils.metrics import metrics
+from utils.slow_query_log import slow_query_log, scan_summary
+from utils.sqlite_profile import configure_sqlite, init_sqlite_profile, begin_write
+from utils.api import (api_token_required, api_error, generate_token, parse_fields, keyset_page,
+                       conditional_json, parse_json_text, json_response)
+from utils.change_log import change_tracker
+from utils.inc_import import importar_incs, URGENCIAS, STATUS
+from utils.change_log import record_changes
+from sqlalchemy import update, delete
+from sqlalchemy.exc import IntegrityError
+from utils.shared_routines import (ACOES, RoutineClosed, VersionConflict, create_shared_routine, routine_records,
+                                   update_record, save_routine, routine_events, sync_actions)
+from utils.upload_delivery import file_fingerprint
+from utils.login_security import password_hasher, login_limiter, HasherBusy
+from utils.supplier_directory import supplier_directory, somente_digitos
+from utils.supplier_import import (importar_fornecedores, aplicar_renomeacoes, ensure_cnpj_index,
+                                   FORMATOS as FORMATOS_FORNECEDORES)
+from utils.supplier_matching import supplier_matcher, vincular_fornecedores
+from utils.item_stats import item_stats, refresh_inc_items, reconstruir_itens, ensure_item_index
+from utils.supplier_ppm import supplier_ppm, refresh_supplier_months, reconstruir_ppm, serie_ppm
+from utils.pareto import pareto_cache, ensure_pareto_index, DIMENSOES as DIMENSOES_PARETO, METRICAS as METRICAS_PARETO
+from utils.inc_snapshot import (inc_snapshot, CATEGORIAS as CATEGORIAS_ANALISE, DIMENSOES as DIMENSOES_ANALISE,
+                                CAMPOS as CAMPOS_ANALISE, ORDENS as ORDENS_ANALISE)
 
 app = Flask(__name__)
 app.config.from_object(Config)
+configure_sqlite(app)
 db.init_app(app)
+init_sqlite_profile(app, db)
+spooler.init_app(app)
+compress.init_app(app)
+metrics.init_app(app)
+slow_query_log.init_app(app)
+change_tracker.init_app(app)
+password_hasher.init_app(app)
+login_limiter.init_app(app)
+supplier_directory.init_app(app)
+supplier_matcher.init_app(app)
+item_stats.init_app(app)
+pareto_cache.init_app(app)
+supplier_ppm.init_app(app)
+inc_snapshot.init_app(app)
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -41,6 +92,11 @@ def jinja_enumerate(iterable):
 
 app.jinja_env.filters['enumerate'] = jinja_enumerate
 
+# URLs de fotos com fingerprint de conteúdo
+app.jinja_env.globals['upload_url'] = upload_url
+
+REPRESENTANTES = ["Gabriel Rodrigues da Silva", "Marcos Vinicius Gomes Teixeira", "Aleksandro Carvalho Leão"]
+
 # Configurações de logging
 logging.basicConfig(level=logging.DEBUG)
 
@@ -156,6 +212,7 @@ def ler_arquivo_lst(caminho):
                     # Analisar fornecedor
                     splitted_6 = re.split(r"\s+", campos[6], maxsplit=1)
                     fornecedor = splitted_6[1] if len(splitted_6) == 2 else "DESCONHECIDO"
+                    codigo_fornecedor = splitted_6[0] if len(splitted_6) == 2 else ""
                     
                     # Analisar O.C.
                     oc_str = campos[-1].strip()
@@ -167,7 +224,8 @@ def ler_arquivo_lst(caminho):
                     
                     registro = {
                         "fornecedor": fornecedor,
-                        "razao_social": fornecedor,
+                        "razao_social": fornecedor,  # trocada pela do cadastro em vincular_fornecedores
+                        "codigo_fornecedor": codigo_fornecedor,
                         "item": item_code,
                         "descricao": descricao,
                         "num_aviso": num_aviso,
@@ -207,9 +265,32 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
+        # O limite vem antes do hash: tentativas em excesso não gastam CPU
+        espera = login_limiter.hit(username, request.remote_addr)
+        if espera:
+            flash(f'Muitas tentativas de login. Tente novamente em {math.ceil(espera)} segundos.')
+            response = make_response(render_template('login.html'), 429)
+            response.headers['Retry-After'] = str(math.ceil(espera))
+            return response
+
         user = User.query.filter_by(username=username).first()
-        
-        if user and check_password_hash(user.password, password):
+        try:
+            senha_ok = password_hasher.verify(user.password if user else None, password)
+        except HasherBusy:
+            flash('Muitos logins ao mesmo tempo. Tente novamente em instantes.')
+            response = make_response(render_template('login.html'), 503)
+            response.headers['Retry-After'] = '2'
+            return response
+
+        if user and senha_ok:
+            if password_hasher.needs_rehash(user.password):
+                # Parâmetros do hash mudaram: regrava com os atuais enquanto temos a senha
+                try:
+                    user.password = password_hasher.hash(password)
+                    db.session.commit()
+                except HasherBusy:
+                    db.session.rollback()
+            login_limiter.reset(username)
             login_user(user)
             next_page = request.args.get('next')
             return redirect(next_page or url_for('main_menu'))
@@ -250,11 +331,15 @@ def gerenciar_logins():
             flash('Usuário excluído com sucesso!')
         elif action == 'update':
             new_password = request.form.get('new_password')
-            if new_password:
-                user.password = generate_password_hash(new_password)
-            user.is_admin = 'is_admin' in request.form
-            db.session.commit()
-            flash('Usuário atualizado com sucesso!')
+            try:
+                if new_password:
+                    user.password = password_hasher.hash(new_password)
+                user.is_admin = 'is_admin' in request.form
+                db.session.commit()
+                flash('Usuário atualizado com sucesso!')
+            except HasherBusy:
+                db.session.rollback()
+                flash('Muitos logins ao mesmo tempo. Tente novamente em instantes.')
     
     users = User.query.all()
     return render_template('gerenciar_logins.html', users=users)
@@ -276,10 +361,17 @@ def cadastrar_usuario():
             flash('Nome de usuário já existe. Escolha outro.', 'danger')
             return render_template('cadastrar_usuario.html')
 
+        try:
+            senha = password_hasher.hash(password)
+        except HasherBusy:
+            db.session.rollback()
+            flash('Muitos logins ao mesmo tempo. Tente novamente em instantes.', 'danger')
+            return render_template('cadastrar_usuario.html')
+
         # Criar novo usuário
         new_user = User(
             username=username, 
-            password=generate_password_hash(password), 
+            password=senha, 
             is_admin=is_admin
         )
         db.session.add(new_user)
@@ -320,8 +412,7 @@ def editar_layout():
 @app.route('/cadastro_inc', methods=['GET', 'POST'])
 @login_required
 def cadastro_inc():
-    representantes = ["Gabriel Rodrigues da Silva", "Marcos Vinicius Gomes Teixeira", "Aleksandro Carvalho Leão"]
-    fornecedores = Fornecedor.query.all()
+    representantes = REPRESENTANTES
 
     if request.method == 'POST':
         nf = int(request.form['nf'])
@@ -333,13 +424,20 @@ def cadastro_inc():
 
         if not validate_item_format(item):
             flash('Formato do item inválido. Deve ser 3 letras maiúsculas, ponto e 5 dígitos, ex: MPR.02199')
-            return render_template('cadastro_inc.html', representantes=representantes, fornecedores=fornecedores)
+            return render_template('cadastro_inc.html', representantes=representantes)
 
         if quantidade_com_defeito > quantidade_recebida:
             flash('Quantidade com defeito não pode ser maior que a quantidade recebida.')
-            return render_template('cadastro_inc.html', representantes=representantes, fornecedores=fornecedores)
+            return render_template('cadastro_inc.html', representantes=representantes)
+
+        # O diretório de outro processo pode estar desatualizado; na dúvida confere no banco
+        if supplier_directory.get(fornecedor) is None and \
+                not Fornecedor.query.filter_by(razao_social=fornecedor).first():
+            flash('Fornecedor não cadastrado. Escolha um fornecedor da lista.')
+            return render_template('cadastro_inc.html', representantes=representantes)
 
-        # Gerar número OC sequencial
+        # Gerar número OC sequencial (lido na conexão de escrita para não repetir o número)
+        begin_write(db.session)
         last_inc = INC.query.order_by(INC.oc.desc()).first()
         new_oc = (last_inc.oc + 1) if last_inc and last_inc.oc else 1
 
@@ -375,20 +473,82 @@ def cadastro_inc():
         flash('INC cadastrada com sucesso!')
         return redirect(url_for('visualizar_incs'))
 
-    return render_template('cadastro_inc.html', representantes=representantes, fornecedores=fornecedores)
+    return render_template('cadastro_inc.html', representantes=representantes)
 
-@app.route('/visualizar_incs')
+def pasta_relatorios_importacao():
+    pasta = os.path.join(app.instance_path, 'import_reports')
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+@app.route('/importar_incs', methods=['GET', 'POST'])
 @login_required
-def visualizar_incs():
-    # Obter parâmetros de filtro
-    nf = request.args.get('nf')
-    item = request.args.get('item')
-    fornecedor = request.args.get('fornecedor')
-    status = request.args.get('status')
-    page = request.args.get('page', 1, type=int)
-    per_page = app.config.get('ITEMS_PER_PAGE', 10)
+def importar_incs_view():
+    if not current_user.is_admin:
+        flash('Acesso negado.')
+        return redirect(url_for('main_menu'))
+
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if not file or not file.filename:
+            flash('Selecione um arquivo .csv ou .xlsx.')
+            return redirect(url_for('importar_incs_view'))
+
+        nome_relatorio = f"erros_{uuid.uuid4().hex}.csv"
+        caminho_relatorio = os.path.join(pasta_relatorios_importacao(), nome_relatorio)
+        try:
+            with open(caminho_relatorio, 'w', newline='', encoding='utf-8-sig') as relatorio:
+                resultado = importar_incs(file.stream, file.filename, relatorio,
+                                          batch_size=app.config.get('IMPORT_BATCH_SIZE', 5000))
+        except ValueError as e:
+            db.session.rollback()
+            os.remove(caminho_relatorio)
+            flash(f'Erro ao importar: {e}', 'danger')
+            return redirect(url_for('importar_incs_view'))
+
+        if not resultado['erros']:
+            os.remove(caminho_relatorio)
+            nome_relatorio = None
+        logging.info(f"Importação de INCs por {current_user.username}: {resultado['inseridas']} inseridas, "
+                     f"{resultado['erros']} com erro")
+        return render_template('importar_incs.html', resultado=resultado, relatorio=nome_relatorio)
+
+    return render_template('importar_incs.html', resultado=None, relatorio=None)
+
+@app.route('/importar_incs/relatorio/<nome>')
+@login_required
+def relatorio_importacao(nome):
+    if not current_user.is_admin:
+        abort(403)
+    download_name = 'diferencas_fornecedores.csv' if nome.startswith('fornecedores_') else 'erros_importacao.csv'
+    return send_from_directory(pasta_relatorios_importacao(), secure_filename(nome),
+                               mimetype='text/csv', as_attachment=True, download_name=download_name)
+
+@app.cli.command('importar-incs')
+@click.argument('arquivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--relatorio', default='erros_importacao.csv', help='CSV com as linhas rejeitadas')
+@click.option('--lote', default=5000, help='INCs por transação')
+def importar_incs_command(arquivo, relatorio, lote):
+    """Importa INCs de um arquivo .csv ou .xlsx"""
+    with open(arquivo, 'rb') as stream, open(relatorio, 'w', newline='', encoding='utf-8-sig') as saida:
+        resultado = importar_incs(stream, arquivo, saida, batch_size=lote)
+    click.echo(f"{resultado['inseridas']} INCs inseridas, {resultado['erros']} linhas com erro")
+    if resultado['erros']:
+        click.echo(f"Linhas rejeitadas em {relatorio}")
+
+FILTROS_INC = ('nf', 'item', 'fornecedor', 'item_exato', 'fornecedor_exato', 'status', 'representante', 'de', 'ate')
+
+def filtrar_incs(args):
+    """Monta a consulta de INCs com os filtros da tela visualizar_incs"""
+    nf = args.get('nf')
+    item = args.get('item')
+    fornecedor = args.get('fornecedor')
+    item_exato = args.get('item_exato')
+    fornecedor_exato = args.get('fornecedor_exato')
+    status = args.get('status')
+    representante = args.get('representante')
+    de = parse_date(args.get('de'))
+    ate = parse_date(args.get('ate'))
 
-    # Construir consulta com filtros
     query = INC.query
     if nf:
         query = query.filter_by(nf=int(nf))
@@ -396,8 +556,30 @@ def visualizar_incs():
         query = query.filter(INC.item.ilike(f'%{item}%'))
     if fornecedor:
         query = query.filter(INC.fornecedor.ilike(f'%{fornecedor}%'))
+    # Valor exato (links do Pareto): mostra as mesmas INCs que foram contadas no ranking
+    if item_exato:
+        query = query.filter(INC.item == item_exato)
+    if fornecedor_exato:
+        query = query.filter(INC.fornecedor == fornecedor_exato)
     if status:
         query = query.filter_by(status=status)
+    if representante:
+        query = query.filter_by(representante=representante)
+    # Período (vindo do Pareto) pela data em formato ISO, a expressão do índice ix_inc_periodo
+    if de:
+        query = query.filter(data_iso(INC.data) >= de.strftime('%Y-%m-%d'))
+    if ate:
+        query = query.filter(data_iso(INC.data) <= ate.strftime('%Y-%m-%d'))
+    return query
+
+@app.route('/visualizar_incs')
+@login_required
+def visualizar_incs():
+    page = request.args.get('page', 1, type=int)
+    per_page = app.config.get('ITEMS_PER_PAGE', 10)
+
+    # Construir consulta com filtros
+    query = filtrar_incs(request.args)
 
     # Paginar resultados
     pagination = query.order_by(INC.id.desc()).paginate(
@@ -405,7 +587,9 @@ def visualizar_incs():
     )
     incs = pagination.items
 
-    return render_template('visualizar_incs.html', incs=incs, pagination=pagination)
+    filtros = {campo: request.args[campo] for campo in FILTROS_INC if request.args.get(campo)}
+    return render_template('visualizar_incs.html', incs=incs, pagination=pagination, filtros=filtros,
+                           representantes=REPRESENTANTES, urgencias=URGENCIAS, status_opcoes=STATUS)
 
 @app.route('/detalhes_inc/<int:inc_id>')
 @login_required
@@ -418,7 +602,7 @@ def detalhes_inc(inc_id):
 @login_required
 def editar_inc(inc_id):
     inc = INC.query.get_or_404(inc_id)
-    representantes = ["Gabriel Rodrigues da Silva", "Marcos Vinicius Gomes Teixeira", "Aleksandro Carvalho Leão"]
+    representantes = REPRESENTANTES
     fotos = json.loads(inc.fotos) if inc.fotos else []
 
     if request.method == 'POST':
@@ -460,6 +644,10 @@ def editar_inc(inc_id):
 
     return render_template('editar_inc.html', inc=inc, representantes=representantes, fotos=fotos)
 
+@app.route('/uploads/<fingerprint>/<filename>')
+def upload_file(fingerprint, filename):
+    return send_upload(fingerprint, filename)
+
 @app.route('/remover_foto_inc/<int:inc_id>/<path:foto>', methods=['POST'])
 @login_required
 def remover_foto_inc(inc_id, foto):
@@ -489,9 +677,59 @@ def excluir_inc(inc_id):
     flash('INC excluída com sucesso!')
     return redirect(url_for('visualizar_incs'))
 
-@app.route('/expiracao_inc')
+@app.route('/acoes_lote_incs', methods=['POST'])
 @login_required
-def expiracao_inc():
+def acoes_lote_incs():
+    """Altera status/urgência/representante ou exclui várias INCs com um único UPDATE/DELETE"""
+    campo, _, valor = request.form.get('acao', '').partition(':')
+    filtros = {k: request.form.get(k, '') for k in FILTROS_INC}
+    voltar = redirect(url_for('visualizar_incs', **{k: v for k, v in filtros.items() if v}))
+    opcoes = {'status': STATUS, 'urgencia': URGENCIAS, 'representante': REPRESENTANTES}
+
+    if campo not in opcoes and campo != 'excluir':
+        flash('Selecione uma ação.', 'warning')
+        return voltar
+    if campo in opcoes and valor not in opcoes[campo]:
+        flash('Valor inválido para a ação.', 'danger')
+        return voltar
+
+    # Escopo: INCs marcadas ou todas as INCs do filtro atual (exclusão só das marcadas)
+    if request.form.get('escopo') == 'filtro' and campo != 'excluir':
+        criterio = filtrar_incs(filtros).whereclause
+        if criterio is None:
+            criterio = db.true()
+    else:
+        inc_ids = request.form.getlist('inc_ids', type=int)
+        if not inc_ids:
+            flash('Nenhuma INC selecionada.', 'warning')
+            return voltar
+        criterio = INC.id.in_(inc_ids)
+
+    if campo == 'excluir':
+        removidas = db.session.execute(delete(INC).where(criterio).returning(
+            INC.id, INC.fotos, INC.item, INC.fornecedor, INC.data)).all()
+        record_changes(db.session, INC, [inc.id for inc in removidas], 'delete')
+        refresh_inc_items(db.session, {inc.item for inc in removidas})
+        refresh_supplier_months(db.session, {(inc.fornecedor, inc.data) for inc in removidas})
+        db.session.commit()
+        # Fotos só são apagadas depois do commit
+        for _, fotos, *_ in removidas:
+            for foto in json.loads(fotos) if fotos else []:
+                remove_file(foto)
+        flash(f'{len(removidas)} INC(s) excluída(s).')
+        return voltar
+
+    alteradas = db.session.execute(
+        update(INC).where(criterio).values({campo: valor}).returning(INC.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    record_changes(db.session, INC, alteradas, 'update')
+    db.session.commit()
+    flash(f'{len(alteradas)} INC(s) atualizada(s).')
+    return voltar
+
+def listar_incs_vencidas():
+    """Retorna a lista de (INC, dias de atraso) das INCs com prazo vencido"""
     incs = INC.query.all()
     today = datetime.today().date()
     vencidas = []
@@ -502,6 +740,12 @@ def expiracao_inc():
         if today > expiration_date:
             days_overdue = (today - expiration_date).days
             vencidas.append((inc, days_overdue))
+    return vencidas
+
+@app.route('/expiracao_inc')
+@login_required
+def expiracao_inc():
+    vencidas = listar_incs_vencidas()
     return render_template('expiracao_inc.html', vencidas=vencidas)
 
 @app.route('/print_inc_label/<int:inc_id>')
@@ -509,118 +753,134 @@ def expiracao_inc():
 def print_inc_label(inc_id):
     inc = INC.query.get_or_404(inc_id)
     
-    # Montar o ZPL com layout ajustado
-    zpl = f"""^XA
-^PW800          ; Largura: 100 mm = 800 pontos (203 DPI)
-^LL976          ; Altura: 122 mm = 976 pontos (203 DPI)
-^CF0,30         ; Fonte padrão, tamanho 20 pontos
-^FO50,50^FDNF-e:^FS
-^FO300,50^FD{inc.nf}^FS
-^FO50,100^FDData:^FS
-^FO300,100^FD{inc.data}^FS
-^FO50,150^FDRepresentante:^FS
-^FO300,150^FD{inc.representante[:20]}^FS    ; Limitar a 20 caracteres
-^FO50,200^FDFornecedor:^FS
-^FO300,200^FD{inc.fornecedor[:20]}^FS      ; Limitar a 20 caracteres
-^FO50,250^FDItem:^FS
-^FO300,250^FD{inc.item}^FS
-^FO50,300^FDQtd. Recebida:^FS
-^FO300,300^FD{inc.quantidade_recebida}^FS
-^FO50,350^FDQtd. Defeituosa:^FS
-^FO300,350^FD{inc.quantidade_com_defeito}^FS
-^FO50,400^FDDescricao:^FS
-^FO300,400^FB600,6,N,10^FD{inc.descricao_defeito}^FS  ; Bloco de texto com quebra de linha
-^FO50,650^FDUrgencia:^FS
-^FO300,650^FD{inc.urgencia}^FS
-^FO50,720^FDAcao Recomendada:^FS
-^FO300,720^FB600,3,N,10^FD{inc.acao_recomendada}^FS  ; Bloco de texto com quebra de linha
-^FO50,830^FDStatus:^FS
-^FO300,830^FD{inc.status}^FS
-^XZ"""
+    zpl = render_inc_label(inc)
 
     printer_ip = app.config.get('PRINTER_IP', "192.168.1.48")
     printer_port = app.config.get('PRINTER_PORT', 9100)
-    
-    try:
-        logging.debug(f"Tentando conectar a {printer_ip}:{printer_port}")
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.settimeout(5)  # Timeout de 5 segundos
-            s.connect((printer_ip, printer_port))
-            logging.debug("Conexão estabelecida, enviando ZPL")
-            s.send(zpl.encode('utf-8'))
-            logging.debug("ZPL enviado com sucesso")
-        flash('Etiqueta enviada para impressão!', 'success')
-    except socket.error as e:
-        logging.error(f"Erro de socket: {str(e)}")
-        flash(f'Erro ao imprimir: {str(e)}', 'danger')
-    except Exception as e:
-        logging.error(f"Erro geral: {str(e)}")
-        flash(f'Erro ao imprimir: {str(e)}', 'danger')
 
-    return redirect(url_for('detalhes_inc', inc_id=inc_id))
+    # A impressão é feita em segundo plano pela fila; a requisição só grava o job
+    job = spooler.enqueue(zpl, printer_ip, printer_port, inc_id=inc.id)
+    logging.debug(f"Job de impressão {job.id} enfileirado para {printer_ip}:{printer_port}")
+    flash('Etiqueta enviada para a fila de impressão!', 'success')
+
+    return redirect(url_for('detalhes_inc', inc_id=inc_id, print_job=job.id))
+
+@app.route('/print_inc_labels', methods=['POST'])
+@login_required
+def print_inc_labels():
+    inc_ids = request.form.getlist('inc_ids', type=int)
+    incs = INC.query.filter(INC.id.in_(inc_ids)).order_by(INC.id).all() if inc_ids else []
+    if not incs:
+        flash('Nenhuma INC selecionada.', 'warning')
+        return redirect(url_for('visualizar_incs'))
+
+    job = spooler.enqueue(render_inc_labels(incs), app.config['PRINTER_IP'], app.config['PRINTER_PORT'])
+    flash(f'{len(incs)} etiquetas enviadas para a fila de impressão!', 'success')
+    return redirect(url_for('visualizar_incs', print_job=job.id))
+
+@app.route('/print_overdue_labels', methods=['POST'])
+@login_required
+def print_overdue_labels():
+    incs = [inc for inc, _ in listar_incs_vencidas()]
+    if not incs:
+        flash('Nenhuma INC vencida para imprimir.', 'warning')
+        return redirect(url_for('expiracao_inc'))
+
+    job = spooler.enqueue(render_inc_labels(incs), app.config['PRINTER_IP'], app.config['PRINTER_PORT'])
+    flash(f'{len(incs)} etiquetas enviadas para a fila de impressão!', 'success')
+    return redirect(url_for('expiracao_inc', print_job=job.id))
+
+@app.route('/print_job_status/<int:job_id>')
+@login_required
+def print_job_status(job_id):
+    spooler.resume()
+    job = PrintJob.query.get_or_404(job_id)
+    return jsonify(job_status(job))
+
+class _CSVBuffer:
+    """Destino do csv.writer que apenas devolve a linha formatada"""
+    def write(self, value):
+        return value
 
 @app.route('/export_csv')
 @login_required
 def export_csv():
-    incs = INC.query.all()
-    output = BytesIO()
-    writer = csv.writer(output)
-    writer.writerow(['nf', 'data', 'representante', 'fornecedor', 'item', 'quantidade_recebida', 
-                     'quantidade_com_defeito', 'descricao_defeito', 'urgencia', 'acao_recomendada', 
-                     'status', 'oc'])
-    for inc in incs:
-        writer.writerow([inc.nf, inc.data, inc.representante, inc.fornecedor, inc.item, 
-                         inc.quantidade_recebida, inc.quantidade_com_defeito, inc.descricao_defeito, 
-                         inc.urgencia, inc.acao_recomendada, inc.status, inc.oc])
+    def generate():
+        writer = csv.writer(_CSVBuffer())
+        yield writer.writerow(['nf', 'data', 'representante', 'fornecedor', 'item', 'quantidade_recebida', 
+                               'quantidade_com_defeito', 'descricao_defeito', 'urgencia', 'acao_recomendada', 
+                               'status', 'oc'])
+        # Gera o CSV em blocos, sem carregar todas as INCs na memória
+        rows = []
+        for inc in INC.query.order_by(INC.id).yield_per(1000):
+            rows.append(writer.writerow([inc.nf, inc.data, inc.representante, inc.fornecedor, inc.item, 
+                                         inc.quantidade_recebida, inc.quantidade_com_defeito, inc.descricao_defeito, 
+                                         inc.urgencia, inc.acao_recomendada, inc.status, inc.oc]))
+            if len(rows) >= 1000:
+                yield ''.join(rows)
+                rows = []
+        if rows:
+            yield ''.join(rows)
+
+    return Response(stream_with_context(generate()), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=incs.csv'})
+
+@app.route('/export_xlsx', methods=['GET', 'POST'])
+@login_required
+def export_xlsx():
+    # POST: INCs selecionadas na listagem; GET: mesmos filtros de visualizar_incs
+    if request.method == 'POST':
+        inc_ids = request.form.getlist('inc_ids', type=int)
+        if not inc_ids:
+            flash('Nenhuma INC selecionada.', 'warning')
+            return redirect(url_for('visualizar_incs'))
+        query = INC.query.filter(INC.id.in_(inc_ids))
+        por_fornecedor = request.form.get('por_fornecedor') == '1'
+    else:
+        query = filtrar_incs(request.args)
+        por_fornecedor = request.args.get('por_fornecedor') == '1'
+
+    # A planilha é montada em arquivo temporário e enviada em blocos, sem ficar inteira na memória
+    output = tempfile.TemporaryFile()
+    escrever_incs_xlsx(query, output, por_fornecedor=por_fornecedor,
+                       lote=app.config.get('XLSX_EXPORT_CHUNK_SIZE', 1000))
     output.seek(0)
-    return send_file(output, mimetype='text/csv', as_attachment=True, download_name='incs.csv')
+    return send_file(output, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                     as_attachment=True, download_name=f"incs_{datetime.today().strftime('%d-%m-%Y')}.xlsx")
 
 @app.route('/export_pdf/<int:inc_id>')
 @login_required
 def export_pdf(inc_id):
     inc = INC.query.get_or_404(inc_id)
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    y = height - 50
-    c.setFont("Helvetica", 12)
-    c.drawString(50, y, f"INC #{inc.oc}")
-    y -= 20
-    
-    details = [
-        f"NF-e: {inc.nf}", f"Data: {inc.data}", f"Representante: {inc.representante}",
-        f"Fornecedor: {inc.fornecedor}", f"Item: {inc.item}", f"Qtd. Recebida: {inc.quantidade_recebida}",
-        f"Qtd. com Defeito: {inc.quantidade_com_defeito}", f"Descrição do Defeito: {inc.descricao_defeito}",
-        f"Urgência: {inc.urgencia}", f"Ação Recomendada: {inc.acao_recomendada}", f"Status: {inc.status}"
-    ]
-    
-    for line in details:
-        c.drawString(50, y, line)
-        y -= 20
-        
-    fotos = json.loads(inc.fotos)
-    if fotos:
-        c.showPage()
-        x, y = 50, height - 220
-        for foto in fotos:
-            full_path = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(foto))
-            if os.path.exists(full_path):
-                c.drawImage(full_path, x, y, width=200, height=200, preserveAspectRatio=True)
-                x += 220
-                if x > width - 200:
-                    x = 50
-                    y -= 220
-                    if y < 50:
-                        c.showPage()
-                        y = height - 220
-    c.save()
-    buffer.seek(0)
+    buffer = BytesIO(render_incs_pdf([inc_to_dict(inc)], app.config['UPLOAD_FOLDER']))
     return send_file(buffer, mimetype='application/pdf', as_attachment=True, download_name=f'inc_{inc.nf}.pdf')
 
+@app.route('/export_pdf_lote', methods=['GET', 'POST'])
+@login_required
+def export_pdf_lote():
+    # POST: INCs selecionadas na listagem; GET: mesmos filtros de visualizar_incs
+    if request.method == 'POST':
+        inc_ids = request.form.getlist('inc_ids', type=int)
+        query = INC.query.filter(INC.id.in_(inc_ids)) if inc_ids else None
+    else:
+        query = filtrar_incs(request.args)
+
+    incs = [inc_to_dict(inc) for inc in query.order_by(INC.id).all()] if query is not None else []
+    if not incs:
+        flash('Nenhuma INC para exportar.', 'warning')
+        return redirect(url_for('visualizar_incs'))
+
+    # O PDF é montado em arquivo temporário e enviado em blocos, sem ficar inteiro na memória
+    output = tempfile.TemporaryFile()
+    build_consolidated_pdf(incs, app.config['UPLOAD_FOLDER'], output,
+                           workers=app.config.get('PDF_EXPORT_WORKERS'),
+                           chunk_size=app.config.get('PDF_EXPORT_CHUNK_SIZE', 20))
+    return send_file(output, mimetype='application/pdf', as_attachment=True,
+                     download_name=f"incs_{datetime.today().strftime('%d-%m-%Y')}.pdf")
+
 @app.route('/monitorar_fornecedores', methods=['GET', 'POST'])
 @login_required
 def monitorar_fornecedores():
-    fornecedores = Fornecedor.query.all()
     incs = []
     graph_url = None  # Inicializar graph_url como None
 
@@ -669,7 +929,138 @@ def monitorar_fornecedores():
             graph_url = 'data:image/png;base64,' + base64.b64encode(img.getvalue()).decode()
             plt.close()
 
-    return render_template('monitorar_fornecedores.html', fornecedores=fornecedores, incs=incs, graph_url=graph_url)
+    return render_template('monitorar_fornecedores.html', incs=incs, graph_url=graph_url)
+
+@app.route('/pareto')
+@login_required
+def pareto():
+    # Período padrão: últimos 12 meses
+    hoje = datetime.today()
+    de = parse_date(request.args.get('de')) or hoje - timedelta(days=365)
+    ate = parse_date(request.args.get('ate')) or hoje
+    metrica = request.args.get('metrica', 'incs')
+    if metrica not in METRICAS_PARETO:
+        metrica = 'incs'
+    limite = min(max(request.args.get('limite', 20, type=int) or 20, 1), 500)
+    periodo = {'de': de.strftime('%Y-%m-%d'), 'ate': ate.strftime('%Y-%m-%d')}
+    rankings = {dimensao: pareto_cache.get(dimensao, periodo['de'], periodo['ate'], metrica)
+                for dimensao in DIMENSOES_PARETO}
+    return render_template('pareto.html', rankings=rankings, periodo=periodo, metrica=metrica, limite=limite)
+
+@app.route('/ppm_fornecedores', methods=['GET', 'POST'])
+@login_required
+def ppm_fornecedores():
+    if request.method == 'POST':
+        if not current_user.is_admin:
+            flash('Acesso negado.')
+            return redirect(url_for('ppm_fornecedores'))
+        total = reconstruir_ppm()
+        flash(f'PPM recalculado: {total} pares fornecedor/mês.')
+        return redirect(url_for('ppm_fornecedores'))
+
+    # Período em meses (input type="month"); padrão: últimos 12 meses
+    hoje = datetime.today()
+    try:
+        inicio = datetime.strptime(request.args.get('de') or f"{hoje.year - 1:04d}-{hoje.month:02d}", '%Y-%m')
+        final = datetime.strptime(request.args.get('ate') or hoje.strftime('%Y-%m'), '%Y-%m')
+    except ValueError:
+        inicio = final = None
+    if inicio is None or inicio > final:
+        flash('Período inválido.')
+        return redirect(url_for('ppm_fornecedores'))
+    # Reformatado: strptime também aceita mês sem zero à esquerda (2025-3)
+    de, ate = f"{inicio.year:04d}-{inicio.month:02d}", f"{final.year:04d}-{final.month:02d}"
+    fornecedor = request.args.get('fornecedor', '').strip()
+    limite = min(max(request.args.get('limite', 10, type=int) or 10, 1), 50)
+    serie = serie_ppm(de, ate, [fornecedor] if fornecedor else None, limite)
+
+    graph_url = None
+    if any(valor is not None for f in serie['fornecedores'] for valor in f['meses']):
+        posicoes = range(len(serie['meses']))
+        plt.figure(figsize=(10, 6))
+        for f in serie['fornecedores']:
+            linha, = plt.plot(posicoes, [v if v is not None else float('nan') for v in f['meses']],
+                              marker='o', label=f['fornecedor'][:30])
+            if f['tendencia']:
+                inclinacao, intercepto = f['tendencia']
+                plt.plot(posicoes, [intercepto + inclinacao * x for x in posicoes], linestyle='--',
+                         color=linha.get_color(), alpha=0.6)
+        plt.xticks(posicoes, serie['meses'], rotation=45)
+        plt.xlabel('Mês')
+        plt.ylabel('PPM')
+        plt.title('PPM de Defeitos por Fornecedor (tracejado: tendência)')
+        plt.legend(fontsize='small')
+        plt.tight_layout()
+        img = BytesIO()
+        plt.savefig(img, format='png')
+        graph_url = 'data:image/png;base64,' + base64.b64encode(img.getvalue()).decode()
+        plt.close()
+
+    # Período das INCs para o link de cada fornecedor (até o último dia do mês final)
+    ultimo_dia = calendar.monthrange(final.year, final.month)[1]
+    periodo_incs = {'de': f"{de}-01", 'ate': f"{ate}-{ultimo_dia:02d}"}
+    return render_template('ppm_fornecedores.html', serie=serie, de=de, ate=ate, fornecedor=fornecedor,
+                           limite=limite, graph_url=graph_url, periodo_incs=periodo_incs)
+
+@app.cli.command('reconstruir-ppm')
+def reconstruir_ppm_command():
+    """Recalcula o PPM por fornecedor e mês a partir das rotinas salvas e das INCs"""
+    click.echo(f"{reconstruir_ppm()} pares fornecedor/mês recalculados")
+
+@app.route('/analise_incs', methods=['GET', 'POST'])
+@login_required
+def analise_incs():
+    if request.method == 'POST':
+        if not current_user.is_admin:
+            flash('Acesso negado.')
+            return redirect(url_for('analise_incs'))
+        inc_snapshot.invalidate()
+        flash(f'Snapshot recarregado: {len(inc_snapshot.refresh())} INCs.')
+        return redirect(url_for('analise_incs'))
+
+    # Período padrão: últimos 12 meses
+    hoje = datetime.today()
+    de = parse_date(request.args.get('de')) or hoje - timedelta(days=365)
+    ate = parse_date(request.args.get('ate')) or hoje
+    filtros = {'de': de.strftime('%Y-%m-%d'), 'ate': ate.strftime('%Y-%m-%d')}
+    filtros.update((campo, request.args.get(campo, '').strip()) for campo in CATEGORIAS_ANALISE)
+    por = request.args.get('por', 'fornecedor')
+    if por not in DIMENSOES_ANALISE:
+        por = 'fornecedor'
+    ordem = request.args.get('ordem') or ('valor' if por == 'mes' else 'incs')
+    if ordem not in ORDENS_ANALISE:
+        ordem = 'incs'
+    campo = request.args.get('campo', 'quantidade_com_defeito')
+    if campo not in CAMPOS_ANALISE:
+        campo = 'quantidade_com_defeito'
+    limite = min(max(request.args.get('limite', 20, type=int) or 20, 1), 500)
+
+    resumo = inc_snapshot.resumo(filtros)
+    grupos = inc_snapshot.agrupar(por, filtros, ordem, limite)
+    percentis = inc_snapshot.percentis(campo, filtros, por=por, limite=limite)
+    histograma = inc_snapshot.histograma(campo, filtros)
+
+    graph_url = None
+    if histograma['contagens']:
+        limites = histograma['limites']
+        plt.figure(figsize=(10, 4))
+        plt.bar(limites[:-1], histograma['contagens'], width=[b - a for a, b in zip(limites, limites[1:])],
+                align='edge', edgecolor='white')
+        plt.xlabel(campo.replace('_', ' ').capitalize() + (' (%)' if campo == 'taxa_defeito' else ''))
+        plt.ylabel('Quantidade de INCs')
+        plt.title('Distribuição')
+        plt.tight_layout()
+        img = BytesIO()
+        plt.savefig(img, format='png')
+        graph_url = 'data:image/png;base64,' + base64.b64encode(img.getvalue()).decode()
+        plt.close()
+
+    # Filtros que a lista de INCs entende, para os links de cada grupo
+    filtros_incs = {chave: valor for chave, valor in filtros.items() if valor and chave in FILTROS_INC}
+    return render_template('analise_incs.html', filtros=filtros, por=por, ordem=ordem, campo=campo, limite=limite,
+                           resumo=resumo, grupos=grupos, percentis=percentis, graph_url=graph_url,
+                           filtros_incs=filtros_incs, representantes=REPRESENTANTES, urgencias=URGENCIAS,
+                           status_opcoes=STATUS)
 
 @app.route('/export_monitor_pdf', methods=['GET'])
 @login_required
@@ -753,6 +1144,52 @@ def export_monitor_pdf():
         if os.path.exists(temp_path):
             os.remove(temp_path)
 
+# =====================================
+# ROTAS DE ITENS
+# =====================================
+
+ORDENS_ITENS = {
+    'incs': (Item.total_incs.desc(), Item.qtd_defeito.desc()),
+    'defeito': (Item.qtd_defeito.desc(), Item.total_incs.desc()),
+    'recebida': (Item.qtd_recebida.desc(),),
+    'adiado': (Item.vezes_adiado.desc(),),
+    'codigo': (),
+}
+
+@app.route('/itens', methods=['GET', 'POST'])
+@login_required
+def itens():
+    if request.method == 'POST':
+        if not current_user.is_admin:
+            flash('Acesso negado.')
+            return redirect(url_for('itens'))
+        total = reconstruir_itens()
+        flash(f'Estatísticas de {total} itens recalculadas.')
+        return redirect(url_for('itens'))
+
+    # Contadores já calculados na tabela de itens; nada de varrer INCs ou rotinas
+    termo = request.args.get('q', '').strip()
+    ordem = request.args.get('ordem', 'incs')
+    query = Item.query
+    if termo:
+        query = query.filter(db.or_(Item.codigo.like(f'{termo.upper()}%'), Item.descricao.ilike(f'%{termo}%')))
+    query = query.order_by(*ORDENS_ITENS.get(ordem, ORDENS_ITENS['incs']), Item.codigo)
+    pagination = query.paginate(page=request.args.get('page', 1, type=int),
+                                per_page=app.config.get('ITEMS_PER_PAGE', 10), error_out=False)
+    return render_template('itens.html', itens=pagination.items, pagination=pagination, termo=termo, ordem=ordem)
+
+@app.route('/itens/<codigo>')
+@login_required
+def detalhes_item(codigo):
+    item = Item.query.filter_by(codigo=codigo.upper()).first_or_404()
+    incs = INC.query.filter_by(item=item.codigo).order_by(INC.id.desc()).limit(20).all()
+    return render_template('detalhes_item.html', item=item, incs=incs)
+
+@app.cli.command('reconstruir-itens')
+def reconstruir_itens_command():
+    """Recalcula as estatísticas de itens a partir das INCs e das rotinas salvas"""
+    click.echo(f"{reconstruir_itens()} itens recalculados")
+
 # =====================================
 # ROTAS DE FORNECEDORES
 # =====================================
@@ -770,15 +1207,37 @@ def gerenciar_fornecedores():
         fornecedor = Fornecedor.query.get_or_404(fornecedor_id) if fornecedor_id else None
 
         if action == 'delete':
+            # O SQLite roda sem PRAGMA foreign_keys: o ON DELETE CASCADE dos aliases é feito aqui
+            db.session.execute(delete(FornecedorAlias).where(FornecedorAlias.fornecedor_id == fornecedor.id))
             db.session.delete(fornecedor)
             db.session.commit()
+            supplier_directory.invalidate()
+            supplier_matcher.invalidate()
             flash('Fornecedor excluído com sucesso!')
         elif action == 'update':
-            fornecedor.razao_social = request.form['razao_social']
-            fornecedor.cnpj = request.form['cnpj']
-            fornecedor.fornecedor_logix = request.form['fornecedor_logix']
-            db.session.commit()
-            flash('Fornecedor atualizado com sucesso!!')
+            cnpj = somente_digitos(request.form['cnpj'])
+            if len(cnpj) not in (11, 14):
+                flash('CNPJ inválido.')
+            elif Fornecedor.query.filter(cnpj_digitos(Fornecedor.cnpj) == cnpj, Fornecedor.id != fornecedor.id).first():
+                flash('CNPJ já cadastrado.')
+            else:
+                begin_write(db.session)
+                antigo = fornecedor.razao_social
+                fornecedor.razao_social = request.form['razao_social'].strip()
+                fornecedor.cnpj = cnpj
+                fornecedor.fornecedor_logix = request.form['fornecedor_logix']
+                try:
+                    # INCs, PPM e aliases acompanham o novo nome, como na importação do Logix
+                    if fornecedor.razao_social != antigo:
+                        aplicar_renomeacoes([(fornecedor.id, antigo, fornecedor.razao_social)])
+                    db.session.commit()
+                except IntegrityError:
+                    # Outro cadastro com o mesmo CNPJ gravado entre a verificação e o commit
+                    db.session.rollback()
+                    flash('CNPJ já cadastrado.')
+                else:
+                    supplier_directory.invalidate()
+                    flash('Fornecedor atualizado com sucesso!!')
 
     fornecedores = Fornecedor.query.all()
     return render_template('gerenciar_fornecedores.html', fornecedores=fornecedores)
@@ -792,11 +1251,14 @@ def cadastrar_fornecedor():
 
     if request.method == 'POST':
         razao_social = request.form['razao_social']
-        cnpj = request.form['cnpj']
+        cnpj = somente_digitos(request.form['cnpj'])
         fornecedor_logix = request.form['fornecedor_logix']
 
-        # Validação do CNPJ
-        if Fornecedor.query.filter_by(cnpj=cnpj).first():
+        # Validação do CNPJ (gravado só com dígitos; compara com os antigos já formatados)
+        if len(cnpj) not in (11, 14):
+            flash('CNPJ inválido.')
+            return render_template('cadastrar_fornecedor.html')
+        if Fornecedor.query.filter(cnpj_digitos(Fornecedor.cnpj) == cnpj).first():
             flash('CNPJ já cadastrado.')
             return render_template('cadastrar_fornecedor.html')
 
@@ -807,11 +1269,114 @@ def cadastrar_fornecedor():
         )
         db.session.add(fornecedor)
         db.session.commit()
+        supplier_directory.invalidate()
         flash('Fornecedor cadastrado com sucesso!')
         return redirect(url_for('gerenciar_fornecedores'))
 
     return render_template('cadastrar_fornecedor.html')
 
+@app.route('/importar_fornecedores', methods=['GET', 'POST'])
+@login_required
+def importar_fornecedores_view():
+    if not current_user.is_admin:
+        flash('Acesso negado.')
+        return redirect(url_for('main_menu'))
+
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if not file or not file.filename:
+            flash('Selecione a exportação de fornecedores do Logix.')
+            return redirect(url_for('importar_fornecedores_view'))
+
+        nome_relatorio = f"fornecedores_{uuid.uuid4().hex}.csv"
+        caminho_relatorio = os.path.join(pasta_relatorios_importacao(), nome_relatorio)
+        try:
+            with open(caminho_relatorio, 'w', newline='', encoding='utf-8-sig') as relatorio:
+                resultado = importar_fornecedores(file.stream, file.filename, relatorio,
+                                                  batch_size=app.config.get('SUPPLIER_IMPORT_BATCH_SIZE', 2000),
+                                                  formato=request.form.get('formato') or None,
+                                                  layout=app.config['SUPPLIER_FIXED_WIDTH_LAYOUT'])
+        except ValueError as e:
+            db.session.rollback()
+            os.remove(caminho_relatorio)
+            flash(f'Erro ao importar: {e}', 'danger')
+            return redirect(url_for('importar_fornecedores_view'))
+
+        logging.info(f"Importação de fornecedores por {current_user.username}: {resultado['inseridos']} inseridos, "
+                     f"{resultado['atualizados']} atualizados, {resultado['conflitos']} conflitos, "
+                     f"{resultado['erros']} com erro")
+        return render_template('importar_fornecedores.html', resultado=resultado, relatorio=nome_relatorio,
+                               formatos=FORMATOS_FORNECEDORES)
+
+    return render_template('importar_fornecedores.html', resultado=None, relatorio=None,
+                           formatos=FORMATOS_FORNECEDORES)
+
+@app.cli.command('importar-fornecedores')
+@click.argument('arquivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--relatorio', default='diferencas_fornecedores.csv', help='CSV com inserções, alterações e conflitos')
+@click.option('--lote', default=2000, help='Fornecedores por transação')
+@click.option('--formato', type=click.Choice(FORMATOS_FORNECEDORES), default=None,
+              help='Padrão: csv para .csv, largura fixa para os demais')
+def importar_fornecedores_command(arquivo, relatorio, lote, formato):
+    """Sincroniza o cadastro de fornecedores com uma exportação do Logix"""
+    with open(arquivo, 'rb') as stream, open(relatorio, 'w', newline='', encoding='utf-8-sig') as saida:
+        resultado = importar_fornecedores(stream, arquivo, saida, batch_size=lote, formato=formato,
+                                          layout=app.config['SUPPLIER_FIXED_WIDTH_LAYOUT'])
+    click.echo(f"{resultado['inseridos']} inseridos, {resultado['atualizados']} atualizados, "
+               f"{resultado['inalterados']} inalterados, {resultado['conflitos']} conflitos, "
+               f"{resultado['erros']} com erro")
+    click.echo(f"Diferenças em {relatorio}")
+
+@app.route('/aliases_fornecedores', methods=['GET', 'POST'])
+@login_required
+def aliases_fornecedores():
+    if not current_user.is_admin:
+        flash('Acesso negado.')
+        return redirect(url_for('main_menu'))
+
+    if request.method == 'POST':
+        alias = FornecedorAlias.query.get_or_404(request.form.get('alias_id', type=int))
+        action = request.form.get('action')
+        if action == 'confirmar':
+            razao_social = request.form.get('razao_social', '').strip()
+            if razao_social:
+                fornecedor = Fornecedor.query.filter_by(razao_social=razao_social).first()
+                if fornecedor is None:
+                    flash('Fornecedor não cadastrado.')
+                    return redirect(url_for('aliases_fornecedores'))
+                alias.fornecedor_id = fornecedor.id
+                alias.metodo = 'manual'
+            alias.confirmado = True
+            alias.confirmado_por_id = current_user.id
+            flash(f'Vínculo de "{alias.nome_original}" confirmado.')
+        elif action == 'rejeitar':
+            # Nome conhecido que não corresponde a nenhum fornecedor
+            alias.fornecedor_id = None
+            alias.confirmado = True
+            alias.confirmado_por_id = current_user.id
+            flash(f'"{alias.nome_original}" marcado como sem fornecedor.')
+        elif action == 'excluir':
+            db.session.delete(alias)
+            flash('Alias excluído; o nome será comparado de novo na próxima importação.')
+        db.session.commit()
+        supplier_matcher.invalidate()
+        return redirect(url_for('aliases_fornecedores'))
+
+    pendentes = FornecedorAlias.query.filter_by(confirmado=False) \
+        .order_by(FornecedorAlias.fornecedor_id.is_(None), FornecedorAlias.score.desc()).all()
+    confirmados = FornecedorAlias.query.filter_by(confirmado=True) \
+        .order_by(FornecedorAlias.nome_original).all()
+    return render_template('aliases_fornecedores.html', pendentes=pendentes, confirmados=confirmados)
+
+@app.route('/fornecedores/autocomplete')
+@login_required
+def autocomplete_fornecedores():
+    # Busca por prefixo da razão social, CNPJ ou código Logix no diretório em memória
+    limite = min(request.args.get('limit', app.config['SUPPLIER_AUTOCOMPLETE_LIMIT'], type=int) or 1, 50)
+    response = jsonify(supplier_directory.search(request.args.get('q', ''), limite))
+    response.headers['Cache-Control'] = 'private, max-age=60'
+    return response
+
 # =====================================
 # ROTAS DE INSPEÇÃO
 # =====================================
@@ -871,12 +1436,18 @@ def rotina_inspecao():
             registros = ler_arquivo_lst(filepath)
             
             if registros:
-                # Armazenar os registros analisados na sessão
-                session['inspecao_registros'] = registros
+                # Todos os fornecedores do arquivo são resolvidos de uma vez
+                vinculos = vincular_fornecedores(registros)
+                # Os registros ficam no banco, compartilhados com os outros inspetores
+                rotina = create_shared_routine(registros, current_user.id)
+                session['rotina_compartilhada_id'] = rotina.id
                 # Armazenar o token CRM atual com os registros
                 session['inspecao_crm_token'] = session['crm_token']
                 flash(f'Foram importados {len(registros)} registros.')
-                return redirect(url_for('visualizar_registros_inspecao'))
+                if vinculos['sem_correspondencia'] or vinculos['aproximado']:
+                    flash(f"{vinculos['sem_correspondencia']} registros com fornecedor não encontrado no cadastro e "
+                          f"{vinculos['aproximado']} vinculados por semelhança (revise em Aliases de Fornecedores).")
+                return redirect(url_for('visualizar_registros_inspecao', rotina=rotina.id))
             else:
                 flash('Nenhum registro válido foi importado.')
                 return redirect(request.url)
@@ -889,51 +1460,108 @@ def rotina_inspecao():
             if os.path.exists(filepath):
                 os.remove(filepath)
     
-    return render_template('rotina_inspecao.html')
+    rotinas_abertas = RotinaCompartilhada.query.filter_by(status='aberta') \
+        .order_by(RotinaCompartilhada.criada_em.desc()).all()
+    return render_template('rotina_inspecao.html', rotinas_abertas=rotinas_abertas)
+
+def rotina_atual():
+    """Rotina compartilhada em uso: a da URL (?rotina=) ou a última aberta pelo usuário"""
+    rotina_id = request.args.get('rotina', type=int) or session.get('rotina_compartilhada_id')
+    rotina = db.session.get(RotinaCompartilhada, rotina_id) if rotina_id else None
+    if rotina is not None:
+        session['rotina_compartilhada_id'] = rotina.id
+        # Quem entra numa rotina aberta por outro inspetor usa o próprio token do CRM
+        if 'inspecao_crm_token' not in session and 'crm_token' in session:
+            session['inspecao_crm_token'] = session['crm_token']
+    return rotina
 
 @app.route('/visualizar_registros_inspecao', methods=['GET', 'POST'])
 @login_required
 def visualizar_registros_inspecao():
-    registros = session.get('inspecao_registros', [])
-    
-    if not registros:
+    rotina = rotina_atual()
+
+    if rotina is None or rotina.status != 'aberta':
+        session.pop('rotina_compartilhada_id', None)
         flash('Nenhum registro para inspeção.')
         return redirect(url_for('rotina_inspecao'))
     
     scroll_position = None
     if request.method == 'POST':
+        # Envio sem JavaScript; com JavaScript a tela usa atualizar_registro_rotina
         action = request.form.get('action')
-        item_index = int(request.form.get('item_index'))
-        ar = int(request.form.get('ar'))
         scroll_position = request.form.get('scroll_position')
-        
-        registros_no_grupo = [r for r in registros if r['num_aviso'] == ar]
-        
-        if 0 <= item_index < len(registros_no_grupo):
-            registro_global_index = registros.index(registros_no_grupo[item_index])
-            if action == 'inspecionar':
-                registros[registro_global_index]['inspecionado'] = True
-                registros[registro_global_index]['adiado'] = False
-            elif action == 'adiar':
-                registros[registro_global_index]['inspecionado'] = False
-                registros[registro_global_index]['adiado'] = True
-            session['inspecao_registros'] = registros
+        if action in ACOES:
+            try:
+                update_record(rotina.id, request.form.get('registro_id', type=int), action,
+                              request.form.get('versao', type=int), current_user.id)
+            except VersionConflict:
+                flash('O registro foi alterado por outro inspetor. Confira o status atual.', 'warning')
+            except RoutineClosed:
+                flash('A rotina já foi salva.', 'warning')
+                return redirect(url_for('rotina_inspecao'))
+        return redirect(url_for('visualizar_registros_inspecao', rotina=rotina.id, scroll_position=scroll_position))
     
     # Agrupar registros por AR
     grupos_ar = {}
-    for registro in registros:
-        ar = registro['num_aviso']
-        if ar not in grupos_ar:
-            grupos_ar[ar] = []
-        grupos_ar[ar].append(registro)
+    for registro in routine_records(rotina.id):
+        grupos_ar.setdefault(registro.num_aviso, []).append(registro)
     
     grupos_ar_ordenados = sorted(grupos_ar.items(), key=lambda x: x[0])
     
-    # Passar scroll_position como parâmetro na URL
-    if scroll_position:
-        return redirect(url_for('visualizar_registros_inspecao', scroll_position=scroll_position))
-    
-    return render_template('visualizar_registros_inspecao.html', grupos_ar=grupos_ar_ordenados)
+    return render_template('visualizar_registros_inspecao.html', grupos_ar=grupos_ar_ordenados, rotina=rotina)
+
+@app.route('/rotinas_compartilhadas/<int:rotina_id>/registros/<int:registro_id>', methods=['POST'])
+@login_required
+def atualizar_registro_rotina(rotina_id, registro_id):
+    dados = request.get_json(silent=True) or {}
+    if dados.get('action') not in ACOES or not isinstance(dados.get('versao'), int):
+        return jsonify({'erro': 'Ação ou versão inválida.'}), 400
+    try:
+        registro = update_record(rotina_id, registro_id, dados['action'], dados['versao'], current_user.id)
+    except VersionConflict as e:
+        return jsonify({'erro': 'O registro foi alterado por outro inspetor.', 'registro': e.registro}), 409
+    except RoutineClosed:
+        return jsonify({'erro': 'A rotina já foi salva.'}), 409
+    return jsonify({'registro': registro})
+
+@app.route('/rotinas_compartilhadas/<int:rotina_id>/sync', methods=['POST'])
+@login_required
+def sincronizar_rotina(rotina_id):
+    """Recebe em lote as ações feitas offline; reenviar o mesmo lote não duplica nada"""
+    dados = request.get_json(silent=True) or {}
+    acoes = dados.get('acoes')
+    if not isinstance(acoes, list) or not all(isinstance(a, dict) for a in acoes):
+        return jsonify({'erro': 'Lote inválido.'}), 400
+    if len(acoes) > app.config.get('OFFLINE_SYNC_MAX_BATCH', 500):
+        return jsonify({'erro': 'Lote grande demais.'}), 413
+    try:
+        resultados = sync_actions(rotina_id, acoes, current_user.id)
+    except RoutineClosed:
+        return jsonify({'erro': 'A rotina já foi salva.', 'rotina_salva': True}), 409
+    return jsonify({'resultados': resultados})
+
+@app.route('/sw.js')
+def service_worker():
+    # Servido na raiz para que o escopo cubra a tela de inspeção
+    static_files = ['js/script.js', 'css/style.css']
+    versao = '-'.join(file_fingerprint(os.path.join(app.static_folder, f)) for f in static_files)
+    response = make_response(render_template('sw.js', static_files=static_files, versao=versao))
+    response.mimetype = 'application/javascript'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/rotinas_compartilhadas/<int:rotina_id>/eventos')
+@login_required
+def eventos_rotina(rotina_id):
+    # Last-Event-ID é enviado pelo navegador ao reconectar
+    desde = request.headers.get('Last-Event-ID', type=int)
+    if desde is None:
+        desde = request.args.get('desde', 0, type=int)
+    eventos = routine_events(rotina_id, desde,
+                             poll_interval=app.config.get('SHARED_ROUTINE_POLL_SECONDS', 5),
+                             max_duration=app.config.get('SHARED_ROUTINE_STREAM_SECONDS', 600))
+    return Response(stream_with_context(eventos), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/listar_rotinas_inspecao')
 @login_required
@@ -947,31 +1575,185 @@ def listar_rotinas_inspecao():
 @app.route('/salvar_rotina_inspecao', methods=['POST'])
 @login_required
 def salvar_rotina_inspecao():
-    registros = session.get('inspecao_registros', [])
+    rotina_id = request.form.get('rotina_id', type=int) or session.get('rotina_compartilhada_id')
     
-    if not registros:
+    if not rotina_id:
         flash('Nenhum registro para salvar.')
         return redirect(url_for('rotina_inspecao'))
     
-    # Verificar se todos os registros foram processados
-    for registro in registros:
-        inspecionado = registro.get('inspecionado', False)
-        adiado = registro.get('adiado', False)
-        if not inspecionado and not adiado:
-            flash('Todos os registros devem ser inspecionados ou adiados antes de salvar a rotina.', 'danger')
-            return redirect(url_for('visualizar_registros_inspecao'))
+    try:
+        rotina = save_routine(rotina_id, current_user.id)
+    except RoutineClosed:
+        session.pop('rotina_compartilhada_id', None)
+        flash('Esta rotina já foi salva por outro inspetor.', 'warning')
+        return redirect(url_for('main_menu'))
     
-    rotina = RotinaInspecao(
-        inspetor_id=current_user.id,
-        registros=json.dumps(registros)
-    )
-    db.session.add(rotina)
-    db.session.commit()
+    # Verificar se todos os registros foram processados
+    if rotina is None:
+        flash('Todos os registros devem ser inspecionados ou adiados antes de salvar a rotina.', 'danger')
+        return redirect(url_for('visualizar_registros_inspecao', rotina=rotina_id))
     
     flash('Rotina de inspeção salva com sucesso!', 'success')
-    session.pop('inspecao_registros', None)
+    session.pop('rotina_compartilhada_id', None)
     return redirect(url_for('main_menu'))
 
+# =====================================
+# API JSON (v1)
+# =====================================
+
+def api_date(name):
+    """Lê um parâmetro de data ISO (AAAA-MM-DD) da query string da API"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        api_error(400, f"{name} deve estar no formato AAAA-MM-DD.")
+
+def api_query_incs():
+    """Consulta de INCs com os filtros da API (os de visualizar_incs + urgencia, desde, ate)"""
+    try:
+        query = filtrar_incs(request.args)
+    except ValueError:
+        api_error(400, 'nf deve ser numérico.')
+    if request.args.get('urgencia'):
+        query = query.filter(INC.urgencia == request.args['urgencia'])
+    desde, ate = api_date('desde'), api_date('ate')
+    if desde:
+        query = query.filter(INC.created_at >= desde)
+    if ate:
+        query = query.filter(INC.created_at < ate + timedelta(days=1))
+    return query
+
+def api_query_fornecedores():
+    query = Fornecedor.query
+    if request.args.get('razao_social'):
+        query = query.filter(Fornecedor.razao_social.ilike(f"%{request.args['razao_social']}%"))
+    if request.args.get('cnpj'):
+        query = query.filter(Fornecedor.cnpj == request.args['cnpj'])
+    if request.args.get('fornecedor_logix'):
+        query = query.filter(Fornecedor.fornecedor_logix == request.args['fornecedor_logix'])
+    return query
+
+def api_query_rotinas():
+    query = RotinaInspecao.query
+    inspetor_id = request.args.get('inspetor_id', type=int)
+    if inspetor_id:
+        query = query.filter(RotinaInspecao.inspetor_id == inspetor_id)
+    desde, ate = api_date('desde'), api_date('ate')
+    if desde:
+        query = query.filter(RotinaInspecao.data_inspecao >= desde)
+    if ate:
+        query = query.filter(RotinaInspecao.data_inspecao < ate + timedelta(days=1))
+    return query
+
+@app.route('/api/v1/incs')
+@api_token_required
+def api_incs():
+    fields = parse_fields(INC)
+    query = api_query_incs()
+    return conditional_json(keyset_page(query, INC, fields, {'fotos': parse_json_text}))
+
+@app.route('/api/v1/fornecedores')
+@api_token_required
+def api_fornecedores():
+    fields = parse_fields(Fornecedor)
+    return conditional_json(keyset_page(api_query_fornecedores(), Fornecedor, fields))
+
+@app.route('/api/v1/rotinas')
+@api_token_required
+def api_rotinas():
+    # registros pode ser grande; só vem quando pedido em fields
+    fields = parse_fields(RotinaInspecao, default=['id', 'inspetor_id', 'data_inspecao'])
+    return conditional_json(keyset_page(api_query_rotinas(), RotinaInspecao, fields, {'registros': parse_json_text}))
+
+@app.route('/api/v1/export/<entidade>.<formato>')
+@api_token_required
+def api_export(entidade, formato):
+    """Exportação colunar completa (Parquet ou Arrow IPC stream), com os filtros das listagens da API.
+
+    entidade: incs, fornecedores ou inspecoes (um registro por item das rotinas salvas).
+    """
+    if entidade not in ENTIDADES_COLUNARES or formato not in FORMATOS_COLUNARES:
+        api_error(404, 'Exportação inexistente; use /api/v1/export/<incs|fornecedores|inspecoes>.<parquet|arrow>.')
+    if not exportacao_colunar_disponivel():
+        api_error(501, 'Exportação colunar indisponível: o pacote pyarrow não está instalado no servidor.')
+    query = {'incs': api_query_incs, 'fornecedores': api_query_fornecedores,
+             'inspecoes': api_query_rotinas}[entidade]()
+    tamanho = app.config.get('COLUMNAR_EXPORT_BATCH_SIZE', 50000)
+    nome = f"{entidade}_{datetime.today().strftime('%Y-%m-%d')}.{formato}"
+    if formato == 'arrow':
+        # O stream IPC é enviado lote a lote
+        return Response(stream_with_context(stream_arrow(entidade, query, tamanho)),
+                        mimetype=MIMETYPES_COLUNARES['arrow'],
+                        headers={'Content-Disposition': f'attachment; filename={nome}'})
+    # O Parquet só fica válido com o rodapé: é montado em arquivo temporário e enviado em blocos
+    output = tempfile.TemporaryFile()
+    escrever_parquet(entidade, query, output, tamanho)
+    output.seek(0)
+    return send_file(output, mimetype=MIMETYPES_COLUNARES['parquet'], as_attachment=True, download_name=nome)
+
+@app.route('/api/v1/changes')
+@api_token_required
+def api_changes():
+    """Feed de alterações desde o cursor; o next_cursor deve ser guardado para a próxima sincronização"""
+    query = ChangeLog.query
+    entidade = request.args.get('entidade')
+    if entidade:
+        query = query.filter(ChangeLog.entidade == entidade)
+    fields = ['id', 'entidade', 'entidade_id', 'operacao', 'alterado_em', 'dados']
+    return json_response(keyset_page(query, ChangeLog, fields, {'dados': parse_json_text}, resume=True))
+
+@app.route('/api_tokens', methods=['GET', 'POST'])
+@login_required
+def api_tokens():
+    if not current_user.is_admin:
+        flash('Acesso negado.')
+        return redirect(url_for('main_menu'))
+
+    if request.method == 'POST':
+        action = request.form.get('action')
+        if action == 'create':
+            nome = request.form.get('nome', '').strip()
+            if not nome:
+                flash('Informe um nome para o token.')
+                return redirect(url_for('api_tokens'))
+            token, token_hash = generate_token()
+            db.session.add(ApiToken(nome=nome, token_hash=token_hash, user_id=current_user.id))
+            db.session.commit()
+            flash(f'Token "{nome}" criado. Copie agora, ele não será exibido novamente: {token}')
+        elif action == 'revoke':
+            api_token = ApiToken.query.get_or_404(request.form.get('token_id', type=int))
+            api_token.revogado = True
+            db.session.commit()
+            flash(f'Token "{api_token.nome}" revogado.')
+        return redirect(url_for('api_tokens'))
+
+    tokens = ApiToken.query.order_by(ApiToken.created_at.desc()).all()
+    return render_template('api_tokens.html', tokens=tokens)
+
+# =====================================
+# MONITORAMENTO
+# =====================================
+
+@app.route('/metrics')
+@login_required
+def metrics_endpoint():
+    if not current_user.is_admin:
+        abort(403)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/slow_queries')
+@login_required
+def slow_queries():
+    if not current_user.is_admin:
+        flash('Acesso negado.')
+        return redirect(url_for('main_menu'))
+
+    entradas = slow_query_log.recent()
+    return render_template('slow_queries.html', entradas=entradas, resumo=scan_summary(entradas))
+
 # =====================================
 # PROCESSOR E INICIALIZAÇÃO
 # =====================================
@@ -982,17 +1764,27 @@ def inject_settings():
     return dict(settings=settings, config=app.config)
 
 # Inicialização do banco de dados
-with app.app_context():
-    db.create_all()
-    # Verificar se já existe um admin antes de criar
-    if not User.query.filter_by(username="admin").first():
-        admin = User(
-            username="admin", 
-            password=generate_password_hash("admin"),
-            is_admin=True
-        )
-        db.session.add(admin)
-        db.session.commit()
+def inicializar_banco():
+    with app.app_context():
+        db.create_all()
+        ensure_print_job_columns()
+        ensure_cnpj_index()
+        ensure_item_index()
+        ensure_pareto_index()
+        # Verificar se já existe um admin antes de criar
+        if not User.query.filter_by(username="admin").first():
+            admin = User(
+                username="admin", 
+                password=password_hasher.hash("admin"),
+                is_admin=True
+            )
+            db.session.add(admin)
+            db.session.commit()
+
+# Com "python app.py", os processos do pool de PDFs (spawn) reimportam este arquivo
+# como __mp_main__; eles só renderizam PDFs e não devem tocar no banco
+if __name__ != '__mp_main__':
+    inicializar_banco()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
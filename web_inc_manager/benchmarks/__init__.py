@@ -0,0 +1 @@
+# Benchmarks de desempenho do web_inc_manager
\ No newline at end of file
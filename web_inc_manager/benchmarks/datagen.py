@@ -0,0 +1,110 @@
+"""
+Gerador de dados sintéticos para os benchmarks: fornecedores, INCs e arquivos .lst.
+"""
+import random
+from datetime import date, timedelta
+from sqlalchemy import insert
+from models import db, INC, Fornecedor
+
+REPRESENTANTES = ["Gabriel Rodrigues da Silva", "Marcos Vinicius Gomes Teixeira", "Aleksandro Carvalho Leão"]
+URGENCIAS = ["Leve", "Moderada", "Crítico"]
+STATUS = ["Em andamento", "Concluída", "Vencida"]
+PREFIXOS_ITEM = ["MPR", "MPC", "EMB", "FER", "ELE", "PLA", "QUI", "MEC"]
+PALAVRAS_RAZAO = ["Metalúrgica", "Plásticos", "Indústria", "Comércio", "Embalagens", "Química",
+                  "Usinagem", "Fundição", "Borrachas", "Eletro", "Parafusos", "Tintas"]
+SOBRENOMES = ["Silva", "Souza", "Oliveira", "Pereira", "Almeida", "Costa", "Ribeiro", "Carvalho",
+              "Gomes", "Martins", "Rocha", "Barbosa"]
+DEFEITOS = ["Rebarba excessiva", "Dimensional fora de tolerância", "Oxidação", "Trinca",
+            "Pintura com falha", "Embalagem danificada", "Quantidade divergente", "Material errado"]
+DESCRICOES_ITEM = ["PARAFUSO SEXTAVADO M8", "CHAPA ACO 1020 2MM", "TUBO PVC 50MM", "CAIXA PAPELAO",
+                   "ANEL ORING 20X2", "BUCHA NYLON", "PERFIL ALUMINIO", "TINTA EPOXI CINZA"]
+
+BATCH_SIZE = 10000
+
+
+def gerar_cnpj(rng):
+    n = rng.randrange(10 ** 13, 10 ** 14)
+    s = f"{n:014d}"
+    return f"{s[:2]}.{s[2:5]}.{s[5:8]}/{s[8:12]}-{s[12:]}"
+
+
+def gerar_fornecedores(rng, quantidade):
+    fornecedores = []
+    usados = set()
+    for i in range(quantidade):
+        razao = f"{rng.choice(PALAVRAS_RAZAO)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)} Ltda {i}"
+        cnpj = gerar_cnpj(rng)
+        while cnpj in usados:
+            cnpj = gerar_cnpj(rng)
+        usados.add(cnpj)
+        fornecedores.append({
+            'razao_social': razao[:100],
+            'cnpj': cnpj,
+            'fornecedor_logix': f"{rng.randrange(1000, 99999)}",
+        })
+    return fornecedores
+
+
+def gerar_itens(rng, quantidade):
+    return [f"{rng.choice(PREFIXOS_ITEM)}.{rng.randrange(100000):05d}" for _ in range(quantidade)]
+
+
+def popular_banco(quantidade_incs, quantidade_fornecedores=500, quantidade_itens=5000,
+                  dias=3 * 365, seed=42):
+    """Insere fornecedores e INCs sintéticas em lote (precisa de app context)"""
+    rng = random.Random(seed)
+    fornecedores = gerar_fornecedores(rng, quantidade_fornecedores)
+    db.session.execute(insert(Fornecedor), fornecedores)
+
+    razoes = [f['razao_social'] for f in fornecedores]
+    # Poucos fornecedores e itens concentram a maior parte das INCs, como na prática
+    pesos_fornecedor = [1.0 / (i + 1) for i in range(len(razoes))]
+    itens = gerar_itens(rng, quantidade_itens)
+    pesos_item = [1.0 / (i + 1) for i in range(len(itens))]
+    hoje = date.today()
+
+    ultimo_oc = db.session.query(db.func.max(INC.oc)).scalar() or 0
+    for inicio in range(0, quantidade_incs, BATCH_SIZE):
+        fim = min(inicio + BATCH_SIZE, quantidade_incs)
+        n = fim - inicio
+        lote_fornecedores = rng.choices(razoes, pesos_fornecedor, k=n)
+        lote_itens = rng.choices(itens, pesos_item, k=n)
+        linhas = []
+        for i in range(n):
+            recebida = rng.randrange(10, 5000)
+            linhas.append({
+                'nf': rng.randrange(1000, 999999),
+                'data': (hoje - timedelta(days=rng.randrange(dias))).strftime("%d-%m-%Y"),
+                'representante': rng.choice(REPRESENTANTES),
+                'fornecedor': lote_fornecedores[i],
+                'item': lote_itens[i],
+                'quantidade_recebida': recebida,
+                'quantidade_com_defeito': rng.randrange(1, recebida + 1),
+                'descricao_defeito': rng.choice(DEFEITOS),
+                'urgencia': rng.choice(URGENCIAS),
+                'acao_recomendada': "Devolver ao fornecedor",
+                'fotos': "[]",
+                'status': rng.choice(STATUS),
+                'oc': ultimo_oc + inicio + i + 1,
+            })
+        db.session.execute(insert(INC), linhas)
+        db.session.commit()
+    return {'fornecedores': razoes, 'itens': itens}
+
+
+def escrever_lst(caminho, quantidade_linhas, itens_por_aviso=8, seed=42):
+    """Gera um relatório .lst no layout lido por ler_arquivo_lst"""
+    rng = random.Random(seed)
+    itens = gerar_itens(rng, max(quantidade_linhas // 4, 1))
+    fornecedores = gerar_fornecedores(rng, max(quantidade_linhas // 50, 1))
+    hoje = date.today().strftime("%d/%m/%Y")
+    with open(caminho, "w", encoding="latin-1") as f:
+        f.write("RELATORIO DE AVISOS DE RECEBIMENTO\n\n")
+        for i in range(quantidade_linhas):
+            aviso = 100000 + i // itens_por_aviso
+            fornecedor = fornecedores[(i // itens_por_aviso) % len(fornecedores)]
+            qtd = f"{rng.randrange(1, 100000) / 100:.2f}".replace(".", ",")
+            f.write(f"{hoje}  {aviso}  {i % itens_por_aviso + 1} {rng.choice(itens)}  "
+                    f"{rng.choice(DESCRICOES_ITEM)}  UN  {qtd}  "
+                    f"{fornecedor['fornecedor_logix']} {fornecedor['razao_social'].upper()}  "
+                    f"{rng.randrange(1, 99)}  {rng.randrange(1, 99999)}\n")
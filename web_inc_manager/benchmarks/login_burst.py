@@ -0,0 +1,113 @@
+"""
+Rajada de logins simultâneos (troca de turno) medindo a latência do /login.
+
+Uso (a partir da pasta web_inc_manager):
+    python -m benchmarks.login_burst --usuarios 60 --workers 4
+    python -m benchmarks.login_burst --usuarios 60 --senha-errada 200   # com um loop de tentativas
+    python -m benchmarks.login_burst --usuarios 80 --mesmo-ip           # todos pelo mesmo terminal
+
+Cada usuário faz um login em sua própria thread, todas liberadas ao mesmo
+tempo, cada um com o seu IP. Com --mesmo-ip todos entram pelo mesmo
+endereço, como no terminal compartilhado (ou NAT) da troca de turno, e a
+rajada passa pelo limite por IP (LOGIN_IP_BURST). Com --senha-errada, uma
+thread extra tenta senhas erradas sem parar durante a rajada; o limite por
+usuário/IP deve bloqueá-la sem afetar os demais (com --mesmo-ip ela usa o
+mesmo endereço dos inspetores). Mostra as latências e a contagem de
+respostas por status.
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+import statistics
+from collections import Counter
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rajada de logins simultâneos")
+    parser.add_argument('--usuarios', type=int, default=60)
+    parser.add_argument('--workers', type=int, default=4, help="PASSWORD_HASH_WORKERS")
+    parser.add_argument('--fila', type=int, default=32, help="PASSWORD_HASH_QUEUE")
+    parser.add_argument('--senha-errada', type=int, default=0, help="tentativas do loop de senha errada")
+    parser.add_argument('--mesmo-ip', action='store_true', help="todos os logins a partir de um único IP")
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp(prefix='inc_login_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(pasta, 'login.db')}"
+    os.environ.setdefault('SECRET_KEY', 'login')
+    os.environ.setdefault('METRICS_ENABLED', '0')
+    os.environ['PASSWORD_HASH_WORKERS'] = str(args.workers)
+    os.environ['PASSWORD_HASH_QUEUE'] = str(args.fila)
+
+    import logging
+    from app import app
+    from models import db, User
+    from utils.login_security import password_hasher
+
+    logging.disable(logging.WARNING)
+    app.config['TESTING'] = True
+    app.config['SLOW_QUERY_THRESHOLD_MS'] = None
+
+    with app.app_context():
+        senha = password_hasher.hash('turno')
+        db.session.add_all([User(username=f"inspetor{i}", password=senha) for i in range(args.usuarios)])
+        db.session.commit()
+
+    largada = threading.Event()
+    lock = threading.Lock()
+    tempos = []
+    status = Counter()
+    bloqueios = Counter()
+
+    def endereco(i):
+        return '10.0.0.1' if args.mesmo_ip else f"10.0.{i // 250}.{i % 250}"
+
+    def logar(i):
+        client = app.test_client()
+        largada.wait()
+        inicio = time.perf_counter()
+        resposta = client.post('/login', data={'username': f"inspetor{i}", 'password': 'turno'},
+                               environ_base={'REMOTE_ADDR': endereco(i)})
+        with lock:
+            tempos.append((time.perf_counter() - inicio) * 1000)
+            status[resposta.status_code] += 1
+
+    def adivinhar():
+        client = app.test_client()
+        largada.wait()
+        for _ in range(args.senha_errada):
+            resposta = client.post('/login', data={'username': 'admin', 'password': 'errada'},
+                                   environ_base={'REMOTE_ADDR': '10.0.0.1' if args.mesmo_ip else '10.9.9.9'})
+            bloqueios[resposta.status_code] += 1
+
+    threads = [threading.Thread(target=logar, args=(i,)) for i in range(args.usuarios)]
+    if args.senha_errada:
+        threads.append(threading.Thread(target=adivinhar))
+    for t in threads:
+        t.start()
+    inicio = time.perf_counter()
+    largada.set()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+
+    tempos.sort()
+    resultado = {
+        'usuarios': args.usuarios,
+        'workers': args.workers,
+        'ip': 'compartilhado' if args.mesmo_ip else 'um por usuário',
+        'duracao_s': round(duracao, 2),
+        'status': dict(status),
+        'median_ms': round(statistics.median(tempos), 1),
+        'p95_ms': round(tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))], 1),
+        'max_ms': round(tempos[-1], 1),
+    }
+    if args.senha_errada:
+        resultado['senha_errada'] = dict(bloqueios)
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""
+Benchmarks dos caminhos críticos de INC e inspeção.
+
+Uso (a partir da pasta web_inc_manager):
+    python -m benchmarks.run --incs 10000 --output bench.json
+    python -m benchmarks.run --incs 100000 --baseline bench.json
+
+O banco sintético é criado em um arquivo temporário (ou em --db, que é
+reaproveitado se já tiver dados). Com --baseline, os resultados são
+comparados com uma execução anterior e o processo termina com código 1
+se algum benchmark ficar mais lento que o limite de --threshold.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime, date, timedelta
+
+
+def medir(funcao, repeticoes, aquecimento=1):
+    """Executa a função várias vezes e retorna as estatísticas de tempo (em ms)"""
+    for _ in range(aquecimento):
+        funcao()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return {
+        'runs': repeticoes,
+        'min_ms': round(tempos[0], 3),
+        'median_ms': round(statistics.median(tempos), 3),
+        'mean_ms': round(statistics.fmean(tempos), 3),
+        'p95_ms': round(tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))], 3),
+        'max_ms': round(tempos[-1], 3),
+    }
+
+
+def checar(resposta, status=200):
+    if resposta.status_code != status:
+        raise RuntimeError(f"{resposta.request.path}: HTTP {resposta.status_code}")
+    # Consome o corpo inteiro, inclusive respostas em streaming
+    return resposta.get_data()
+
+
+def benchmarks_http(app, client, dados, repeticoes):
+    from models import INC
+    from utils.pareto import pareto_cache
+    from utils.inc_snapshot import inc_snapshot
+
+    with app.app_context():
+        amostra = INC.query.order_by(INC.id).first()
+        amostra_id, amostra_nf = amostra.id, amostra.nf
+    fornecedor = dados['fornecedores'][0]
+    item = dados['itens'][0]
+    inicio = (date.today() - timedelta(days=180)).strftime("%Y-%m-%d")
+    fim = date.today().strftime("%Y-%m-%d")
+
+    casos = {
+        'visualizar_incs': lambda: checar(client.get('/visualizar_incs')),
+        'visualizar_incs_pagina_final': lambda: checar(client.get('/visualizar_incs?page=999999')),
+        'visualizar_incs_nf': lambda: checar(client.get(f'/visualizar_incs?nf={amostra_nf}')),
+        'visualizar_incs_item': lambda: checar(client.get(f'/visualizar_incs?item={item}')),
+        'visualizar_incs_fornecedor': lambda: checar(client.get('/visualizar_incs', query_string={'fornecedor': fornecedor})),
+        'visualizar_incs_status': lambda: checar(client.get('/visualizar_incs', query_string={'status': 'Em andamento'})),
+        'expiracao_inc': lambda: checar(client.get('/expiracao_inc')),
+        'monitorar_fornecedores': lambda: checar(client.post('/monitorar_fornecedores', data={
+            'fornecedor': fornecedor, 'item': '', 'start_date': inicio, 'end_date': fim})),
+        'pareto': lambda: checar(client.get('/pareto', query_string={'de': '2000-01-01', 'ate': fim})),
+        'pareto_sem_cache': lambda: (pareto_cache.invalidate(),
+                                     checar(client.get('/pareto', query_string={'de': '2000-01-01', 'ate': fim}))),
+        'analise_incs': lambda: checar(client.get('/analise_incs', query_string={'de': '2000-01-01', 'ate': fim})),
+        'analise_incs_fornecedor': lambda: checar(client.get('/analise_incs', query_string={
+            'de': '2000-01-01', 'ate': fim, 'fornecedor': fornecedor, 'por': 'mes', 'campo': 'taxa_defeito'})),
+        'analise_incs_recarga': lambda: (inc_snapshot.invalidate(),
+                                         checar(client.get('/analise_incs', query_string={'de': '2000-01-01', 'ate': fim}))),
+        'export_csv': lambda: checar(client.get('/export_csv')),
+        'export_xlsx': lambda: checar(client.get('/export_xlsx', query_string={'status': 'Vencida'})),
+        'export_pdf': lambda: checar(client.get(f'/export_pdf/{amostra_id}')),
+    }
+    resultados = {}
+    for nome, funcao in casos.items():
+        print(f"  {nome}...", flush=True)
+        resultados[nome] = medir(funcao, repeticoes)
+    return resultados
+
+
+def benchmarks_lst(tamanhos, repeticoes, pasta):
+    from app import ler_arquivo_lst
+    from benchmarks.datagen import escrever_lst
+
+    resultados = {}
+    for linhas in tamanhos:
+        caminho = os.path.join(pasta, f"bench_{linhas}.lst")
+        escrever_lst(caminho, linhas)
+        print(f"  ler_arquivo_lst_{linhas}...", flush=True)
+        registros = ler_arquivo_lst(caminho)
+        if len(registros) != linhas:
+            raise RuntimeError(f"ler_arquivo_lst leu {len(registros)} de {linhas} linhas")
+        resultados[f'ler_arquivo_lst_{linhas}'] = medir(lambda: ler_arquivo_lst(caminho), repeticoes)
+    return resultados
+
+
+def benchmark_inspecao(app, client, linhas, repeticoes, pasta):
+    """Fluxo completo: importar .lst, inspecionar/adiar cada item e salvar a rotina"""
+    from urllib.parse import urlparse, parse_qs
+    from models import RegistroRotina
+    from benchmarks.datagen import escrever_lst
+
+    caminho = os.path.join(pasta, f"inspecao_{linhas}.lst")
+    escrever_lst(caminho, linhas, itens_por_aviso=4)
+
+    def fluxo():
+        with client.session_transaction() as sess:
+            sess['crm_token'] = 'abc123'
+        with open(caminho, 'rb') as f:
+            resposta = client.post('/rotina_inspecao', data={'file': (f, 'bench.lst')},
+                                   content_type='multipart/form-data')
+        checar(resposta, 302)
+        rotina_id = int(parse_qs(urlparse(resposta.location).query)['rotina'][0])
+        with app.app_context():
+            registros = [(r.id, r.versao) for r in
+                         RegistroRotina.query.filter_by(rotina_compartilhada_id=rotina_id).order_by(RegistroRotina.posicao)]
+        for i, (registro_id, versao) in enumerate(registros):
+            checar(client.post(f'/rotinas_compartilhadas/{rotina_id}/registros/{registro_id}', json={
+                'action': 'inspecionar' if i % 5 else 'adiar',
+                'versao': versao,
+            }))
+        checar(client.post('/salvar_rotina_inspecao', data={'rotina_id': rotina_id}), 302)
+
+    print(f"  inspecao_fluxo_{linhas}...", flush=True)
+    return {f'inspecao_fluxo_{linhas}': medir(fluxo, repeticoes)}
+
+
+def comparar(resultados, baseline, limite):
+    """Compara as medianas com o baseline; retorna a lista de regressões"""
+    regressoes = []
+    print(f"\n{'benchmark':40} {'baseline':>12} {'atual':>12} {'razão':>8}")
+    for nome, atual in resultados['results'].items():
+        anterior = baseline.get('results', {}).get(nome)
+        if not anterior:
+            print(f"{nome:40} {'-':>12} {atual['median_ms']:>12.2f} {'novo':>8}")
+            continue
+        razao = atual['median_ms'] / anterior['median_ms'] if anterior['median_ms'] else float('inf')
+        marca = ' <-- REGRESSÃO' if razao > limite else ''
+        print(f"{nome:40} {anterior['median_ms']:>12.2f} {atual['median_ms']:>12.2f} {razao:>8.2f}{marca}")
+        if razao > limite:
+            regressoes.append(nome)
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do web_inc_manager")
+    parser.add_argument('--incs', type=int, default=10000, help="quantidade de INCs sintéticas (10k a 1M)")
+    parser.add_argument('--fornecedores', type=int, default=500)
+    parser.add_argument('--lst', type=int, nargs='+', default=[1000, 10000], help="linhas dos .lst gerados")
+    parser.add_argument('--inspecao', type=int, default=40, help="itens no fluxo de inspeção")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--db', help="arquivo SQLite (reaproveitado se já populado)")
+    parser.add_argument('--output', help="arquivo JSON de saída")
+    parser.add_argument('--baseline', help="JSON de uma execução anterior para comparação")
+    parser.add_argument('--threshold', type=float, default=1.25, help="razão máxima aceita sobre o baseline")
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp(prefix='inc_bench_')
+    db_path = os.path.abspath(args.db or os.path.join(pasta, 'bench.db'))
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    import logging
+    from app import app
+    from models import db, INC, Fornecedor
+    from benchmarks.datagen import popular_banco
+
+    logging.disable(logging.WARNING)
+    app.config['TESTING'] = True
+
+    with app.app_context():
+        existentes = INC.query.count()
+        if existentes < args.incs:
+            print(f"Gerando {args.incs - existentes} INCs sintéticas em {db_path}...", flush=True)
+            inicio = time.perf_counter()
+            popular_banco(args.incs - existentes, args.fornecedores, seed=existentes + 42)
+            print(f"  concluído em {time.perf_counter() - inicio:.1f}s")
+        dados = {
+            'fornecedores': [f.razao_social for f in Fornecedor.query.limit(10)],
+            'itens': [i for (i,) in db.session.query(INC.item).limit(10)],
+        }
+
+    client = app.test_client()
+    checar(client.post('/login', data={'username': 'admin', 'password': 'admin'}), 302)
+
+    print("Executando benchmarks:")
+    results = {}
+    results.update(benchmarks_http(app, client, dados, args.repeat))
+    results.update(benchmarks_lst(args.lst, args.repeat, pasta))
+    results.update(benchmark_inspecao(app, client, args.inspecao, max(1, args.repeat // 2), pasta))
+
+    resultados = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'incs': args.incs,
+            'fornecedores': args.fornecedores,
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+    shutil.rmtree(pasta, ignore_errors=True)
+
+    texto = json.dumps(resultados, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(texto)
+        print(f"\nResultados gravados em {args.output}")
+    else:
+        print(texto)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressoes = comparar(resultados, baseline, args.threshold)
+        if regressoes:
+            print(f"\n{len(regressoes)} benchmark(s) acima de {args.threshold}x o baseline")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
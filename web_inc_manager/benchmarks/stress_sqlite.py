@@ -0,0 +1,204 @@
+"""
+Teste de carga concorrente no SQLite: vários leitores e escritores simultâneos.
+
+Uso (a partir da pasta web_inc_manager):
+    python -m benchmarks.stress_sqlite --readers 16 --writers 8 --seconds 20
+    python -m benchmarks.stress_sqlite --sem-perfil   # compara com a configuração antiga
+
+Os escritores cadastram INCs e marcam/salvam rotinas de inspeção compartilhadas;
+os leitores consultam listagens e relatórios. Ao final são contados os erros
+"database is locked" e verificado se algum número de OC foi repetido. O
+processo termina com código 1 se houver qualquer erro, se alguma thread não
+chegou a começar (ex.: login recusado) ou se nenhuma INC ou rotina foi gravada.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import traceback
+from collections import Counter
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de concorrência do SQLite")
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--incs', type=int, default=5000, help="INCs sintéticas antes do teste")
+    parser.add_argument('--sem-perfil', action='store_true', help="desliga WAL/escritor único (SQLITE_PROFILE=0)")
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp(prefix='inc_stress_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(pasta, 'stress.db')}"
+    os.environ.setdefault('SECRET_KEY', 'stress')
+    os.environ['SQLITE_PROFILE'] = '0' if args.sem_perfil else '1'
+    os.environ.setdefault('METRICS_ENABLED', '0')
+    # Todas as threads entram como admin ao mesmo tempo; o limite de logins por usuário recusaria quase todas
+    os.environ['LOGIN_RATE_LIMIT_ENABLED'] = '0'
+
+    import logging
+    from app import app
+    from models import db, INC, Fornecedor, RotinaInspecao
+    from benchmarks.datagen import popular_banco
+    from utils.shared_routines import create_shared_routine, routine_records
+
+    logging.disable(logging.WARNING)
+    app.config['TESTING'] = True
+    app.config['SLOW_QUERY_THRESHOLD_MS'] = None
+
+    with app.app_context():
+        popular_banco(args.incs, 50)
+        fornecedores = [f.razao_social for f in Fornecedor.query.limit(20)]
+        rotinas_antes = RotinaInspecao.query.count()
+
+    fim = inicio = None
+    operacoes = Counter()
+    erros = Counter()
+    iniciados = Counter()
+    exemplos = {}
+    lock = threading.Lock()
+
+    def registrar(tipo, erro=None):
+        with lock:
+            if erro is None:
+                operacoes[tipo] += 1
+                return
+            chave = 'database is locked' if 'database is locked' in str(erro) else type(erro).__name__
+            erros[chave] += 1
+            exemplos.setdefault(chave, ''.join(traceback.format_exception_only(type(erro), erro)).strip())
+
+    def novo_cliente():
+        client = app.test_client()
+        resposta = client.post('/login', data={'username': 'admin', 'password': 'admin'})
+        if resposta.status_code != 302:
+            raise RuntimeError(f"login falhou: HTTP {resposta.status_code}")
+        return client
+
+    def executar(tipo, funcao, status):
+        try:
+            resposta = funcao()
+            resposta.get_data()
+            if resposta.status_code != status:
+                raise RuntimeError(f"{tipo}: HTTP {resposta.status_code}")
+            registrar(tipo)
+        except Exception as e:
+            registrar(tipo, e)
+
+    def comecar():
+        nonlocal fim, inicio
+        inicio = time.perf_counter()
+        fim = time.monotonic() + args.seconds
+
+    # O tempo de teste só começa depois dos logins (o hash da senha é caro e não é o que se mede aqui)
+    largada = threading.Barrier(args.readers + args.writers, action=comecar)
+
+    def em_thread(papel, funcao, seed):
+        # Falhas fora de executar (login, por exemplo) encerram a thread, mas contam como erro
+        try:
+            client = novo_cliente()
+        except Exception as e:
+            registrar(papel, e)
+            client = None
+        largada.wait()
+        if client is None:
+            return
+        with lock:
+            iniciados[papel] += 1
+        try:
+            funcao(client, seed)
+        except Exception as e:
+            registrar(papel, e)
+
+    def leitor(client, seed):
+        rng = random.Random(seed)
+        consultas = [
+            lambda: client.get('/visualizar_incs', query_string={'page': rng.randint(1, 50)}),
+            lambda: client.get('/visualizar_incs', query_string={'fornecedor': rng.choice(fornecedores)}),
+            lambda: client.get('/expiracao_inc'),
+            lambda: client.get('/export_csv'),
+        ]
+        while time.monotonic() < fim:
+            executar('leitura', rng.choice(consultas), 200)
+
+    def escritor(client, seed):
+        rng = random.Random(seed)
+        while time.monotonic() < fim:
+            if rng.random() < 0.7:
+                executar('cadastro_inc', lambda: client.post('/cadastro_inc', data={
+                    'nf': rng.randrange(1000, 999999),
+                    'representante': 'Gabriel Rodrigues da Silva',
+                    'fornecedor': rng.choice(fornecedores),
+                    'item': f"MPR.{rng.randrange(100000):05d}",
+                    'quantidade_recebida': 100,
+                    'quantidade_com_defeito': rng.randrange(1, 100),
+                    'descricao_defeito': 'Teste de carga',
+                    'urgencia': 'Moderada',
+                    'acao_recomendada': 'Devolver ao fornecedor',
+                }), 302)
+            else:
+                # Rotina compartilhada: marca os registros um a um e salva
+                try:
+                    with app.app_context():
+                        rotina = create_shared_routine([
+                            {'num_aviso': 100000 + i // 4, 'item': f"MPR.{i:05d}", 'inspecionado': False,
+                             'adiado': False}
+                            for i in range(rng.randint(1, 20))
+                        ], 1)
+                        rotina_id = rotina.id
+                        registros = [(r.id, r.versao) for r in routine_records(rotina_id)]
+                except Exception as e:
+                    registrar('criar_rotina', e)
+                    continue
+                for registro_id, versao in registros:
+                    executar('registro_rotina', lambda: client.post(
+                        f'/rotinas_compartilhadas/{rotina_id}/registros/{registro_id}',
+                        json={'action': 'inspecionar', 'versao': versao}), 200)
+                executar('salvar_rotina', lambda: client.post('/salvar_rotina_inspecao',
+                                                              data={'rotina_id': rotina_id}), 302)
+
+    threads = [threading.Thread(target=em_thread, args=('leitor', leitor, i)) for i in range(args.readers)]
+    threads += [threading.Thread(target=em_thread, args=('escritor', escritor, 1000 + i))
+                for i in range(args.writers)]
+    perfil = 'sem perfil' if args.sem_perfil else 'WAL + escritor único'
+    print(f"{args.readers} leitores e {args.writers} escritores por {args.seconds:.0f}s ({perfil})...", flush=True)
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+
+    with app.app_context():
+        ocs = Counter(oc for (oc,) in db.session.query(INC.oc))
+        repetidos = sum(1 for n in ocs.values() if n > 1)
+        rotinas = RotinaInspecao.query.count() - rotinas_antes
+    if repetidos:
+        erros['OC repetida'] += repetidos
+    # Um teste que não escreveu nada não prova nada sobre travamentos
+    for papel, esperado in (('leitor', args.readers), ('escritor', args.writers)):
+        if iniciados[papel] < esperado:
+            erros[f'{papel} não iniciou'] += esperado - iniciados[papel]
+    if args.writers:
+        for tipo in ('cadastro_inc', 'salvar_rotina'):
+            if not operacoes[tipo]:
+                erros[f'nenhum {tipo} concluído'] += 1
+
+    resultado = {
+        'perfil': perfil,
+        'duracao_s': round(duracao, 1),
+        'operacoes': dict(operacoes),
+        'operacoes_por_s': round(sum(operacoes.values()) / duracao, 1),
+        'rotinas_gravadas': rotinas,
+        'erros': dict(erros),
+        'exemplos': exemplos,
+    }
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    if erros:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
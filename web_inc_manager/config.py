@@ -7,7 +7,51 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static/uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    UPLOAD_CACHE_MAX_AGE = 365 * 24 * 3600  # URLs de upload têm fingerprint, podem ficar em cache
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')  # Apache/lighttpd
+    UPLOAD_ACCEL_REDIRECT = os.environ.get('UPLOAD_ACCEL_REDIRECT')  # nginx, ex.: '/_uploads'
     PRINTER_IP = os.environ.get('PRINTER_IP') or '192.168.1.48'
     PRINTER_PORT = int(os.environ.get('PRINTER_PORT') or 9100)
+    PRINTER_CONNECT_TIMEOUT = float(os.environ.get('PRINTER_CONNECT_TIMEOUT') or 5)
+    PRINTER_SEND_TIMEOUT = float(os.environ.get('PRINTER_SEND_TIMEOUT') or 10)
+    PRINTER_IDLE_TIMEOUT = float(os.environ.get('PRINTER_IDLE_TIMEOUT') or 30)  # fecha a conexão ociosa
+    PRINT_MAX_RETRIES = int(os.environ.get('PRINT_MAX_RETRIES') or 5)
+    PRINT_BACKOFF_BASE = float(os.environ.get('PRINT_BACKOFF_BASE') or 1)
+    PRINT_BACKOFF_MAX = float(os.environ.get('PRINT_BACKOFF_MAX') or 60)
     CRM_BASE_URL = os.environ.get('CRM_BASE_URL') or 'http://192.168.1.47/crm/index.php?route=engenharia/produto/update'
-    ITEMS_PER_PAGE = 10
\ No newline at end of file
+    ITEMS_PER_PAGE = 10
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    COMPRESS_MIN_SIZE = 500  # bytes; respostas menores vão sem compressão
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS') or 100)
+    SHARED_ROUTINE_POLL_SECONDS = float(os.environ.get('SHARED_ROUTINE_POLL_SECONDS') or 5)  # para streams de outros processos
+    SHARED_ROUTINE_STREAM_SECONDS = float(os.environ.get('SHARED_ROUTINE_STREAM_SECONDS') or 600)  # o navegador reconecta depois
+    OFFLINE_SYNC_MAX_BATCH = 500  # ações por lote na sincronização do modo offline
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256:600000'  # hashes antigos são refeitos no login
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 4)
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE') or 32)  # acima disso o login responde 503
+    LOGIN_RATE_LIMIT_ENABLED = os.environ.get('LOGIN_RATE_LIMIT_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    LOGIN_USER_BURST = int(os.environ.get('LOGIN_USER_BURST') or 5)  # tentativas seguidas por usuário
+    LOGIN_USER_PER_MINUTE = float(os.environ.get('LOGIN_USER_PER_MINUTE') or 5)
+    LOGIN_IP_BURST = int(os.environ.get('LOGIN_IP_BURST') or 60)  # terminais compartilhados na troca de turno
+    LOGIN_IP_PER_MINUTE = float(os.environ.get('LOGIN_IP_PER_MINUTE') or 30)
+    SUPPLIER_DIRECTORY_TTL = int(os.environ.get('SUPPLIER_DIRECTORY_TTL') or 300)  # recarga do cache de fornecedores em outros processos
+    SUPPLIER_AUTOCOMPLETE_LIMIT = 10
+    SUPPLIER_FUZZY_THRESHOLD = float(os.environ.get('SUPPLIER_FUZZY_THRESHOLD') or 0.88)  # semelhança mínima para vincular nomes do .lst
+    PARETO_CACHE_TTL = int(os.environ.get('PARETO_CACHE_TTL') or 300)  # o cache também é invalidado por escritas de INC
+    INC_SNAPSHOT_CHECK_INTERVAL = float(os.environ.get('INC_SNAPSHOT_CHECK_INTERVAL') or 1)  # segundos entre consultas ao change_log
+    INC_SNAPSHOT_MAX_DELTA = int(os.environ.get('INC_SNAPSHOT_MAX_DELTA') or 50000)  # acima disso o snapshot é recarregado inteiro
+    CHANGE_LOG_ENABLED = os.environ.get('CHANGE_LOG_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', '1').lower() in ('1', 'true', 'yes')  # WAL + escritor único
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000)
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB') or 64 * 1024)
+    SQLITE_READ_POOL_SIZE = int(os.environ.get('SQLITE_READ_POOL_SIZE') or 10)
+    SQLITE_WRITE_TIMEOUT = float(os.environ.get('SQLITE_WRITE_TIMEOUT') or 30)  # espera máx. pela conexão de escrita
+    PDF_EXPORT_WORKERS = int(os.environ.get('PDF_EXPORT_WORKERS') or 0) or None  # None = núm. de CPUs
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE') or 5000)  # INCs por transação na importação em lote
+    SUPPLIER_IMPORT_BATCH_SIZE = int(os.environ.get('SUPPLIER_IMPORT_BATCH_SIZE') or 2000)  # fornecedores por transação
+    SUPPLIER_FIXED_WIDTH_LAYOUT = os.environ.get('SUPPLIER_FIXED_WIDTH_LAYOUT') or 'fornecedor_logix:15,cnpj:19,razao_social:50'
+    PDF_EXPORT_CHUNK_SIZE = int(os.environ.get('PDF_EXPORT_CHUNK_SIZE') or 20)
+    XLSX_EXPORT_CHUNK_SIZE = int(os.environ.get('XLSX_EXPORT_CHUNK_SIZE') or 1000)  # INCs lidas por vez na exportação Excel
+    COLUMNAR_EXPORT_BATCH_SIZE = int(os.environ.get('COLUMNAR_EXPORT_BATCH_SIZE') or 50000)  # linhas por row group/lote Arrow
\ No newline at end of file
@@ -1,8 +1,9 @@
 ﻿from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
+from utils.sqlite_profile import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -10,13 +11,20 @@ class User(UserMixin, db.Model):
     password = db.Column(db.String(256), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
 
+def data_iso(coluna):
+    """Expressão SQL da data DD-MM-YYYY como YYYY-MM-DD (a mesma dos índices de período de INC)"""
+    def parte(inicio, tamanho):
+        return db.func.substr(coluna, db.literal_column(str(inicio)), db.literal_column(str(tamanho)))
+    hifen = db.literal_column("'-'")
+    return parte(7, 4).op('||')(hifen).op('||')(parte(4, 2)).op('||')(hifen).op('||')(parte(1, 2))
+
 class INC(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nf = db.Column(db.Integer, nullable=False, unique=False)
     data = db.Column(db.String(10), nullable=False)
     representante = db.Column(db.String(100), nullable=False)
     fornecedor = db.Column(db.String(100), nullable=False)
-    item = db.Column(db.String(20), nullable=False)
+    item = db.Column(db.String(20), nullable=False, index=True)
     quantidade_recebida = db.Column(db.Integer, nullable=False)
     quantidade_com_defeito = db.Column(db.Integer, nullable=False)
     descricao_defeito = db.Column(db.Text, default="")
@@ -27,6 +35,11 @@ class INC(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     oc = db.Column(db.Integer, unique=True, nullable=False)
 
+    # Índice de cobertura do Pareto: período + dimensões + quantidade, os GROUP BY não leem a tabela
+    __table_args__ = (
+        db.Index('ix_inc_periodo', data_iso(data), item, fornecedor, representante, quantidade_com_defeito),
+    )
+
 class LayoutSetting(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     element = db.Column(db.String(20), unique=True, nullable=False)
@@ -35,16 +48,135 @@ class LayoutSetting(db.Model):
     font_family = db.Column(db.String(50), default="Helvetica")
     font_size = db.Column(db.Integer, default=12)
 
+def cnpj_digitos(coluna):
+    """Expressão SQL do CNPJ só com dígitos (a mesma do índice único de Fornecedor)"""
+    for separador in ('.', '/', '-', ' '):
+        coluna = db.func.replace(coluna, db.literal_column(f"'{separador}'"), db.literal_column("''"))
+    return coluna
+
 class Fornecedor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     razao_social = db.Column(db.String(100), nullable=False)
     cnpj = db.Column(db.String(18), unique=True, nullable=False)
     fornecedor_logix = db.Column(db.String(100), nullable=False)
 
+    # CNPJ único independente da formatação (12.345.678/0001-90 == 12345678000190)
+    __table_args__ = (db.Index('ix_fornecedor_cnpj_digitos', cnpj_digitos(cnpj), unique=True),)
+
+# Nome de fornecedor do relatório .lst vinculado ao cadastro (normalizado, sem acentos)
+class FornecedorAlias(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    alias = db.Column(db.String(200), unique=True, nullable=False)
+    nome_original = db.Column(db.String(200), nullable=False)
+    fornecedor_id = db.Column(db.Integer, db.ForeignKey('fornecedor.id', ondelete='CASCADE'), nullable=True)  # None = sem fornecedor
+    metodo = db.Column(db.String(20), nullable=False)  # aproximado, manual, sem_correspondencia
+    score = db.Column(db.Float, default=0)
+    confirmado = db.Column(db.Boolean, default=False, index=True)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    confirmado_por_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    fornecedor = db.relationship('Fornecedor')
+    confirmado_por = db.relationship('User')
+
+class Item(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    codigo = db.Column(db.String(50), unique=True, nullable=False)  # ex.: MPR.02199
+    descricao = db.Column(db.Text, default="")  # última descrição lida dos relatórios .lst
+    # Contadores mantidos por utils.item_stats (rotinas salvas e INCs)
+    qtd_recebida = db.Column(db.Float, default=0)
+    vezes_inspecionado = db.Column(db.Integer, default=0)
+    vezes_adiado = db.Column(db.Integer, default=0)
+    total_incs = db.Column(db.Integer, default=0, index=True)
+    qtd_defeito = db.Column(db.Integer, default=0)
+    ultima_inspecao = db.Column(db.DateTime, nullable=True)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Volume recebido (rotinas salvas) e defeitos (INCs) por fornecedor e mês, para o PPM
+class FornecedorMes(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    fornecedor = db.Column(db.String(200), nullable=False)  # razão social, como em INC.fornecedor
+    mes = db.Column(db.String(7), nullable=False, index=True)  # YYYY-MM
+    qtd_recebida = db.Column(db.Float, default=0)
+    total_incs = db.Column(db.Integer, default=0)
+    qtd_defeito = db.Column(db.Integer, default=0)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('fornecedor', 'mes', name='uq_fornecedor_mes'),)
+
 # Novo modelo para Rotina de Inspeção
 class RotinaInspecao(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     inspetor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Relaciona com o usuário
     data_inspecao = db.Column(db.DateTime, default=datetime.utcnow)
     registros = db.Column(db.Text, nullable=False)  # JSON com os registros (itens inspecionados/adiados)
-    inspetor = db.relationship('User', backref=db.backref('rotinas', lazy=True))
\ No newline at end of file
+    inspetor = db.relationship('User', backref=db.backref('rotinas', lazy=True))
+
+# Fila persistente de impressão de etiquetas ZPL
+class PrintJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    printer_ip = db.Column(db.String(64), nullable=False)
+    printer_port = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # ZPL a ser enviado
+    status = db.Column(db.String(20), default="pendente", index=True)  # pendente, enviando, impresso, falhou
+    tentativas = db.Column(db.Integer, default=0)
+    ultimo_erro = db.Column(db.Text, default="")
+    inc_id = db.Column(db.Integer, db.ForeignKey('inc.id', ondelete='SET NULL'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    proxima_tentativa = db.Column(db.DateTime, default=datetime.utcnow)
+    impresso_em = db.Column(db.DateTime, nullable=True)
+    reservado_em = db.Column(db.DateTime, nullable=True)  # quando um worker passou o job para 'enviando'
+
+# Tokens de acesso à API JSON (só o hash do token é gravado)
+class ApiToken(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(100), nullable=False)  # ex.: "ERP", "BI"
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # quem criou
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    revogado = db.Column(db.Boolean, default=False)
+    user = db.relationship('User')
+
+# Log append-only de alterações (INC, Fornecedor, RotinaInspecao) para sincronização incremental
+class ChangeLog(db.Model):
+    id = db.Column(db.Integer, primary_key=True)  # cursor do feed de alterações
+    entidade = db.Column(db.String(30), nullable=False, index=True)  # nome da tabela
+    entidade_id = db.Column(db.Integer, nullable=False)
+    operacao = db.Column(db.String(10), nullable=False)  # insert, update, delete
+    alterado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    dados = db.Column(db.Text, nullable=True)  # JSON com o estado após a alteração (nulo no delete)
+
+# Rotina de inspeção em andamento, compartilhada entre vários inspetores
+class RotinaCompartilhada(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    criado_por_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    criada_em = db.Column(db.DateTime, default=datetime.utcnow)
+    status = db.Column(db.String(20), default="aberta", index=True)  # aberta, salva
+    versao = db.Column(db.Integer, default=0)  # incrementada a cada alteração de registro (cursor dos eventos)
+    rotina_id = db.Column(db.Integer, db.ForeignKey('rotina_inspecao.id'), nullable=True)  # rotina gravada ao salvar
+    criado_por = db.relationship('User')
+
+class RegistroRotina(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    rotina_compartilhada_id = db.Column(db.Integer, db.ForeignKey('rotina_compartilhada.id'), nullable=False, index=True)
+    posicao = db.Column(db.Integer, nullable=False)  # ordem no arquivo .lst
+    num_aviso = db.Column(db.Integer, nullable=False)
+    item = db.Column(db.String(50), nullable=False)
+    descricao = db.Column(db.Text, default="")
+    fornecedor = db.Column(db.String(200), default="")
+    razao_social = db.Column(db.String(200), default="")
+    qtd_recebida = db.Column(db.Float, default=0)
+    oc_value = db.Column(db.Integer)
+    inspecionado = db.Column(db.Boolean, default=False)
+    adiado = db.Column(db.Boolean, default=False)
+    versao = db.Column(db.Integer, default=1)  # controle de concorrência otimista
+    seq = db.Column(db.Integer, default=0)  # versão da rotina na última alteração deste registro
+    atualizado_por_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    atualizado_em = db.Column(db.DateTime, nullable=True)
+    atualizado_por = db.relationship('User')
+
+# Ações enviadas pelo modo offline já aplicadas (idempotência da sincronização em lote)
+class AcaoSincronizada(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    op_id = db.Column(db.String(64), unique=True, nullable=False)  # id gerado no navegador
+    rotina_compartilhada_id = db.Column(db.Integer, db.ForeignKey('rotina_compartilhada.id'), nullable=False)
+    resultado = db.Column(db.Text, nullable=False)  # JSON devolvido na primeira vez
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -43,6 +43,330 @@ function updateSaveButton() {
     }
 }
 
+// ===== Funções para a rotina de inspeção compartilhada =====
+function atualizarRegistro(registro) {
+    const linha = document.querySelector(`tr[data-registro-id="${registro.id}"]`);
+    if (!linha) {
+        return;
+    }
+    const celula = linha.querySelector('.status-cell');
+    celula.setAttribute('data-inspecionado', registro.inspecionado ? 'true' : 'false');
+    celula.setAttribute('data-adiado', registro.adiado ? 'true' : 'false');
+    celula.querySelector('.status-texto').textContent =
+        registro.inspecionado ? 'Inspecionado' : (registro.adiado ? 'Adiado' : 'Pendente');
+    celula.querySelector('.status-autor').textContent = registro.atualizado_por || '';
+    linha.querySelectorAll('input[name="versao"]').forEach(input => {
+        // Eventos atrasados não podem voltar a versão
+        if (parseInt(input.value) < registro.versao) {
+            input.value = registro.versao;
+        }
+    });
+    updateSaveButton();
+}
+
+function avisoRotina(classe, texto) {
+    const aviso = document.getElementById('rotina-aviso');
+    if (aviso) {
+        aviso.className = `alert ${classe}`;
+        aviso.textContent = texto;
+    }
+}
+
+// ===== Fila offline da rotina de inspeção (IndexedDB) =====
+const FILA_DB = 'inc-manager';
+const FILA_STORE = 'acoes_inspecao';
+
+function abrirFila() {
+    return new Promise((resolve, reject) => {
+        const pedido = indexedDB.open(FILA_DB, 1);
+        pedido.onupgradeneeded = () => {
+            const store = pedido.result.createObjectStore(FILA_STORE, {keyPath: 'id'});
+            store.createIndex('rotina', 'rotina');
+        };
+        pedido.onsuccess = () => resolve(pedido.result);
+        pedido.onerror = () => reject(pedido.error);
+    });
+}
+
+function filaTransacao(modo, operacao) {
+    return abrirFila().then(db => new Promise((resolve, reject) => {
+        const tx = db.transaction(FILA_STORE, modo);
+        const pedido = operacao(tx.objectStore(FILA_STORE));
+        tx.oncomplete = () => {
+            db.close();
+            resolve(pedido ? pedido.result : undefined);
+        };
+        tx.onerror = () => reject(tx.error);
+    }));
+}
+
+function listarFila(rotina) {
+    return filaTransacao('readonly', store => store.index('rotina').getAll(IDBKeyRange.only(rotina)))
+        .then(acoes => acoes.sort((a, b) => a.criada_em - b.criada_em));
+}
+
+function novoIdAcao() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+}
+
+function aplicarAcaoLocal(acao) {
+    // Mostra a ação na tela antes de chegar ao servidor
+    atualizarRegistro({
+        id: acao.registro_id,
+        inspecionado: acao.action === 'inspecionar',
+        adiado: acao.action === 'adiar',
+        versao: 0,
+        atualizado_por: 'aguardando sincronização'
+    });
+}
+
+function acompanharRotina(element) {
+    if (!element || !window.EventSource || !window.fetch || !window.indexedDB) {
+        return;
+    }
+
+    const rotina = parseInt(element.dataset.rotinaId);
+    const indicador = document.getElementById('fila-offline');
+    const pendentes = new Map();  // registro_id -> ação ainda não confirmada
+    const emEnvio = new Set();
+    let sincronizando = false;
+
+    function atualizarIndicador() {
+        if (!indicador) {
+            return;
+        }
+        indicador.classList.toggle('d-none', pendentes.size === 0);
+        indicador.textContent = `${pendentes.size} ação(ões) aguardando sincronização` +
+            (navigator.onLine ? '' : ' (sem conexão)');
+    }
+
+    function sincronizar() {
+        if (sincronizando || !navigator.onLine) {
+            return Promise.resolve();
+        }
+        sincronizando = true;
+        return listarFila(rotina).then(acoes => {
+            if (!acoes.length) {
+                return;
+            }
+            acoes.forEach(acao => emEnvio.add(acao.id));
+            const enviadas = new Map(acoes.map(acao => [acao.id, acao]));
+            return fetch(element.dataset.syncUrl, {
+                method: 'POST',
+                credentials: 'same-origin',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({acoes: acoes.map(({id, registro_id, action, versao}) => ({id, registro_id, action, versao}))})
+            })
+                .then(response => response.json().then(dados => ({status: response.status, dados})))
+                .then(({status, dados}) => {
+                    if (status === 409 && dados.rotina_salva) {
+                        pendentes.clear();
+                        avisoRotina('alert-warning', 'A rotina já foi salva; as ações pendentes foram descartadas.');
+                        return filaTransacao('readwrite', store => acoes.forEach(acao => store.delete(acao.id)));
+                    }
+                    if (status !== 200) {
+                        throw new Error(dados.erro);
+                    }
+                    const conflitos = dados.resultados.filter(r => r.status === 'conflito').length;
+                    return filaTransacao('readwrite', store => {
+                        dados.resultados.forEach(resultado => {
+                            const acao = enviadas.get(resultado.id);
+                            store.delete(resultado.id);
+                            if (acao && pendentes.get(acao.registro_id) === acao.id) {
+                                pendentes.delete(acao.registro_id);
+                            }
+                            if (resultado.registro) {
+                                atualizarRegistro(resultado.registro);
+                            }
+                        });
+                        // Ações feitas durante o envio partem da versão que acabou de ser gravada
+                        const cursor = store.index('rotina').openCursor(IDBKeyRange.only(rotina));
+                        cursor.onsuccess = () => {
+                            const c = cursor.result;
+                            if (!c) {
+                                return;
+                            }
+                            const resultado = dados.resultados.find(r => r.status === 'ok' && r.registro &&
+                                r.registro.id === c.value.registro_id && enviadas.get(r.id).versao === c.value.versao);
+                            if (resultado) {
+                                c.update(Object.assign(c.value, {versao: resultado.registro.versao}));
+                            }
+                            c.continue();
+                        };
+                    }).then(() => {
+                        if (conflitos) {
+                            avisoRotina('alert-warning', `${conflitos} registro(s) foram alterados por outro inspetor enquanto você estava offline. Confira o status atual.`);
+                        }
+                    });
+                });
+        })
+            .catch(() => {})  // Sem conexão: fica na fila para a próxima tentativa
+            .finally(() => {
+                emEnvio.clear();
+                sincronizando = false;
+                listarFila(rotina).then(acoes => acoes.forEach(acao => {
+                    pendentes.set(acao.registro_id, acao.id);
+                    aplicarAcaoLocal(acao);
+                })).then(atualizarIndicador);
+            });
+    }
+
+    function enfileirar(acao) {
+        return filaTransacao('readwrite', store => {
+            // Só a última ação não enviada de cada registro é mantida
+            const cursor = store.index('rotina').openCursor(IDBKeyRange.only(rotina));
+            cursor.onsuccess = () => {
+                const c = cursor.result;
+                if (!c) {
+                    store.put(acao);
+                    return;
+                }
+                if (c.value.registro_id === acao.registro_id && !emEnvio.has(c.value.id)) {
+                    acao.versao = c.value.versao;
+                    c.delete();
+                }
+                c.continue();
+            };
+        });
+    }
+
+    const eventos = new EventSource(element.dataset.eventosUrl);
+    eventos.addEventListener('registro', e => {
+        const registro = JSON.parse(e.data);
+        atualizarRegistro(registro);
+        if (pendentes.has(registro.id)) {
+            listarFila(rotina).then(acoes => acoes.filter(a => a.registro_id === registro.id).forEach(aplicarAcaoLocal));
+        }
+    });
+    eventos.addEventListener('salva', () => {
+        eventos.close();
+        avisoRotina('alert-success', 'A rotina foi salva.');
+        document.querySelectorAll('.registro-form button, #saveButton').forEach(b => b.disabled = true);
+    });
+
+    // As ações vão para a fila local e a tela responde na hora, com ou sem conexão
+    document.querySelectorAll('.registro-form').forEach(form => {
+        form.addEventListener('submit', e => {
+            e.preventDefault();
+            const acao = {
+                id: novoIdAcao(),
+                rotina: rotina,
+                registro_id: parseInt(form.querySelector('input[name="registro_id"]').value),
+                action: form.querySelector('input[name="action"]').value,
+                versao: parseInt(form.querySelector('input[name="versao"]').value),
+                criada_em: Date.now()
+            };
+            aplicarAcaoLocal(acao);
+            pendentes.set(acao.registro_id, acao.id);
+            atualizarIndicador();
+            enfileirar(acao).then(sincronizar);
+        });
+    });
+
+    // Salvar só depois de sincronizar tudo
+    const saveButton = document.getElementById('saveButton');
+    if (saveButton) {
+        saveButton.form.addEventListener('submit', e => {
+            if (!pendentes.size) {
+                return;
+            }
+            e.preventDefault();
+            sincronizar().then(() => {
+                if (pendentes.size) {
+                    avisoRotina('alert-warning', 'Há ações aguardando sincronização. Tente salvar quando a conexão voltar.');
+                } else {
+                    saveButton.form.submit();
+                }
+            });
+        });
+    }
+
+    window.addEventListener('online', sincronizar);
+    window.addEventListener('offline', atualizarIndicador);
+    setInterval(sincronizar, 15000);
+    sincronizar();
+}
+
+function registrarServiceWorker(url) {
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register(url).catch(() => {});
+        if (!navigator.serviceWorker.controller) {
+            // Página carregada sem o worker (primeira visita): pede a cópia para uso offline
+            navigator.serviceWorker.ready.then(registro => registro.active.postMessage(
+                {tipo: 'guardar-pagina', url: location.href}
+            ));
+        }
+    }
+}
+
+// ===== Funções para a fila de impressão =====
+function acompanharImpressao(element) {
+    const mensagens = {
+        'pendente': ['alert-info', 'Etiqueta na fila de impressão...'],
+        'enviando': ['alert-info', 'Enviando etiqueta para a impressora...'],
+        'impresso': ['alert-success', 'Etiqueta impressa!'],
+        'falhou': ['alert-danger', 'Falha ao imprimir a etiqueta']
+    };
+
+    function consultar() {
+        fetch(element.dataset.url, {credentials: 'same-origin'})
+            .then(response => response.json())
+            .then(job => {
+                const [classe, texto] = mensagens[job.status] || ['alert-info', job.status];
+                element.className = `alert ${classe}`;
+                element.textContent = texto;
+                if (job.status === 'pendente' && job.tentativas > 0) {
+                    element.textContent += ` (tentativa ${job.tentativas + 1}: ${job.erro})`;
+                } else if (job.status === 'falhou' && job.erro) {
+                    element.textContent += `: ${job.erro}`;
+                }
+                if (job.status !== 'impresso' && job.status !== 'falhou') {
+                    setTimeout(consultar, 2000);
+                }
+            })
+            .catch(() => setTimeout(consultar, 5000));
+    }
+    consultar();
+}
+
+// ===== Autocomplete de fornecedores =====
+function autocompletarFornecedor(input) {
+    const lista = document.getElementById(input.getAttribute('list'));
+    let espera = null;
+    let controle = null;
+
+    input.addEventListener('input', () => {
+        clearTimeout(espera);
+        const termo = input.value.trim();
+        if (!termo) {
+            lista.innerHTML = '';
+            return;
+        }
+        espera = setTimeout(() => {
+            // Só a última digitação interessa
+            if (controle) {
+                controle.abort();
+            }
+            controle = new AbortController();
+            fetch(`${input.dataset.autocompleteUrl}?q=${encodeURIComponent(termo)}`, {signal: controle.signal})
+                .then(response => response.json())
+                .then(fornecedores => {
+                    lista.innerHTML = '';
+                    fornecedores.forEach(f => {
+                        const option = document.createElement('option');
+                        option.value = f.razao_social;
+                        option.label = `CNPJ ${f.cnpj} · Logix ${f.fornecedor_logix}`;
+                        lista.appendChild(option);
+                    });
+                })
+                .catch(() => {});
+        }, 150);
+    });
+}
+
 // ===== Funções gerais da interface =====
 document.addEventListener('DOMContentLoaded', function() {
     // Inicialização de elementos especiais
@@ -65,6 +389,8 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    document.querySelectorAll('[data-autocomplete-url]').forEach(autocompletarFornecedor);
+
     // Formatadores de dados
     document.querySelectorAll('.format-date').forEach(function(element) {
         const date = element.textContent.trim();
@@ -82,6 +408,22 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    // Selecionar todas as INCs da página para impressão em lote
+    const selectAllIncs = document.getElementById('select-all-incs');
+    if (selectAllIncs) {
+        selectAllIncs.addEventListener('change', function() {
+            document.querySelectorAll('.inc-select').forEach(checkbox => {
+                checkbox.checked = selectAllIncs.checked;
+            });
+        });
+    }
+
+    // Acompanhar job de impressão enfileirado
+    const printJobStatus = document.getElementById('print-job-status');
+    if (printJobStatus) {
+        acompanharImpressao(printJobStatus);
+    }
+
     // Verificar botões de salvar para rotinas de inspeção
     updateSaveButton();
 });
\ No newline at end of file
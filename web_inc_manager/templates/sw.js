@@ -0,0 +1,89 @@
+// Service worker da tela de inspeção (gerado pela rota /sw.js).
+// Guarda a página da rotina e os arquivos estáticos para que o inspetor
+// continue trabalhando sem conexão; as ações ficam na fila do IndexedDB
+// (static/js/script.js) e são enviadas ao /sync quando a rede volta.
+const CACHE_ESTATICO = 'inc-manager-estatico-{{ versao }}';
+const CACHE_PAGINAS = 'inc-manager-paginas';
+const PAGINA_INSPECAO = '{{ url_for("visualizar_registros_inspecao") }}';
+const PRECACHE = [
+{%- for f in static_files %}
+    '{{ url_for("static", filename=f) }}',
+{%- endfor %}
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'https://code.jquery.com/jquery-3.6.0.min.js'
+];
+
+function guardarPagina(url) {
+    // Cópia da rotina para reabrir sem conexão; redirecionamento = nenhuma rotina aberta
+    return fetch(url, {credentials: 'same-origin'}).then(response => {
+        if (response.ok && !response.redirected) {
+            return caches.open(CACHE_PAGINAS).then(cache => cache.put(url, response));
+        }
+    }).catch(() => null);
+}
+
+self.addEventListener('install', event => {
+    event.waitUntil(Promise.all([
+        caches.open(CACHE_ESTATICO).then(cache => Promise.all(PRECACHE.map(url =>
+            fetch(url, {mode: url.startsWith('http') ? 'no-cors' : 'same-origin'})
+                .then(response => cache.put(url, response))
+                .catch(() => null)
+        ))),
+        guardarPagina(PAGINA_INSPECAO)
+    ]).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys().then(nomes => Promise.all(nomes
+            .filter(nome => nome.startsWith('inc-manager-') && nome !== CACHE_ESTATICO && nome !== CACHE_PAGINAS)
+            .map(nome => caches.delete(nome))
+        )).then(() => self.clients.claim())
+    );
+});
+
+function paginaInspecao(request) {
+    // Rede primeiro; sem conexão, a última cópia da rotina (ou de qualquer rotina)
+    return fetch(request).then(response => {
+        if (response.ok && !response.redirected) {
+            const copia = response.clone();
+            caches.open(CACHE_PAGINAS).then(cache => cache.put(request, copia));
+        }
+        return response;
+    }).catch(() => caches.open(CACHE_PAGINAS).then(cache =>
+        cache.match(request).then(resposta => resposta || cache.match(request, {ignoreSearch: true}))
+    ).then(resposta => resposta || new Response(
+        '<h1>Sem conexão</h1><p>Abra a rotina de inspeção com a rede disponível ao menos uma vez.</p>',
+        {status: 503, headers: {'Content-Type': 'text/html; charset=utf-8'}}
+    )));
+}
+
+self.addEventListener('message', event => {
+    // A página que registrou o worker não passou por ele: ela pede para guardar a rotina carregada
+    const dados = event.data || {};
+    if (dados.tipo !== 'guardar-pagina') {
+        return;
+    }
+    const url = new URL(dados.url, self.location.href);
+    if (url.origin === self.location.origin && url.pathname === PAGINA_INSPECAO) {
+        event.waitUntil(guardarPagina(url.href));
+    }
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') {
+        return;
+    }
+    const url = new URL(request.url);
+    if (request.mode === 'navigate' && url.pathname === PAGINA_INSPECAO) {
+        event.respondWith(paginaInspecao(request));
+        return;
+    }
+    if (PRECACHE.includes(url.origin === self.location.origin ? url.pathname : request.url)) {
+        event.respondWith(
+            caches.match(request, {ignoreSearch: true}).then(resposta => resposta || fetch(request))
+        );
+    }
+});
@@ -0,0 +1,157 @@
+import json
+import base64
+import hashlib
+import secrets
+from functools import wraps
+from datetime import datetime, date
+from flask import request, g, abort, current_app
+from models import ApiToken
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional; sem ele a serialização usa o json da biblioteca padrão
+    orjson = None
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} não é serializável em JSON")
+
+
+def dumps(data):
+    """Serializa para JSON (bytes) com orjson quando disponível"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def json_response(data, status=200):
+    return current_app.response_class(dumps(data), status=status, mimetype='application/json')
+
+
+def api_error(status, message):
+    """Interrompe a requisição com um erro no formato JSON"""
+    response = json_response({'error': message}, status)
+    if status == 401:
+        response.headers['WWW-Authenticate'] = 'Bearer'
+    abort(response)
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def generate_token():
+    """Gera um novo token; retorna (token, hash). Só o hash é gravado no banco."""
+    token = secrets.token_urlsafe(32)
+    return token, hash_token(token)
+
+
+def api_token_required(view):
+    """Exige 'Authorization: Bearer <token>' de um token ativo"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not token.strip():
+            api_error(401, 'Token de acesso ausente.')
+        api_token = ApiToken.query.filter_by(token_hash=hash_token(token.strip()), revogado=False).first()
+        if api_token is None:
+            api_error(401, 'Token de acesso inválido ou revogado.')
+        g.api_token = api_token
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def parse_fields(model, default=None):
+    """Lê ?fields=a,b,c e valida contra as colunas do modelo"""
+    columns = model.__table__.columns.keys()
+    raw = request.args.get('fields')
+    if not raw:
+        return list(default or columns)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in columns]
+    if unknown:
+        api_error(400, f"Campos desconhecidos: {', '.join(unknown)}. Disponíveis: {', '.join(columns)}.")
+    return list(dict.fromkeys(fields))
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        api_error(400, 'Cursor inválido.')
+
+
+def parse_limit():
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    if limit is None or not 1 <= limit <= MAX_LIMIT:
+        api_error(400, f"limit deve estar entre 1 e {MAX_LIMIT}.")
+    return limit
+
+
+def keyset_page(query, model, fields, transforms=None, resume=False):
+    """Pagina por cursor (id crescente) buscando só as colunas pedidas.
+
+    Ao contrário de OFFSET, o custo de cada página não cresce com a posição.
+    Com resume=True o next_cursor vem sempre preenchido (última linha lida ou o
+    cursor recebido), para o cliente continuar de onde parou numa próxima execução.
+    """
+    transforms = transforms or {}
+    limit = parse_limit()
+    cursor = request.args.get('cursor')
+    if cursor:
+        query = query.filter(model.id > decode_cursor(cursor))
+    else:
+        cursor = None
+
+    # O id é sempre buscado porque é ele que monta o próximo cursor
+    selected = fields if 'id' in fields else ['id'] + fields
+    rows = query.with_entities(*[getattr(model, f) for f in selected]) \
+        .order_by(model.id).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    data = []
+    for row in rows:
+        item = {}
+        for field in fields:
+            value = getattr(row, field)
+            if field in transforms and value is not None:
+                value = transforms[field](value)
+            item[field] = value
+        data.append(item)
+    if resume:
+        return {
+            'data': data,
+            'next_cursor': encode_cursor(rows[-1].id) if rows else cursor,
+            'has_more': has_more,
+        }
+    return {
+        'data': data,
+        'next_cursor': encode_cursor(rows[-1].id) if has_more else None,
+    }
+
+
+def conditional_json(data):
+    """Resposta JSON com ETag do conteúdo; devolve 304 se o cliente já tiver essa versão"""
+    response = json_response(data)
+    response.set_etag(hashlib.blake2b(response.get_data(), digest_size=16).hexdigest())
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+def parse_json_text(value):
+    """Decodifica colunas Text que guardam JSON (fotos, registros); texto inválido volta como está"""
+    try:
+        return orjson.loads(value) if orjson is not None else json.loads(value)
+    except ValueError:
+        return value
@@ -0,0 +1,98 @@
+"""
+Log de alterações (append-only) de INC, Fornecedor e RotinaInspecao.
+
+Cada insert/update/delete feito pela sessão do ORM gera uma linha em
+change_log no mesmo flush, portanto na mesma transação da alteração. O id
+crescente do log serve de cursor para o feed /api/v1/changes; como as
+escritas passam por uma única conexão (utils.sqlite_profile), os ids ficam
+visíveis na ordem em que foram gravados.
+
+Instruções em lote (insert/update/delete do Core) não passam pelo flush e
+devem chamar record_changes explicitamente.
+"""
+import json
+from datetime import datetime
+from sqlalchemy import event, inspect
+from models import ChangeLog, INC, Fornecedor, RotinaInspecao
+from utils.sqlite_profile import RoutingSession
+
+OPERACOES = ('insert', 'update', 'delete')
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def snapshot(obj):
+    """Colunas do objeto serializadas em JSON"""
+    mapper = inspect(obj).mapper
+    return json.dumps({attr.key: getattr(obj, attr.key) for attr in mapper.column_attrs},
+                      ensure_ascii=False, default=_default)
+
+
+class ChangeTracker:
+    def __init__(self, app=None, models=(INC, Fornecedor, RotinaInspecao)):
+        self.tracked = {model: model.__tablename__ for model in models}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHANGE_LOG_ENABLED', True)
+        if not app.config['CHANGE_LOG_ENABLED']:
+            return
+        if not event.contains(RoutingSession, 'after_flush', self._after_flush):
+            event.listen(RoutingSession, 'after_flush', self._after_flush)
+        app.extensions['change_tracker'] = self
+
+    def _entidade(self, obj):
+        return self.tracked.get(type(obj))
+
+    def _after_flush(self, session, flush_context):
+        agora = datetime.utcnow()
+        linhas = []
+        for operacao, objetos in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+            for obj in objetos:
+                entidade = self._entidade(obj)
+                if entidade is None:
+                    continue
+                if operacao == 'update' and not session.is_modified(obj, include_collections=False):
+                    continue
+                linhas.append({
+                    'entidade': entidade,
+                    'entidade_id': obj.id,
+                    'operacao': operacao,
+                    'alterado_em': agora,
+                    'dados': None if operacao == 'delete' else snapshot(obj),
+                })
+        if linhas:
+            session.connection().execute(ChangeLog.__table__.insert(), linhas)
+
+
+def record_changes(session, model, ids, operacao):
+    """Registra alterações feitas por instruções em lote (fora do flush do ORM).
+
+    Grava o estado atual das linhas (ou só o id, para delete); chamar depois da
+    instrução e antes do commit, para ficar na mesma transação.
+    """
+    if operacao not in OPERACOES:
+        raise ValueError(f"operação inválida: {operacao}")
+    ids = list(ids)
+    if not ids:
+        return
+    agora = datetime.utcnow()
+    if operacao == 'delete':
+        linhas = [{'entidade': model.__tablename__, 'entidade_id': i, 'operacao': operacao,
+                   'alterado_em': agora, 'dados': None} for i in ids]
+    else:
+        linhas = []
+        for inicio in range(0, len(ids), 500):
+            objetos = session.query(model).filter(model.id.in_(ids[inicio:inicio + 500])) \
+                .execution_options(populate_existing=True).all()
+            linhas.extend({'entidade': model.__tablename__, 'entidade_id': obj.id, 'operacao': operacao,
+                           'alterado_em': agora, 'dados': snapshot(obj)} for obj in objetos)
+    session.execute(ChangeLog.__table__.insert(), linhas)
+
+
+change_tracker = ChangeTracker()
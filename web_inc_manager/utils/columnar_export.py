@@ -0,0 +1,221 @@
+"""
+Exportação colunar (Parquet e Arrow IPC) de INCs, fornecedores e registros
+de inspeção, para carga direta em pandas/DuckDB.
+
+As linhas são lidas do banco em lotes (yield_per) e cada lote vira um
+RecordBatch tipado: datas como date32 (a data DD-MM-YYYY das INCs é
+convertida no Arrow), inteiros como int64, horários como timestamp e as
+colunas de poucos valores distintos (fornecedor, item, status...) como
+dicionário. No Parquet cada lote é um row group; no Arrow IPC (formato
+stream) cada lote é enviado assim que fica pronto. O dicionário de cada
+coluna só cresce entre os lotes, então o stream leva apenas os valores
+novos (deltas).
+
+Os registros de inspeção saem do JSON das rotinas salvas, uma linha por
+item do relatório .lst.
+"""
+import json
+from itertools import islice
+from models import INC, Fornecedor, RotinaInspecao, User
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow é opcional; sem ele a exportação colunar fica indisponível
+    pa = pc = pq = None
+
+FORMATOS = ('parquet', 'arrow')
+MIMETYPES = {'parquet': 'application/vnd.apache.parquet', 'arrow': 'application/vnd.apache.arrow.stream'}
+
+# Tipos lógicos das colunas: int, float, bool, texto, categoria, data (DD-MM-YYYY), horario
+COLUNAS = {
+    'incs': (
+        ('id', 'int'), ('oc', 'int'), ('nf', 'int'), ('data', 'data'), ('representante', 'categoria'),
+        ('fornecedor', 'categoria'), ('item', 'categoria'), ('quantidade_recebida', 'int'),
+        ('quantidade_com_defeito', 'int'), ('descricao_defeito', 'texto'), ('urgencia', 'categoria'),
+        ('acao_recomendada', 'texto'), ('status', 'categoria'), ('created_at', 'horario'),
+    ),
+    'fornecedores': (
+        ('id', 'int'), ('razao_social', 'texto'), ('cnpj', 'texto'), ('fornecedor_logix', 'texto'),
+    ),
+    'inspecoes': (
+        ('rotina_id', 'int'), ('data_inspecao', 'horario'), ('inspetor', 'categoria'), ('num_aviso', 'int'),
+        ('oc', 'int'), ('item', 'categoria'), ('descricao', 'texto'), ('codigo_fornecedor', 'categoria'),
+        ('fornecedor', 'categoria'), ('razao_social', 'categoria'), ('qtd_recebida', 'float'),
+        ('inspecionado', 'bool'), ('adiado', 'bool'),
+    ),
+}
+ENTIDADES = tuple(COLUNAS)
+
+
+class ExportacaoIndisponivel(Exception):
+    """pyarrow não está instalado"""
+
+
+def disponivel():
+    return pa is not None
+
+
+def _exigir_pyarrow():
+    if pa is None:
+        raise ExportacaoIndisponivel("Exportação colunar requer o pacote pyarrow.")
+
+
+def _tipo(tipo):
+    return {
+        'int': pa.int64(), 'float': pa.float64(), 'bool': pa.bool_(), 'texto': pa.string(),
+        'categoria': pa.dictionary(pa.int32(), pa.string()), 'data': pa.date32(), 'horario': pa.timestamp('ms'),
+    }[tipo]
+
+
+def schema(entidade):
+    return pa.schema([(nome, _tipo(tipo)) for nome, tipo in COLUNAS[entidade]])
+
+
+def _inteiro(valor):
+    try:
+        return int(valor) if valor not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _decimal(valor):
+    try:
+        return float(valor) if valor not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+class _Lotes:
+    """Converte listas de tuplas em RecordBatches, com dicionários que crescem entre os lotes"""
+
+    def __init__(self, entidade):
+        self.colunas = COLUNAS[entidade]
+        self.schema = schema(entidade)
+        self.dicionarios = {nome: ([], {}) for nome, tipo in self.colunas if tipo == 'categoria'}
+
+    def _categoria(self, nome, valores):
+        lista, codigos = self.dicionarios[nome]
+        indices = []
+        for valor in valores:
+            if valor is None:
+                indices.append(None)
+                continue
+            codigo = codigos.get(valor)
+            if codigo is None:
+                codigo = codigos[valor] = len(lista)
+                lista.append(valor)
+            indices.append(codigo)
+        return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), pa.array(lista, pa.string()))
+
+    def _array(self, nome, tipo, valores):
+        if tipo == 'categoria':
+            return self._categoria(nome, [None if v is None else str(v) for v in valores])
+        if tipo == 'data':
+            # Conversão vetorizada; datas fora do formato ficam nulas
+            texto = pa.array(valores, pa.string())
+            datas = pc.strptime(texto, format='%d-%m-%Y', unit='s', error_is_null=True).cast(pa.date32())
+            # strptime aceita dias inexistentes (31-02 vira 02-03): a data formatada de volta tem que bater
+            validas = pc.equal(pc.strftime(datas, format='%d-%m-%Y'), texto)
+            return pc.if_else(validas, datas, pa.scalar(None, pa.date32()))
+        if tipo == 'int':
+            valores = [_inteiro(v) for v in valores]
+        elif tipo == 'float':
+            valores = [_decimal(v) for v in valores]
+        elif tipo == 'bool':
+            valores = [None if v is None else bool(v) for v in valores]
+        return pa.array(valores, _tipo(tipo))
+
+    def lote(self, linhas):
+        colunas = list(zip(*linhas))
+        return pa.RecordBatch.from_arrays(
+            [self._array(nome, tipo, valores) for (nome, tipo), valores in zip(self.colunas, colunas)],
+            schema=self.schema)
+
+
+def _em_lotes(linhas, tamanho):
+    linhas = iter(linhas)
+    while True:
+        lote = list(islice(linhas, tamanho))
+        if not lote:
+            return
+        yield lote
+
+
+def _linhas_inspecoes(query, tamanho):
+    # outerjoin: rotinas de inspetores já excluídos saem com inspetor nulo
+    rotinas = query.outerjoin(User, RotinaInspecao.inspetor_id == User.id) \
+        .with_entities(RotinaInspecao.id, RotinaInspecao.data_inspecao, User.username, RotinaInspecao.registros) \
+        .order_by(RotinaInspecao.id).yield_per(max(1, tamanho // 100))
+    for rotina_id, data_inspecao, inspetor, registros in rotinas:
+        for registro in json.loads(registros or '[]'):
+            yield (rotina_id, data_inspecao, inspetor, registro.get('num_aviso'), registro.get('oc_value'),
+                   registro.get('item'), registro.get('descricao'), registro.get('codigo_fornecedor'),
+                   registro.get('fornecedor'), registro.get('razao_social'), registro.get('qtd_recebida'),
+                   registro.get('inspecionado'), registro.get('adiado'))
+
+
+def _linhas(entidade, query, tamanho):
+    """Tuplas na ordem de COLUNAS[entidade]; `query` é de INC, Fornecedor ou RotinaInspecao"""
+    if entidade == 'inspecoes':
+        return _linhas_inspecoes(query, tamanho)
+    modelo = INC if entidade == 'incs' else Fornecedor
+    colunas = [getattr(modelo, nome) for nome, _ in COLUNAS[entidade]]
+    return query.with_entities(*colunas).order_by(modelo.id).yield_per(tamanho)
+
+
+def lotes(entidade, query, tamanho=50000):
+    """Gera os RecordBatches da exportação (um por row group)"""
+    _exigir_pyarrow()
+    if entidade not in COLUNAS:
+        raise ValueError(f"Entidade inválida: {entidade}")
+    conversor = _Lotes(entidade)
+    for linhas in _em_lotes(_linhas(entidade, query, tamanho), tamanho):
+        yield conversor.lote(linhas)
+
+
+def escrever_parquet(entidade, query, saida, tamanho=50000):
+    """Grava o Parquet em `saida` (arquivo ou caminho); retorna o número de linhas"""
+    _exigir_pyarrow()
+    total = 0
+    with pq.ParquetWriter(saida, schema(entidade), compression='zstd') as escritor:
+        for lote in lotes(entidade, query, tamanho):
+            escritor.write_batch(lote, row_group_size=tamanho)
+            total += lote.num_rows
+    return total
+
+
+class _Buffer:
+    """Destino do escritor IPC que acumula os bytes até o próximo envio"""
+
+    def __init__(self):
+        self.partes = []
+        self.closed = False
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def retirar(self):
+        dados = b''.join(self.partes)
+        self.partes = []
+        return dados
+
+
+def stream_arrow(entidade, query, tamanho=50000):
+    """Gera os bytes do Arrow IPC (formato stream), um pedaço por lote"""
+    _exigir_pyarrow()
+    buffer = _Buffer()
+    opcoes = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+    with pa.ipc.new_stream(buffer, schema(entidade), options=opcoes) as escritor:
+        for lote in lotes(entidade, query, tamanho):
+            escritor.write_batch(lote)
+            yield buffer.retirar()
+    yield buffer.retirar()
@@ -0,0 +1,130 @@
+import zlib
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # Brotli é opcional; sem ele só gzip é oferecido
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'text/html', 'text/css', 'text/csv', 'text/plain', 'text/javascript',
+    'application/javascript', 'application/json', 'application/xml', 'image/svg+xml',
+)
+
+
+def _accepted_encodings(header):
+    """Lê o Accept-Encoding e retorna as codificações aceitas (q > 0)"""
+    accepted = set()
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name and q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def _iter_bytes(chunks):
+    try:
+        for chunk in chunks:
+            yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+    finally:
+        # Fecha o iterável original (ex.: arquivo do send_file)
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def _gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 gera cabeçalho gzip
+    for chunk in _iter_bytes(chunks):
+        # Z_SYNC_FLUSH entrega cada bloco ao cliente sem esperar o fim da resposta
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _brotli_stream(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in _iter_bytes(chunks):
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class Compress:
+    """Compressão gzip/Brotli das respostas de texto (HTML, CSV, JSON...)"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BR_QUALITY', 4)
+        app.config.setdefault('COMPRESS_STREAM_BR_QUALITY', 1)
+        self.app = app
+        app.after_request(self.after_request)
+
+    def _choose_encoding(self, accept_encoding):
+        accepted = _accepted_encodings(accept_encoding)
+        if brotli is not None and 'br' in accepted:
+            return 'br'
+        if 'gzip' in accepted:
+            return 'gzip'
+        return None
+
+    def after_request(self, response):
+        config = self.app.config
+        if not config['COMPRESS_ENABLED']:
+            return response
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return response
+        if 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES:
+            return response
+        if 'X-Sendfile' in response.headers or 'X-Accel-Redirect' in response.headers:
+            return response
+
+        encoding = self._choose_encoding(request.headers.get('Accept-Encoding', ''))
+        response.vary.add('Accept-Encoding')
+        if encoding is None:
+            return response
+
+        if response.content_length is not None and response.content_length < config['COMPRESS_MIN_SIZE']:
+            return response
+
+        if response.is_streamed:
+            # Geradores e arquivos: comprime bloco a bloco sem montar o corpo inteiro
+            chunks = response.response
+            if encoding == 'br':
+                response.response = _brotli_stream(chunks, config['COMPRESS_STREAM_BR_QUALITY'])
+            else:
+                response.response = _gzip_stream(chunks, config['COMPRESS_GZIP_LEVEL'])
+            response.direct_passthrough = False
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if encoding == 'br':
+                body = brotli.compress(body, quality=config['COMPRESS_BR_QUALITY'])
+            else:
+                body = gzip.compress(body, compresslevel=config['COMPRESS_GZIP_LEVEL'], mtime=0)
+            response.set_data(body)
+
+        response.headers['Content-Encoding'] = encoding
+        # A representação mudou; o ETag forte deixa de valer byte a byte
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+compress = Compress()
@@ -0,0 +1,115 @@
+"""
+Impressora ZPL simulada para testes offline da fila de impressão.
+
+Uso: python -m utils.fake_printer --port 9100
+(e configure PRINTER_IP=127.0.0.1 PRINTER_PORT=9100)
+"""
+import time
+import socket
+import argparse
+import threading
+import socketserver
+
+
+class _ZPLHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+            server.active.add(self.request)
+        while True:
+            try:
+                data = self.request.recv(65536)
+            except OSError:
+                break
+            if not data:
+                break
+            if server.delay:
+                time.sleep(server.delay)
+            with server.lock:
+                server.received.extend(data)
+                server.labels += data.count(b"^XZ")
+            if server.on_data:
+                server.on_data(data)
+        with server.lock:
+            server.active.discard(self.request)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class FakePrinter:
+    """Servidor TCP que aceita ZPL como uma Zebra na porta 9100 e contabiliza as etiquetas"""
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.0, on_data=None):
+        self.server = _Server((host, port), _ZPLHandler)
+        self.server.lock = threading.Lock()
+        self.server.received = bytearray()
+        self.server.labels = 0
+        self.server.connections = 0
+        self.server.active = set()
+        self.server.delay = delay
+        self.server.on_data = on_data
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    @property
+    def received(self):
+        with self.server.lock:
+            return bytes(self.server.received)
+
+    @property
+    def labels(self):
+        return self.server.labels
+
+    @property
+    def connections(self):
+        return self.server.connections
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Desliga a impressora, derrubando também as conexões abertas"""
+        self.server.shutdown()
+        self.server.server_close()
+        with self.server.lock:
+            for conn in list(self.server.active):
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Impressora ZPL simulada")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--delay", type=float, default=0.0, help="atraso por pacote recebido (s)")
+    args = parser.parse_args()
+
+    def _log(data):
+        print(f"{len(data)} bytes recebidos")
+
+    printer = FakePrinter(args.host, args.port, args.delay, on_data=_log)
+    print(f"Impressora simulada ouvindo em {args.host}:{args.port}")
+    try:
+        printer.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        printer.server.server_close()
+        print(f"{printer.labels} etiquetas recebidas em {printer.connections} conexões")
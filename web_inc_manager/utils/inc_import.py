@@ -0,0 +1,231 @@
+"""
+Importação em lote de INCs a partir de CSV ou XLSX.
+
+O arquivo é lido linha a linha (sem carregar tudo na memória), cada linha
+passa pelas mesmas validações do cadastro_inc e as válidas são inseridas em
+lotes, cada lote numa transação com os números de OC alocados de uma vez.
+As linhas rejeitadas vão para um relatório CSV com o motivo.
+"""
+import io
+import csv
+import unicodedata
+from datetime import datetime, date
+import chardet
+from sqlalchemy import insert, func
+from models import db, INC, Fornecedor
+from utils.security import validate_item_format
+from utils.sqlite_profile import begin_write
+from utils.change_log import record_changes
+from utils.item_stats import refresh_inc_items
+from utils.supplier_ppm import refresh_supplier_months
+
+URGENCIAS = ("Crítico", "Moderada", "Leve")
+STATUS = ("Em andamento", "Concluída", "Vencida")
+COLUNAS_OBRIGATORIAS = ('nf', 'representante', 'fornecedor', 'item', 'quantidade_recebida', 'quantidade_com_defeito')
+FORMATOS_DATA = ("%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%d")
+
+# Variações de cabeçalho aceitas (já normalizadas) -> campo da INC
+ALIASES = {
+    'nota_fiscal': 'nf', 'numero_nf': 'nf',
+    'qtd_recebida': 'quantidade_recebida', 'quantidade': 'quantidade_recebida',
+    'qtd_com_defeito': 'quantidade_com_defeito', 'qtd_defeito': 'quantidade_com_defeito',
+    'quantidade_defeito': 'quantidade_com_defeito',
+    'defeito': 'descricao_defeito', 'descricao': 'descricao_defeito',
+    'acao': 'acao_recomendada', 'codigo_item': 'item',
+}
+
+
+def normalizar_cabecalho(nome):
+    nome = unicodedata.normalize('NFKD', str(nome or '')).encode('ascii', 'ignore').decode()
+    nome = '_'.join(nome.strip().lower().replace('-', ' ').split())
+    return ALIASES.get(nome, nome)
+
+
+def iter_csv(stream):
+    inicio = stream.read(64 * 1024)
+    stream.seek(0)
+    encoding = chardet.detect(inicio)['encoding'] or 'utf-8'
+    if encoding.lower() == 'ascii':
+        encoding = 'utf-8'
+    amostra = inicio.decode(encoding, errors='ignore')
+    try:
+        dialect = csv.Sniffer().sniff(amostra.split('\n', 1)[0], delimiters=';,\t')
+    except csv.Error:
+        dialect = csv.excel
+    if encoding.lower().replace('-', '') == 'utf8':
+        encoding = 'utf-8-sig'
+    texto = io.TextIOWrapper(stream, encoding=encoding, errors='replace', newline='')
+    yield from csv.reader(texto, dialect)
+
+
+def _iter_xlsx(stream):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def iter_linhas(stream, filename):
+    """Gera (número da linha, dict) a partir do CSV/XLSX; a primeira linha é o cabeçalho"""
+    if filename.lower().endswith('.xlsx'):
+        linhas = _iter_xlsx(stream)
+    elif filename.lower().endswith(('.csv', '.txt')):
+        linhas = iter_csv(stream)
+    else:
+        raise ValueError("Formato não suportado. Use .csv ou .xlsx.")
+
+    cabecalho = None
+    for numero, valores in enumerate(linhas, start=1):
+        if cabecalho is None:
+            cabecalho = [normalizar_cabecalho(v) for v in valores]
+            faltando = [c for c in COLUNAS_OBRIGATORIAS if c not in cabecalho]
+            if faltando:
+                raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(faltando)}")
+            continue
+        if not any(v not in (None, '') for v in valores):
+            continue
+        yield numero, dict(zip(cabecalho, valores))
+
+
+class FornecedorLookup:
+    """Resolve o fornecedor pela razão social, CNPJ ou código Logix"""
+
+    def __init__(self):
+        self.por_chave = {}
+        for razao, cnpj, logix in db.session.query(Fornecedor.razao_social, Fornecedor.cnpj,
+                                                   Fornecedor.fornecedor_logix):
+            self.por_chave.setdefault(razao.strip().lower(), razao)
+            self.por_chave.setdefault(''.join(c for c in cnpj if c.isdigit()), razao)
+            self.por_chave.setdefault(str(logix).strip(), razao)
+
+    def get(self, valor):
+        valor = str(valor).strip()
+        digitos = ''.join(c for c in valor if c.isdigit())
+        return (self.por_chave.get(valor.lower()) or self.por_chave.get(valor)
+                or (self.por_chave.get(digitos) if len(digitos) == 14 else None))
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def _inteiro(valor, campo):
+    texto = _texto(valor)
+    try:
+        return int(float(texto.replace(',', '.'))) if texto else None
+    except ValueError:
+        raise ValueError(f"{campo} deve ser numérico")
+
+
+def _data(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.strftime("%d-%m-%Y")
+    texto = _texto(valor)
+    if not texto:
+        return datetime.today().strftime("%d-%m-%Y")
+    for formato in FORMATOS_DATA:
+        try:
+            return datetime.strptime(texto[:10], formato).strftime("%d-%m-%Y")
+        except ValueError:
+            continue
+    raise ValueError(f"data inválida: {texto}")
+
+
+def validar_linha(linha, fornecedores):
+    """Aplica as regras do cadastro_inc; retorna o dict pronto para inserir ou levanta ValueError"""
+    nf = _inteiro(linha.get('nf'), 'nf')
+    if nf is None:
+        raise ValueError("nf é obrigatória")
+    item = _texto(linha.get('item')).upper()
+    if not validate_item_format(item):
+        raise ValueError("formato do item inválido (ex.: MPR.02199)")
+    recebida = _inteiro(linha.get('quantidade_recebida'), 'quantidade_recebida')
+    defeito = _inteiro(linha.get('quantidade_com_defeito'), 'quantidade_com_defeito')
+    if recebida is None or defeito is None:
+        raise ValueError("quantidades são obrigatórias")
+    if recebida < 0 or defeito < 0:
+        raise ValueError("quantidades não podem ser negativas")
+    if defeito > recebida:
+        raise ValueError("quantidade com defeito maior que a quantidade recebida")
+    representante = _texto(linha.get('representante'))
+    if not representante:
+        raise ValueError("representante é obrigatório")
+    fornecedor = fornecedores.get(_texto(linha.get('fornecedor')))
+    if fornecedor is None:
+        raise ValueError(f"fornecedor não cadastrado: {_texto(linha.get('fornecedor'))}")
+    urgencia = _texto(linha.get('urgencia')) or 'Moderada'
+    if urgencia not in URGENCIAS:
+        raise ValueError(f"urgência inválida: {urgencia}")
+    status = _texto(linha.get('status')) or 'Em andamento'
+    if status not in STATUS:
+        raise ValueError(f"status inválido: {status}")
+
+    return {
+        'nf': nf,
+        'data': _data(linha.get('data')),
+        'representante': representante[:100],
+        'fornecedor': fornecedor,
+        'item': item,
+        'quantidade_recebida': recebida,
+        'quantidade_com_defeito': defeito,
+        'descricao_defeito': _texto(linha.get('descricao_defeito')),
+        'urgencia': urgencia,
+        'acao_recomendada': _texto(linha.get('acao_recomendada')),
+        'fotos': '[]',
+        'status': status,
+    }
+
+
+def _inserir_lote(lote):
+    """Insere um lote numa transação, alocando os OCs em sequência"""
+    begin_write(db.session)
+    ultimo_oc = db.session.query(func.max(INC.oc)).scalar() or 0
+    agora = datetime.utcnow()
+    for i, linha in enumerate(lote, start=1):
+        linha['oc'] = ultimo_oc + i
+        linha['created_at'] = agora
+    ids = db.session.execute(insert(INC).returning(INC.id), lote).scalars().all()
+    record_changes(db.session, INC, ids, 'insert')
+    refresh_inc_items(db.session, {linha['item'] for linha in lote})
+    refresh_supplier_months(db.session, {(linha['fornecedor'], linha['data']) for linha in lote})
+    db.session.commit()
+    return len(ids)
+
+
+def importar_incs(stream, filename, relatorio, batch_size=5000):
+    """Importa as INCs do arquivo; as linhas com erro são escritas no CSV `relatorio`.
+
+    Retorna {'inseridas': n, 'erros': n, 'primeiros_erros': [...]}. Precisa de app context.
+    """
+    fornecedores = FornecedorLookup()
+    escritor = csv.writer(relatorio, delimiter=';')
+    escritor.writerow(['linha', 'erro', 'nf', 'item', 'fornecedor'])
+    inseridas = 0
+    erros = 0
+    primeiros_erros = []
+    lote = []
+
+    for numero, linha in iter_linhas(stream, filename):
+        try:
+            lote.append(validar_linha(linha, fornecedores))
+        except ValueError as e:
+            erros += 1
+            if len(primeiros_erros) < 50:
+                primeiros_erros.append((numero, str(e)))
+            escritor.writerow([numero, str(e), _texto(linha.get('nf')), _texto(linha.get('item')),
+                               _texto(linha.get('fornecedor'))])
+            continue
+        if len(lote) >= batch_size:
+            inseridas += _inserir_lote(lote)
+            lote = []
+    if lote:
+        inseridas += _inserir_lote(lote)
+
+    return {'inseridas': inseridas, 'erros': erros, 'primeiros_erros': primeiros_erros}
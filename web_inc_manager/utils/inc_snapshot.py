@@ -0,0 +1,382 @@
+"""
+Snapshot colunar (NumPy) das INCs para análises ad hoc.
+
+A tabela INC fica em memória como arrays ordenados por id: data em dias
+desde 1970, códigos inteiros para fornecedor, item, representante, status e
+urgência (o código é a posição do valor numa lista que só cresce) e as
+quantidades. Agrupamentos, histogramas e percentis são operações
+vetorizadas sobre esses arrays (bincount, histogram, percentile), sem
+consultar o SQLite.
+
+A atualização é incremental pelo change_log: o snapshot guarda o último id
+do log aplicado; a cada consulta (no máximo a cada
+INC_SNAPSHOT_CHECK_INTERVAL segundos, ou logo depois de um commit de INC
+deste processo) só as INCs inseridas/alteradas depois dele são relidas e as
+removidas são descartadas. Sem o change_log, ou com alterações demais
+pendentes, o snapshot é recarregado inteiro.
+
+Cada versão do snapshot é imutável: a atualização monta arrays novos e troca
+a referência, então as consultas em andamento não veem estados parciais.
+"""
+import time
+import threading
+from collections import namedtuple
+import numpy as np
+from sqlalchemy import event, func, select
+from models import db, INC, ChangeLog, data_iso
+from utils.sqlite_profile import RoutingSession
+
+CATEGORIAS = ('fornecedor', 'item', 'representante', 'status', 'urgencia')
+QUANTIDADES = ('quantidade_recebida', 'quantidade_com_defeito')
+DIMENSOES = CATEGORIAS + ('mes',)
+CAMPOS = QUANTIDADES + ('taxa_defeito',)  # taxa = % da quantidade recebida com defeito
+ORDENS = ('incs', 'defeito', 'recebida', 'taxa', 'valor')
+PERCENTIS = (50, 75, 90, 95, 99)
+SEM_DATA = np.iinfo(np.int32).min  # data ausente ou fora do formato DD-MM-YYYY
+IDADE_MAXIMA = 300  # segundos; sem change_log, recarga para ver alterações de outros processos
+
+LinhaGrupo = namedtuple('LinhaGrupo', 'valor incs defeito recebida taxa')
+
+
+class _Categorias:
+    """Valores distintos de uma coluna; o código é a posição na lista"""
+
+    def __init__(self):
+        self.valores = []
+        self.codigos = {}
+
+    def codificar(self, valores):
+        """Array de códigos dos valores, acrescentando os novos à lista"""
+        if not valores:
+            return np.zeros(0, np.int32)
+        unicos, inverso = np.unique(np.asarray(valores, dtype=object), return_inverse=True)
+        mapa = np.empty(len(unicos), np.int32)
+        for i, valor in enumerate(unicos):
+            codigo = self.codigos.get(valor)
+            if codigo is None:
+                codigo = self.codigos[valor] = len(self.valores)
+                self.valores.append(valor)
+            mapa[i] = codigo
+        return mapa[inverso.ravel()]
+
+
+class _Colunas:
+    """Uma versão do snapshot: arrays alinhados, ordenados por id"""
+
+    def __init__(self, arrays, cursor):
+        self.arrays = arrays
+        self.cursor = cursor
+        self.carregado_em = time.time()
+
+    def __len__(self):
+        return len(self.arrays['id'])
+
+    def __getitem__(self, coluna):
+        return self.arrays[coluna]
+
+    @property
+    def bytes(self):
+        return sum(a.nbytes for a in self.arrays.values())
+
+
+def _dias(datas):
+    """'YYYY-MM-DD' -> dias desde 1970 (SEM_DATA para valores inválidos)"""
+    try:
+        dias = np.array(datas, dtype='datetime64[D]')
+    except ValueError:
+        dias = np.array([_dia_ou_nat(d) for d in datas], dtype='datetime64[D]')
+    inteiros = dias.astype(np.int64)
+    inteiros[np.isnat(dias)] = SEM_DATA
+    return inteiros.astype(np.int32)
+
+
+def _dia_ou_nat(data):
+    try:
+        return np.datetime64(data, 'D')
+    except ValueError:
+        return np.datetime64('NaT', 'D')
+
+
+def dia(data):
+    """'YYYY-MM-DD' -> dia do snapshot; None para vazio/inválido"""
+    if not data:
+        return None
+    valor = _dia_ou_nat(data)
+    return None if np.isnat(valor) else int(valor.astype(np.int64))
+
+
+def _vazio():
+    arrays = {'id': np.zeros(0, np.int64), 'dia': np.zeros(0, np.int32)}
+    arrays.update((campo, np.zeros(0, np.int32)) for campo in CATEGORIAS)
+    arrays.update((campo, np.zeros(0, np.int64)) for campo in QUANTIDADES)
+    return arrays
+
+
+class IncSnapshot:
+    def __init__(self, app=None):
+        self.lock = threading.Lock()  # uma atualização por vez
+        self.atual = None
+        self.categorias = {campo: _Categorias() for campo in CATEGORIAS}
+        self.conferido_em = 0.0
+        self.pendente = False
+        self.intervalo = 1.0
+        self.max_alteracoes = 50000
+        self.lote = 20000
+        self.incremental = True
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('INC_SNAPSHOT_CHECK_INTERVAL', 1.0)
+        app.config.setdefault('INC_SNAPSHOT_MAX_DELTA', 50000)
+        app.config.setdefault('INC_SNAPSHOT_BATCH_SIZE', 20000)
+        self.intervalo = app.config['INC_SNAPSHOT_CHECK_INTERVAL']
+        self.max_alteracoes = app.config['INC_SNAPSHOT_MAX_DELTA']
+        self.lote = app.config['INC_SNAPSHOT_BATCH_SIZE']
+        # Sem o log de alterações não há como saber o que mudou: recarrega tudo
+        self.incremental = app.config.get('CHANGE_LOG_ENABLED', True)
+        if not event.contains(RoutingSession, 'after_flush', self._after_flush):
+            event.listen(RoutingSession, 'after_flush', self._after_flush)
+            event.listen(RoutingSession, 'after_commit', self._after_commit)
+            event.listen(RoutingSession, 'after_rollback', self._after_rollback)
+        self.invalidate()
+        app.extensions['inc_snapshot'] = self
+
+    def invalidate(self):
+        """Descarta o snapshot; a próxima consulta recarrega tudo"""
+        with self.lock:
+            self.atual = None
+            self.categorias = {campo: _Categorias() for campo in CATEGORIAS}
+            self.conferido_em = 0.0
+            self.pendente = False
+
+    def _after_flush(self, session, flush_context):
+        if any(isinstance(obj, INC) for obj in (*session.new, *session.dirty, *session.deleted)):
+            session.info['inc_snapshot'] = True
+
+    def _after_commit(self, session):
+        # Só depois do commit a alteração fica visível para a leitura do snapshot
+        if session.info.pop('inc_snapshot', False):
+            self.conferido_em = 0.0
+            self.pendente = True
+
+    def _after_rollback(self, session):
+        session.info.pop('inc_snapshot', False)
+
+    # ----- carga -----
+
+    def _ler(self, filtro=None):
+        """Gera dicionários de arrays com as colunas das INCs (em lotes de self.lote)"""
+        consulta = select(INC.id, data_iso(INC.data),
+                          *(func.coalesce(getattr(INC, campo), '') for campo in CATEGORIAS),
+                          *(func.coalesce(getattr(INC, campo), 0) for campo in QUANTIDADES)).order_by(INC.id)
+        if filtro is not None:
+            consulta = consulta.where(filtro)
+        # Core direto na conexão de leitura: sem o processamento de linhas do ORM
+        resultado = db.session.connection().execute(consulta.execution_options(yield_per=self.lote))
+        for linhas in resultado.partitions():
+            colunas = list(zip(*linhas))
+            arrays = {'id': np.array(colunas[0], np.int64), 'dia': _dias(colunas[1])}
+            for i, campo in enumerate(CATEGORIAS, start=2):
+                arrays[campo] = self.categorias[campo].codificar(colunas[i])
+            for i, campo in enumerate(QUANTIDADES, start=2 + len(CATEGORIAS)):
+                arrays[campo] = np.array(colunas[i], np.int64)
+            yield arrays
+
+    def _cursor(self):
+        return db.session.query(func.max(ChangeLog.id)).scalar() or 0
+
+    def _carregar(self):
+        # O cursor é lido antes das INCs: o que mudar durante a carga é reaplicado depois
+        cursor = self._cursor()
+        partes = list(self._ler())
+        arrays = {campo: np.concatenate([p[campo] for p in partes]) for campo in partes[0]} if partes else _vazio()
+        return _Colunas(arrays, cursor)
+
+    def _alteracoes(self, cursor):
+        """{id da INC: última operação} depois do cursor; None se passar de max_alteracoes"""
+        # Filtra pela chave primária (faixa de ids); o índice de entidade faria varrer o log inteiro de INC
+        linhas = db.session.execute(
+            select(ChangeLog.id, ChangeLog.entidade, ChangeLog.entidade_id, ChangeLog.operacao)
+            .where(ChangeLog.id > cursor).order_by(ChangeLog.id).limit(self.max_alteracoes + 1)).all()
+        if len(linhas) > self.max_alteracoes:
+            return None, cursor
+        operacoes = {}
+        for _, entidade, entidade_id, operacao in linhas:
+            if entidade == INC.__tablename__:
+                operacoes[entidade_id] = operacao
+        return operacoes, (linhas[-1][0] if linhas else cursor)
+
+    def _aplicar(self, colunas, operacoes, cursor):
+        ids = np.fromiter(operacoes, np.int64, len(operacoes))
+        alterados = [i for i, operacao in operacoes.items() if operacao != 'delete']
+        partes = []
+        for inicio in range(0, len(alterados), 500):
+            partes.extend(self._ler(INC.id.in_(alterados[inicio:inicio + 500])))
+        # Remove as linhas tocadas (apagadas ou alteradas) e acrescenta o estado atual das que ainda existem
+        manter = ~np.isin(colunas['id'], ids)
+        arrays = {campo: np.concatenate([colunas[campo][manter]] + [p[campo] for p in partes])
+                  for campo in colunas.arrays}
+        if len(arrays['id']) > 1 and np.any(arrays['id'][1:] < arrays['id'][:-1]):
+            ordem = np.argsort(arrays['id'], kind='stable')
+            arrays = {campo: valores[ordem] for campo, valores in arrays.items()}
+        return _Colunas(arrays, cursor)
+
+    def refresh(self, forcar=False):
+        """Atualiza o snapshot se o intervalo passou (ou com forcar); retorna a versão atual"""
+        agora = time.monotonic()
+        atual = self.atual
+        if atual is not None and not forcar and agora - self.conferido_em < self.intervalo:
+            return atual
+        # Outra thread já está atualizando: usa a versão anterior em vez de esperar
+        if not self.lock.acquire(blocking=atual is None or forcar):
+            return atual
+        try:
+            atual = self.atual
+            pendente, self.pendente = self.pendente, False
+            if atual is None or forcar:
+                atual = self._carregar()
+            elif not self.incremental:
+                if pendente or time.time() - atual.carregado_em > IDADE_MAXIMA:
+                    atual = self._carregar()
+            else:
+                operacoes, cursor = self._alteracoes(atual.cursor)
+                if operacoes is None:
+                    atual = self._carregar()
+                elif operacoes:
+                    atual = self._aplicar(atual, operacoes, cursor)
+                elif cursor != atual.cursor:
+                    atual = _Colunas(atual.arrays, cursor)
+            self.atual = atual
+            self.conferido_em = time.monotonic()
+            return atual
+        finally:
+            self.lock.release()
+
+    # ----- consultas -----
+
+    def _mascara(self, colunas, filtros):
+        """Linhas que atendem aos filtros: de/ate ('YYYY-MM-DD') e valor exato das categorias"""
+        filtros = filtros or {}
+        mascara = np.ones(len(colunas), bool)
+        de, ate = dia(filtros.get('de')), dia(filtros.get('ate'))
+        if de is not None:
+            mascara &= colunas['dia'] >= de
+        if ate is not None:
+            mascara &= (colunas['dia'] <= ate) & (colunas['dia'] != SEM_DATA)
+        for campo in CATEGORIAS:
+            valor = filtros.get(campo)
+            if valor:
+                codigo = self.categorias[campo].codigos.get(valor)
+                if codigo is None:
+                    return np.zeros(len(colunas), bool)
+                mascara &= colunas[campo] == codigo
+        return mascara
+
+    def _valores(self, colunas, campo, mascara):
+        if campo not in CAMPOS:
+            raise ValueError(f"Campo inválido: {campo}")
+        if campo != 'taxa_defeito':
+            return colunas[campo][mascara].astype(np.float64)
+        recebida = colunas['quantidade_recebida'][mascara]
+        defeito = colunas['quantidade_com_defeito'][mascara]
+        com_recebimento = recebida > 0
+        return defeito[com_recebimento] / recebida[com_recebimento] * 100
+
+    def _grupos(self, colunas, por, mascara):
+        """(códigos das linhas da máscara, rótulos dos códigos, máscara ajustada)"""
+        if por not in DIMENSOES:
+            raise ValueError(f"Dimensão inválida: {por}")
+        if por != 'mes':
+            return colunas[por][mascara], self.categorias[por].valores, mascara
+        mascara = mascara & (colunas['dia'] != SEM_DATA)
+        meses = colunas['dia'][mascara].astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        if not len(meses):
+            return meses, [], mascara
+        inicio = meses.min()
+        rotulos = [str(np.datetime64(int(m), 'M')) for m in range(inicio, meses.max() + 1)]
+        return meses - inicio, rotulos, mascara
+
+    def resumo(self, filtros=None):
+        colunas = self.refresh()
+        mascara = self._mascara(colunas, filtros)
+        recebida = int(colunas['quantidade_recebida'][mascara].sum())
+        defeito = int(colunas['quantidade_com_defeito'][mascara].sum())
+        return {'incs': int(mascara.sum()), 'recebida': recebida, 'defeito': defeito,
+                'taxa': defeito / recebida * 100 if recebida else None,
+                'linhas': len(colunas), 'cursor': colunas.cursor, 'bytes': colunas.bytes,
+                'carregado_em': colunas.carregado_em}
+
+    def agrupar(self, por, filtros=None, ordem='incs', limite=None):
+        """Linhas (valor, INCs, qtd. com defeito, qtd. recebida, taxa %) por valor da dimensão"""
+        if ordem not in ORDENS:
+            raise ValueError(f"Ordem inválida: {ordem}")
+        colunas = self.refresh()
+        codigos, rotulos, mascara = self._grupos(colunas, por, self._mascara(colunas, filtros))
+        tamanho = len(rotulos)
+        incs = np.bincount(codigos, minlength=tamanho)
+        defeito = np.bincount(codigos, weights=colunas['quantidade_com_defeito'][mascara], minlength=tamanho)
+        recebida = np.bincount(codigos, weights=colunas['quantidade_recebida'][mascara], minlength=tamanho)
+        taxa = np.divide(defeito * 100, recebida, out=np.full(tamanho, np.nan), where=recebida > 0)
+        presentes = np.flatnonzero(incs)
+        if ordem != 'valor':
+            chave = {'incs': incs, 'defeito': defeito, 'recebida': recebida, 'taxa': np.nan_to_num(taxa, nan=-1)}[ordem]
+            presentes = presentes[np.argsort(-chave[presentes], kind='stable')]
+        elif por != 'mes':
+            presentes = sorted(presentes, key=lambda i: rotulos[i])
+        if limite:
+            presentes = presentes[:limite]
+        return [LinhaGrupo(rotulos[i], int(incs[i]), int(defeito[i]), int(recebida[i]),
+                           None if np.isnan(taxa[i]) else float(taxa[i])) for i in presentes]
+
+    def histograma(self, campo, filtros=None, faixas=20):
+        """Contagem de INCs por faixa de valores do campo"""
+        colunas = self.refresh()
+        valores = self._valores(colunas, campo, self._mascara(colunas, filtros))
+        if not len(valores):
+            return {'contagens': [], 'limites': []}
+        contagens, limites = np.histogram(valores, bins=faixas)
+        return {'contagens': contagens.tolist(), 'limites': limites.tolist()}
+
+    def percentis(self, campo, filtros=None, q=PERCENTIS, por=None, limite=10):
+        """Percentis do campo no total e, com `por`, nos `limite` grupos com mais INCs"""
+        colunas = self.refresh()
+        mascara = self._mascara(colunas, filtros)
+        q = np.asarray(q, np.float64)
+        valores = self._valores(colunas, campo, mascara)
+        resultado = {'q': q.tolist(), 'total': np.percentile(valores, q).tolist() if len(valores) else None,
+                     'grupos': []}
+        if not por:
+            return resultado
+
+        codigos, rotulos, mascara = self._grupos(colunas, por, mascara)
+        if campo == 'taxa_defeito':
+            recebida = colunas['quantidade_recebida'][mascara]
+            codigos = codigos[recebida > 0]
+        valores = self._valores(colunas, campo, mascara)
+        if not len(valores):
+            return resultado
+        # Só as linhas dos grupos com mais INCs entram na ordenação
+        contagem = np.bincount(codigos)
+        maiores = np.argsort(-contagem, kind='stable')[:limite]
+        maiores = maiores[contagem[maiores] > 0]
+        dos_maiores = np.isin(codigos, maiores)
+        codigos, valores = codigos[dos_maiores], valores[dos_maiores]
+        # Ordena por (grupo, valor): cada grupo vira uma faixa contígua
+        ordem = np.lexsort((valores, codigos))
+        codigos, valores = codigos[ordem], valores[ordem]
+        grupos, inicios, tamanhos = np.unique(codigos, return_index=True, return_counts=True)
+        ordem = np.argsort(-tamanhos, kind='stable')
+        grupos, inicios, tamanhos = grupos[ordem], inicios[ordem], tamanhos[ordem]
+        # Interpolação linear (a mesma de np.percentile) para todos os grupos de uma vez
+        posicoes = (tamanhos[:, None] - 1) * q[None, :] / 100
+        abaixo = np.floor(posicoes).astype(np.int64)
+        acima = np.ceil(posicoes).astype(np.int64)
+        inferior = valores[inicios[:, None] + abaixo]
+        superior = valores[inicios[:, None] + acima]
+        tabela = inferior + (superior - inferior) * (posicoes - abaixo)
+        resultado['grupos'] = [(rotulos[g], int(n), linha.tolist()) for g, n, linha in zip(grupos, tamanhos, tabela)]
+        return resultado
+
+
+inc_snapshot = IncSnapshot()
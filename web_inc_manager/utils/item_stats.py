@@ -0,0 +1,211 @@
+"""
+Cadastro de itens com estatísticas pré-calculadas.
+
+A tabela item guarda, por código, a última descrição lida dos relatórios
+.lst e contadores acumulados, para que as telas de item não precisem
+varrer INCs nem decodificar o JSON das rotinas:
+
+- quantidade recebida, vezes inspecionado e vezes adiado: somados quando a
+  rotina é salva (a quantidade conta só para registros inspecionados, já que
+  um item adiado volta num relatório seguinte);
+- total de INCs e quantidade com defeito: recalculados para os itens
+  afetados a cada escrita de INC, com um GROUP BY pelo índice ix_inc_item.
+  Alterações pelo ORM são capturadas no flush; instruções em lote do Core
+  devem chamar refresh_inc_items (como record_changes).
+
+reconstruir_itens refaz todos os contadores a partir do histórico.
+"""
+import json
+from datetime import datetime
+from collections import defaultdict
+from sqlalchemy import event, inspect, select, func, bindparam, case
+from sqlalchemy.schema import CreateIndex
+from models import db, Item, INC, RotinaInspecao
+from utils.sqlite_profile import RoutingSession, begin_write
+
+tabela = Item.__table__
+CONTADORES = ('qtd_recebida', 'vezes_inspecionado', 'vezes_adiado', 'total_incs', 'qtd_defeito')
+
+
+def codigo_item(valor):
+    return str(valor or '').strip().upper()
+
+
+def _partes(valores, tamanho=500):
+    valores = list(valores)
+    for inicio in range(0, len(valores), tamanho):
+        yield valores[inicio:inicio + tamanho]
+
+
+def _garantir(conexao, codigos, descricoes=None):
+    """Cria os itens que ainda não existem e atualiza as descrições que mudaram"""
+    descricoes = descricoes or {}
+    agora = datetime.utcnow()
+    existentes = {}
+    for parte in _partes(codigos):
+        existentes.update(conexao.execute(
+            select(tabela.c.codigo, tabela.c.descricao).where(tabela.c.codigo.in_(parte))).all())
+    novos = [{'codigo': c, 'descricao': descricoes.get(c, ''), 'atualizado_em': agora}
+             for c in codigos if c not in existentes]
+    if novos:
+        conexao.execute(tabela.insert(), novos)
+    alterados = [{'b_codigo': c, 'descricao': d} for c, d in descricoes.items()
+                 if d and c in existentes and existentes[c] != d]
+    if alterados:
+        conexao.execute(tabela.update().where(tabela.c.codigo == bindparam('b_codigo'))
+                        .values(descricao=bindparam('descricao'), atualizado_em=agora), alterados)
+
+
+def _totais_incs(conexao, codigos=None):
+    """{código: (INCs, quantidade com defeito)}; sem códigos, de todos os itens"""
+    consulta = select(INC.item, func.count(), func.coalesce(func.sum(INC.quantidade_com_defeito), 0)) \
+        .group_by(INC.item)
+    if codigos is None:
+        return {codigo: (total, defeito) for codigo, total, defeito in conexao.execute(consulta)}
+    totais = {}
+    for parte in _partes(codigos):
+        totais.update((codigo, (total, defeito)) for codigo, total, defeito
+                      in conexao.execute(consulta.where(INC.item.in_(parte))))
+    return totais
+
+
+def _recalcular_incs(conexao, codigos):
+    codigos = sorted({codigo_item(c) for c in codigos} - {''})
+    if not codigos:
+        return
+    _garantir(conexao, codigos)
+    totais = _totais_incs(conexao, codigos)
+    conexao.execute(
+        tabela.update().where(tabela.c.codigo == bindparam('b_codigo'))
+        .values(total_incs=bindparam('total_incs'), qtd_defeito=bindparam('qtd_defeito'),
+                atualizado_em=datetime.utcnow()),
+        [{'b_codigo': c, 'total_incs': totais.get(c, (0, 0))[0], 'qtd_defeito': totais.get(c, (0, 0))[1]}
+         for c in codigos])
+
+
+def _acumular(registros, acumulado, descricoes):
+    """Soma os registros de uma rotina salva no dicionário por código"""
+    for registro in registros:
+        codigo = codigo_item(registro.get('item'))
+        if not codigo:
+            continue
+        contagem = acumulado[codigo]
+        if registro.get('inspecionado'):
+            contagem['qtd'] += float(registro.get('qtd_recebida') or 0)
+            contagem['inspecionados'] += 1
+        elif registro.get('adiado'):
+            contagem['adiados'] += 1
+        if registro.get('descricao'):
+            descricoes[codigo] = str(registro['descricao']).strip()
+
+
+def refresh_inc_items(session, codigos):
+    """Recalcula os contadores de INC dos itens; chamar depois de insert/update/delete em lote de INC"""
+    begin_write(session)
+    _recalcular_incs(session.connection(), codigos)
+
+
+def registrar_descricoes(session, registros):
+    """Cria/atualiza os itens de um relatório .lst (só a descrição; os contadores vêm ao salvar a rotina)"""
+    descricoes = {}
+    for registro in registros:
+        codigo = codigo_item(registro.get('item'))
+        if codigo:
+            descricoes[codigo] = str(registro.get('descricao') or '').strip() or descricoes.get(codigo, '')
+    if descricoes:
+        begin_write(session)
+        _garantir(session.connection(), sorted(descricoes), descricoes)
+
+
+def registrar_rotina(session, registros, data_inspecao):
+    """Soma aos contadores os registros de uma rotina que acabou de ser salva (mesma transação)"""
+    acumulado = defaultdict(lambda: {'qtd': 0.0, 'inspecionados': 0, 'adiados': 0})
+    descricoes = {}
+    _acumular(registros, acumulado, descricoes)
+    if not acumulado:
+        return
+    begin_write(session)
+    conexao = session.connection()
+    _garantir(conexao, sorted(acumulado), descricoes)
+    conexao.execute(
+        tabela.update().where(tabela.c.codigo == bindparam('b_codigo')).values(
+            qtd_recebida=tabela.c.qtd_recebida + bindparam('qtd'),
+            vezes_inspecionado=tabela.c.vezes_inspecionado + bindparam('inspecionados'),
+            vezes_adiado=tabela.c.vezes_adiado + bindparam('adiados'),
+            ultima_inspecao=case((bindparam('inspecionados') > 0, bindparam('data')),
+                                 else_=tabela.c.ultima_inspecao),
+            atualizado_em=datetime.utcnow()),
+        [dict(contagem, b_codigo=codigo, data=data_inspecao) for codigo, contagem in acumulado.items()])
+
+
+def reconstruir_itens(lote=500):
+    """Recalcula todos os contadores a partir das INCs e das rotinas salvas; retorna o número de itens"""
+    acumulado = defaultdict(lambda: {'qtd': 0.0, 'inspecionados': 0, 'adiados': 0, 'data': None})
+    descricoes = {}
+    rotinas = db.session.query(RotinaInspecao.data_inspecao, RotinaInspecao.registros) \
+        .order_by(RotinaInspecao.id).yield_per(lote)
+    for data_inspecao, registros in rotinas:
+        registros = json.loads(registros or '[]')
+        _acumular(registros, acumulado, descricoes)
+        for registro in registros:
+            codigo = codigo_item(registro.get('item'))
+            if codigo and registro.get('inspecionado'):
+                acumulado[codigo]['data'] = data_inspecao
+
+    begin_write(db.session)
+    conexao = db.session.connection()
+    incs = _totais_incs(conexao)
+    codigos = sorted((set(acumulado) | {codigo_item(c) for c in incs}) - {''})
+    conexao.execute(tabela.update().values(**dict.fromkeys(CONTADORES, 0), ultima_inspecao=None))
+    _garantir(conexao, codigos, descricoes)
+    valores = []
+    for codigo in codigos:
+        contagem = acumulado.get(codigo, {'qtd': 0.0, 'inspecionados': 0, 'adiados': 0, 'data': None})
+        total, defeito = incs.get(codigo, (0, 0))
+        valores.append({'b_codigo': codigo, 'qtd_recebida': contagem['qtd'],
+                        'vezes_inspecionado': contagem['inspecionados'], 'vezes_adiado': contagem['adiados'],
+                        'total_incs': total, 'qtd_defeito': defeito, 'ultima_inspecao': contagem['data']})
+    for parte in _partes(valores, 5000):
+        conexao.execute(tabela.update().where(tabela.c.codigo == bindparam('b_codigo')).values(
+            **{campo: bindparam(campo) for campo in CONTADORES + ('ultima_inspecao',)},
+            atualizado_em=datetime.utcnow()), parte)
+    db.session.commit()
+    return len(codigos)
+
+
+def ensure_item_index():
+    """Cria o índice de INC.item em bancos criados antes dele"""
+    indice = next(i for i in INC.__table__.indexes if i.name == 'ix_inc_item')
+    with db.engine.begin() as conexao:
+        conexao.execute(CreateIndex(indice, if_not_exists=True))
+
+
+class ItemStats:
+    """Recalcula os contadores de INC dos itens alterados em cada flush do ORM"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not event.contains(RoutingSession, 'after_flush', self._after_flush):
+            event.listen(RoutingSession, 'after_flush', self._after_flush)
+        app.extensions['item_stats'] = self
+
+    def _after_flush(self, session, flush_context):
+        codigos = set()
+        for obj in list(session.new) + list(session.deleted):
+            if isinstance(obj, INC):
+                codigos.add(obj.item)
+        for obj in session.dirty:
+            if not isinstance(obj, INC):
+                continue
+            atributos = inspect(obj).attrs
+            if atributos.item.history.has_changes() or atributos.quantidade_com_defeito.history.has_changes():
+                # Item trocado: recalcula o antigo e o novo
+                codigos.update(atributos.item.history.sum())
+        if codigos:
+            _recalcular_incs(session.connection(), codigos)
+
+
+item_stats = ItemStats()
@@ -0,0 +1,136 @@
+"""
+Login sob carga: hash de senha fora da thread da requisição e limite de tentativas.
+
+- PasswordHasher: o custo do hash (PASSWORD_HASH_METHOD) é configurável e o
+  hash é refeito no login quando os parâmetros mudam. As verificações rodam
+  num pool de threads limitado; se a fila estiver cheia o login responde 503
+  na hora em vez de acumular requisições presas no PBKDF2.
+- TokenBucketLimiter: baldes de tokens em memória por usuário e por IP, para
+  que um loop de tentativas de senha não consuma CPU.
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HasherBusy(Exception):
+    """O pool de hash está cheio; o cliente deve tentar de novo"""
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.executor = None
+        self.slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 4)
+        app.config.setdefault('PASSWORD_HASH_QUEUE', 32)  # verificações esperando além das em execução
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        workers = app.config['PASSWORD_HASH_WORKERS']
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self.slots = threading.BoundedSemaphore(workers + app.config['PASSWORD_HASH_QUEUE'])
+        # Prefixo "método:parâmetros" que os hashes atuais devem ter (ex.: pbkdf2:sha256:600000)
+        self.dummy_hash = generate_password_hash('senha-inexistente', method=self.method)
+        self.prefix = self.dummy_hash.split('$', 1)[0]
+        app.extensions['password_hasher'] = self
+
+    def _run(self, funcao, *args):
+        if not self.slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            future = self.executor.submit(funcao, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            raise HasherBusy()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, hashed_password, password):
+        """Verifica a senha; sem usuário compara com um hash fictício para levar o mesmo tempo"""
+        if not hashed_password:
+            self._run(check_password_hash, self.dummy_hash, password)
+            return False
+        return self._run(check_password_hash, hashed_password, password)
+
+    def needs_rehash(self, hashed_password):
+        return hashed_password.split('$', 1)[0] != self.prefix
+
+
+class TokenBucketLimiter:
+    """Baldes de tokens em memória; cada tentativa de login consome um token"""
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.limits = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOGIN_RATE_LIMIT_ENABLED', True)
+        app.config.setdefault('LOGIN_USER_BURST', 5)
+        app.config.setdefault('LOGIN_USER_PER_MINUTE', 5)
+        # Vários inspetores podem entrar pelo mesmo terminal/NAT na troca de turno
+        app.config.setdefault('LOGIN_IP_BURST', 60)
+        app.config.setdefault('LOGIN_IP_PER_MINUTE', 30)
+        app.config.setdefault('LOGIN_RATE_MAX_KEYS', 10000)
+        self.enabled = app.config['LOGIN_RATE_LIMIT_ENABLED']
+        self.limits = {
+            'user': (app.config['LOGIN_USER_BURST'], app.config['LOGIN_USER_PER_MINUTE'] / 60),
+            'ip': (app.config['LOGIN_IP_BURST'], app.config['LOGIN_IP_PER_MINUTE'] / 60),
+        }
+        self.max_keys = app.config['LOGIN_RATE_MAX_KEYS']
+        with self.lock:
+            self.buckets.clear()
+        app.extensions['login_limiter'] = self
+
+    def _tokens(self, chave, agora):
+        capacidade, taxa = self.limits[chave[0]]
+        tokens, ultimo = self.buckets.get(chave, (capacidade, agora))
+        return min(capacidade, tokens + (agora - ultimo) * taxa), taxa
+
+    def _podar(self, agora):
+        # Baldes cheios equivalem a não ter balde; descarta-os para limitar a memória
+        for chave in list(self.buckets):
+            if self._tokens(chave, agora)[0] >= self.limits[chave[0]][0]:
+                del self.buckets[chave]
+
+    def hit(self, username, ip):
+        """Consome um token do usuário e do IP; retorna 0 ou os segundos até a próxima tentativa"""
+        if not self.enabled:
+            return 0
+        chaves = [('user', (username or '').strip().lower()), ('ip', ip or '')]
+        agora = time.monotonic()
+        with self.lock:
+            saldos = [(chave, *self._tokens(chave, agora)) for chave in chaves]
+            espera = max(((1 - tokens) / taxa for _, tokens, taxa in saldos if tokens < 1), default=0)
+            if espera:
+                return espera
+            if len(self.buckets) >= self.max_keys:
+                self._podar(agora)
+            for chave, tokens, _ in saldos:
+                self.buckets[chave] = (tokens - 1, agora)
+        return 0
+
+    def reset(self, username):
+        """Login bem-sucedido devolve o balde do usuário"""
+        with self.lock:
+            self.buckets.pop(('user', (username or '').strip().lower()), None)
+
+
+password_hasher = PasswordHasher()
+login_limiter = TokenBucketLimiter()
@@ -0,0 +1,187 @@
+import time
+import threading
+from bisect import bisect_left
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Limites (em segundos) dos buckets dos histogramas de latência
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self.values = {}  # labels -> [contagens por bucket..., soma, total]
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, series in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, ('le', _number(bound)))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, ('le', '+Inf'))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-2])}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class Metrics:
+    """Métricas por rota (latência, queries SQL e renderização de templates) no formato Prometheus"""
+
+    def __init__(self, app=None):
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Duração das requisições por endpoint.',
+            ('endpoint', 'method'))
+        self.requests_total = Counter(
+            'http_requests_total', 'Total de requisições por endpoint e status.',
+            ('endpoint', 'method', 'status'))
+        self.queries_per_request = Histogram(
+            'db_queries_per_request', 'Quantidade de queries SQL executadas por requisição.',
+            ('endpoint',), COUNT_BUCKETS)
+        self.query_time_per_request = Histogram(
+            'db_query_time_per_request_seconds', 'Tempo total gasto em SQL por requisição.',
+            ('endpoint',), LATENCY_BUCKETS)
+        self.query_duration = Histogram(
+            'db_query_duration_seconds', 'Duração de cada query SQL.',
+            ('endpoint',), QUERY_BUCKETS)
+        self.template_duration = Histogram(
+            'template_render_duration_seconds', 'Tempo de renderização por template.',
+            ('template',), LATENCY_BUCKETS)
+        self.all_metrics = [self.request_duration, self.requests_total, self.queries_per_request,
+                            self.query_time_per_request, self.query_duration, self.template_duration]
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        if not app.config['METRICS_ENABLED']:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        app.extensions['metrics'] = self
+        _instances.append(self)
+
+    @staticmethod
+    def _endpoint():
+        if has_request_context():
+            return request.endpoint or '<unmatched>'
+        return '<background>'
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_query_time = 0.0
+
+    def _after_request(self, response):
+        start = g.get('metrics_start')
+        if start is None:
+            return response
+        endpoint = self._endpoint()
+        self.request_duration.observe((endpoint, request.method), time.perf_counter() - start)
+        self.requests_total.inc((endpoint, request.method, str(response.status_code)))
+        self.queries_per_request.observe((endpoint,), g.metrics_queries)
+        self.query_time_per_request.observe((endpoint,), g.metrics_query_time)
+        return response
+
+    def _before_render(self, sender, template, context, **extra):
+        g.setdefault('metrics_templates', []).append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        starts = g.get('metrics_templates')
+        if starts:
+            self.template_duration.observe((template.name or '<string>',), time.perf_counter() - starts.pop())
+
+    def record_query(self, duration):
+        self.query_duration.observe((self._endpoint(),), duration)
+        if has_request_context() and 'metrics_queries' in g:
+            g.metrics_queries += 1
+            g.metrics_query_time += duration
+
+    def render(self):
+        lines = []
+        for metric in self.all_metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+_instances = []
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    for metrics in _instances:
+        metrics.record_query(duration)
+
+
+metrics = Metrics()
@@ -0,0 +1,116 @@
+"""
+Pareto de INCs por item, fornecedor e representante.
+
+Cada ranking é um único GROUP BY no período, atendido só pelo índice de
+cobertura ix_inc_periodo (data ISO, item, fornecedor, representante,
+quantidade com defeito), sem ler as linhas da tabela. Os resultados ficam
+num cache LRU em memória; a chave inclui o último id do change_log de INC,
+então qualquer escrita de INC (por este ou por outro processo) invalida o
+cache na consulta seguinte. Alterações pelo ORM deste processo invalidam na
+hora, no flush.
+"""
+import time
+import threading
+from collections import OrderedDict, namedtuple
+from sqlalchemy import event, func, select
+from sqlalchemy.schema import CreateIndex
+from models import db, INC, ChangeLog, data_iso
+from utils.sqlite_profile import RoutingSession
+
+DIMENSOES = {
+    'item': INC.item,
+    'fornecedor': INC.fornecedor,
+    'representante': INC.representante,
+}
+METRICAS = ('incs', 'defeito')
+# Limites usados quando o período não é informado (mantêm a consulta no índice)
+DATA_MINIMA, DATA_MAXIMA = '0000-00-00', '9999-99-99'
+
+LinhaPareto = namedtuple('LinhaPareto', 'valor incs defeito percentual acumulado')
+
+
+def ranking(dimensao, de=None, ate=None, metrica='incs'):
+    """Linhas ordenadas pela métrica, com percentual e percentual acumulado"""
+    coluna = DIMENSOES[dimensao]
+    periodo = data_iso(INC.data)
+    consulta = select(coluna, func.count(), func.coalesce(func.sum(INC.quantidade_com_defeito), 0)) \
+        .where(periodo >= (de or DATA_MINIMA), periodo <= (ate or DATA_MAXIMA)) \
+        .group_by(coluna)
+    grupos = db.session.execute(consulta).all()
+    indice = 1 if metrica == 'incs' else 2
+    grupos.sort(key=lambda g: (-g[indice], g[0]))
+    total = sum(g[indice] for g in grupos)
+    linhas = []
+    acumulado = 0
+    for grupo in grupos:
+        acumulado += grupo[indice]
+        linhas.append(LinhaPareto(grupo[0], grupo[1], grupo[2],
+                                  round(100 * grupo[indice] / total, 2) if total else 0,
+                                  round(100 * acumulado / total, 2) if total else 0))
+    return {'linhas': linhas, 'total_incs': sum(g[1] for g in grupos), 'total_defeito': sum(g[2] for g in grupos)}
+
+
+class ParetoCache:
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.resultados = OrderedDict()
+        self.geracao = 0
+        self.ttl = 300
+        self.tamanho = 128
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PARETO_CACHE_TTL', 300)
+        app.config.setdefault('PARETO_CACHE_SIZE', 128)
+        self.ttl = app.config['PARETO_CACHE_TTL']
+        self.tamanho = app.config['PARETO_CACHE_SIZE']
+        if not event.contains(RoutingSession, 'after_flush', self._after_flush):
+            event.listen(RoutingSession, 'after_flush', self._after_flush)
+        self.invalidate()
+        app.extensions['pareto_cache'] = self
+
+    def invalidate(self):
+        with self.lock:
+            self.geracao += 1
+            self.resultados.clear()
+
+    def _after_flush(self, session, flush_context):
+        if any(isinstance(obj, INC) for obj in (*session.new, *session.dirty, *session.deleted)):
+            self.invalidate()
+
+    def _versao(self):
+        # Último id do log de INC (busca pelo índice de entidade); muda a cada escrita registrada
+        return db.session.query(func.max(ChangeLog.id)).filter(ChangeLog.entidade == INC.__tablename__).scalar()
+
+    def get(self, dimensao, de=None, ate=None, metrica='incs'):
+        if dimensao not in DIMENSOES or metrica not in METRICAS:
+            raise ValueError(f"Pareto inválido: {dimensao}/{metrica}")
+        versao = self._versao()
+        chave = (dimensao, de, ate, metrica)
+        agora = time.monotonic()
+        with self.lock:
+            geracao = self.geracao
+            guardado = self.resultados.get(chave)
+            if guardado is not None and guardado[0] == versao and agora - guardado[1] < self.ttl:
+                self.resultados.move_to_end(chave)
+                return guardado[2]
+        resultado = ranking(dimensao, de, ate, metrica)
+        with self.lock:
+            # Não guarda um resultado calculado enquanto uma escrita invalidava o cache
+            if geracao == self.geracao:
+                self.resultados[chave] = (versao, agora, resultado)
+                self.resultados.move_to_end(chave)
+                while len(self.resultados) > self.tamanho:
+                    self.resultados.popitem(last=False)
+        return resultado
+
+
+def ensure_pareto_index():
+    """Cria o índice de período de INC em bancos criados antes dele"""
+    indice = next(i for i in INC.__table__.indexes if i.name == 'ix_inc_periodo')
+    with db.engine.begin() as conexao:
+        conexao.execute(CreateIndex(indice, if_not_exists=True))
+
+
+pareto_cache = ParetoCache()
@@ -0,0 +1,139 @@
+import os
+import json
+import atexit
+import threading
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from pypdf import PdfWriter
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+# Fotos são reduzidas uma única vez e guardadas nesta subpasta de uploads
+DERIVATIVES_DIR = '.pdf'
+PHOTO_MAX_SIZE = 600      # pixels no maior lado (~3x a área de 200pt desenhada no PDF)
+PHOTO_JPEG_QUALITY = 80
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def inc_to_dict(inc):
+    """Extrai os campos usados no PDF, para enviar a INC a outro processo"""
+    return {
+        'oc': inc.oc, 'nf': inc.nf, 'data': inc.data, 'representante': inc.representante,
+        'fornecedor': inc.fornecedor, 'item': inc.item,
+        'quantidade_recebida': inc.quantidade_recebida,
+        'quantidade_com_defeito': inc.quantidade_com_defeito,
+        'descricao_defeito': inc.descricao_defeito, 'urgencia': inc.urgencia,
+        'acao_recomendada': inc.acao_recomendada, 'status': inc.status,
+        'fotos': json.loads(inc.fotos) if inc.fotos else [],
+    }
+
+
+def photo_derivative(upload_folder, foto):
+    """Retorna o caminho de uma versão reduzida da foto, gerando-a se necessário"""
+    source = os.path.join(upload_folder, os.path.basename(foto))
+    if not os.path.exists(source):
+        return None
+
+    target_dir = os.path.join(upload_folder, DERIVATIVES_DIR)
+    target = os.path.join(target_dir, f"{os.path.basename(foto)}_{PHOTO_MAX_SIZE}.jpg")
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+        return target
+
+    os.makedirs(target_dir, exist_ok=True)
+    with Image.open(source) as img:
+        img.draft('RGB', (PHOTO_MAX_SIZE, PHOTO_MAX_SIZE))  # decodifica JPEGs já reduzidos
+        img = img.convert('RGB')
+        img.thumbnail((PHOTO_MAX_SIZE, PHOTO_MAX_SIZE))
+        # Grava em arquivo temporário para que outro processo nunca leia um JPEG incompleto
+        tmp = f"{target}.{os.getpid()}.tmp"
+        img.save(tmp, 'JPEG', quality=PHOTO_JPEG_QUALITY, optimize=True)
+    os.replace(tmp, target)
+    return target
+
+
+def draw_inc(c, inc, upload_folder):
+    """Desenha uma INC (dados e fotos) a partir da página atual do canvas"""
+    width, height = letter
+    y = height - 50
+    c.setFont("Helvetica", 12)
+    c.drawString(50, y, f"INC #{inc['oc']}")
+    y -= 20
+
+    details = [
+        f"NF-e: {inc['nf']}", f"Data: {inc['data']}", f"Representante: {inc['representante']}",
+        f"Fornecedor: {inc['fornecedor']}", f"Item: {inc['item']}",
+        f"Qtd. Recebida: {inc['quantidade_recebida']}",
+        f"Qtd. com Defeito: {inc['quantidade_com_defeito']}",
+        f"Descrição do Defeito: {inc['descricao_defeito']}",
+        f"Urgência: {inc['urgencia']}", f"Ação Recomendada: {inc['acao_recomendada']}",
+        f"Status: {inc['status']}"
+    ]
+
+    for line in details:
+        c.drawString(50, y, line)
+        y -= 20
+
+    fotos = [p for p in (photo_derivative(upload_folder, f) for f in inc['fotos']) if p]
+    if fotos:
+        c.showPage()
+        x, y = 50, height - 220
+        for path in fotos:
+            # A nova página só é aberta quando há foto para ela, evitando páginas em branco
+            if y < 50:
+                c.showPage()
+                y = height - 220
+            c.drawImage(path, x, y, width=200, height=200, preserveAspectRatio=True)
+            x += 220
+            if x > width - 200:
+                x = 50
+                y -= 220
+
+
+def render_incs_pdf(incs, upload_folder):
+    """Gera um PDF com uma seção por INC e retorna os bytes"""
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    for i, inc in enumerate(incs):
+        if i:
+            c.showPage()
+        draw_inc(c, inc, upload_folder)
+    c.save()
+    return buffer.getvalue()
+
+
+def _get_executor(max_workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: o pool é criado dentro de uma requisição, com outras threads
+            # (spooler, SSE, pool de conexões) ativas; um fork herdaria os locks delas
+            _executor = ProcessPoolExecutor(max_workers=max_workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+            atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+        return _executor
+
+
+def build_consolidated_pdf(incs, upload_folder, out, workers=None, chunk_size=20):
+    """Gera o PDF consolidado de várias INCs e grava em `out`.
+
+    As INCs são divididas em blocos de `chunk_size` renderizados em paralelo
+    num pool de processos; os PDFs parciais são unidos na ordem original.
+    Listas pequenas são renderizadas no próprio processo.
+    """
+    chunks = [incs[i:i + chunk_size] for i in range(0, len(incs), chunk_size)]
+    if len(chunks) <= 1 or workers == 1:
+        parts = (render_incs_pdf(chunk, upload_folder) for chunk in chunks)
+    else:
+        executor = _get_executor(workers or os.cpu_count())
+        parts = executor.map(render_incs_pdf, chunks, [upload_folder] * len(chunks))
+
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(BytesIO(part))
+    writer.write(out)
+    out.seek(0)
+    return out
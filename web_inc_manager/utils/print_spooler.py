@@ -0,0 +1,264 @@
+import select
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_, and_, inspect, text
+from models import db, PrintJob
+
+STATUS_PENDENTE = "pendente"
+STATUS_ENVIANDO = "enviando"
+STATUS_IMPRESSO = "impresso"
+STATUS_FALHOU = "falhou"
+
+# Folga além dos timeouts de conexão e envio antes de considerar abandonada uma reserva
+MARGEM_RESERVA = 60
+
+logger = logging.getLogger(__name__)
+
+
+def reserva_abandonada(config, agora):
+    """Filtro dos jobs 'enviando' reservados há mais tempo do que um envio pode levar"""
+    limite = agora - timedelta(seconds=config['PRINTER_CONNECT_TIMEOUT'] + config['PRINTER_SEND_TIMEOUT']
+                               + MARGEM_RESERVA)
+    return and_(PrintJob.status == STATUS_ENVIANDO,
+                or_(PrintJob.reservado_em.is_(None), PrintJob.reservado_em < limite))
+
+
+class PrinterWorker(threading.Thread):
+    """Thread que consome a fila de uma impressora mantendo a conexão TCP aberta"""
+
+    def __init__(self, spooler, printer_ip, printer_port):
+        super().__init__(name=f"print-worker-{printer_ip}:{printer_port}", daemon=True)
+        self.spooler = spooler
+        self.printer_ip = printer_ip
+        self.printer_port = printer_port
+        self.wakeup = threading.Event()
+        self.sock = None
+        self.last_used = None
+
+    # ---------- conexão ----------
+
+    def _conectar(self):
+        config = self.spooler.app.config
+        sock = socket.create_connection((self.printer_ip, self.printer_port),
+                                        timeout=config['PRINTER_CONNECT_TIMEOUT'])
+        sock.settimeout(config['PRINTER_SEND_TIMEOUT'])
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.sock = sock
+        logger.debug(f"Conexão estabelecida com {self.printer_ip}:{self.printer_port}")
+
+    def _fechar(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def _conexao_viva(self):
+        """Verifica se a impressora não encerrou a conexão enquanto estava ociosa"""
+        if self.sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+            if readable and not self.sock.recv(1024, socket.MSG_PEEK):
+                return False
+        except OSError:
+            return False
+        return True
+
+    def _enviar(self, payload):
+        if not self._conexao_viva():
+            self._fechar()
+            self._conectar()
+        self.sock.sendall(payload)
+        self.last_used = datetime.utcnow()
+
+    # ---------- fila ----------
+
+    def _proximo_job(self):
+        """Reserva o próximo job pendente desta impressora (None se a fila estiver vazia).
+
+        Jobs 'enviando' com reserva abandonada (processo que parou no meio do
+        envio) também podem ser reservados de novo.
+        """
+        while True:
+            agora = datetime.utcnow()
+            disponivel = or_(
+                and_(PrintJob.status == STATUS_PENDENTE, PrintJob.proxima_tentativa <= agora),
+                reserva_abandonada(self.spooler.app.config, agora),
+            )
+            job = (PrintJob.query
+                   .filter_by(printer_ip=self.printer_ip, printer_port=self.printer_port)
+                   .filter(disponivel)
+                   .order_by(PrintJob.id)
+                   .first())
+            if job is None:
+                return None
+            # UPDATE condicional evita que dois processos reservem o mesmo job
+            result = db.session.execute(
+                update(PrintJob)
+                .where(PrintJob.id == job.id, disponivel)
+                .values(status=STATUS_ENVIANDO, reservado_em=agora)
+            )
+            db.session.commit()
+            if result.rowcount == 1:
+                db.session.refresh(job)
+                return job
+
+    def _espera(self):
+        """Tempo até o próximo job agendado ou até o fechamento por ociosidade"""
+        config = self.spooler.app.config
+        espera = config['PRINTER_IDLE_TIMEOUT']
+        proximo = (db.session.query(db.func.min(PrintJob.proxima_tentativa))
+                   .filter_by(printer_ip=self.printer_ip, printer_port=self.printer_port,
+                              status=STATUS_PENDENTE)
+                   .scalar())
+        if proximo is not None:
+            espera = min(espera, max((proximo - datetime.utcnow()).total_seconds(), 0.05))
+        return espera
+
+    def _processar(self, job):
+        config = self.spooler.app.config
+        try:
+            self._enviar(job.payload.encode('utf-8'))
+        except (OSError, socket.timeout) as e:
+            self._fechar()
+            job.tentativas += 1
+            job.ultimo_erro = str(e)
+            if job.tentativas >= config['PRINT_MAX_RETRIES']:
+                job.status = STATUS_FALHOU
+                logger.error(f"Job {job.id} descartado após {job.tentativas} tentativas: {e}")
+            else:
+                atraso = min(config['PRINT_BACKOFF_BASE'] * 2 ** (job.tentativas - 1),
+                             config['PRINT_BACKOFF_MAX'])
+                job.status = STATUS_PENDENTE
+                job.proxima_tentativa = datetime.utcnow() + timedelta(seconds=atraso)
+                logger.warning(f"Falha ao imprimir job {job.id} ({e}), nova tentativa em {atraso}s")
+        else:
+            job.status = STATUS_IMPRESSO
+            job.impresso_em = datetime.utcnow()
+            job.ultimo_erro = ""
+        db.session.commit()
+
+    def run(self):
+        while not self.spooler.stopping.is_set():
+            try:
+                with self.spooler.app.app_context():
+                    job = self._proximo_job()
+                    if job is not None:
+                        self._processar(job)
+                        continue
+                    espera = self._espera()
+            except Exception as e:
+                logger.error(f"Erro no worker de impressão {self.name}: {e}")
+                espera = self.spooler.app.config['PRINT_BACKOFF_BASE']
+
+            # Fecha a conexão ociosa para liberar a impressora para outros hosts
+            idle = self.spooler.app.config['PRINTER_IDLE_TIMEOUT']
+            if self.sock is not None and self.last_used and \
+                    (datetime.utcnow() - self.last_used).total_seconds() >= idle:
+                self._fechar()
+
+            self.wakeup.wait(espera)
+            self.wakeup.clear()
+        self._fechar()
+
+
+class PrintSpooler:
+    """Fila de impressão persistente com um worker por impressora"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.workers = {}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.resumed = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('PRINT_MAX_RETRIES', 5)
+        app.config.setdefault('PRINT_BACKOFF_BASE', 1.0)
+        app.config.setdefault('PRINT_BACKOFF_MAX', 60.0)
+        app.config.setdefault('PRINTER_CONNECT_TIMEOUT', 5.0)
+        app.config.setdefault('PRINTER_SEND_TIMEOUT', 10.0)
+        app.config.setdefault('PRINTER_IDLE_TIMEOUT', 30.0)
+        app.extensions['print_spooler'] = self
+
+    def _worker(self, printer_ip, printer_port):
+        key = (printer_ip, int(printer_port))
+        with self.lock:
+            worker = self.workers.get(key)
+            if worker is None or not worker.is_alive():
+                worker = PrinterWorker(self, *key)
+                self.workers[key] = worker
+                worker.start()
+        return worker
+
+    def resume(self):
+        """Retoma jobs que ficaram na fila (ou interrompidos) na execução anterior.
+
+        É chamado sob demanda e não na importação, para que o processo pai do
+        reloader do Flask não inicie workers duplicados. Jobs 'enviando' de
+        outro processo ainda ativo não são tocados; só as reservas abandonadas
+        voltam a ser enviadas (pelos workers, em _proximo_job).
+        """
+        with self.lock:
+            if self.resumed:
+                return
+            self.resumed = True
+        impressoras = (db.session.query(PrintJob.printer_ip, PrintJob.printer_port)
+                       .filter(or_(PrintJob.status == STATUS_PENDENTE,
+                                   reserva_abandonada(self.app.config, datetime.utcnow())))
+                       .distinct().all())
+        for printer_ip, printer_port in impressoras:
+            self._worker(printer_ip, printer_port)
+
+    def enqueue(self, payload, printer_ip, printer_port, inc_id=None):
+        """Grava o job na fila e acorda o worker da impressora"""
+        self.resume()
+        job = PrintJob(
+            printer_ip=printer_ip,
+            printer_port=int(printer_port),
+            payload=payload,
+            status=STATUS_PENDENTE,
+            inc_id=inc_id,
+        )
+        db.session.add(job)
+        db.session.commit()
+        self._worker(printer_ip, printer_port).wakeup.set()
+        return job
+
+    def stop(self, timeout=5):
+        self.stopping.set()
+        for worker in list(self.workers.values()):
+            worker.wakeup.set()
+            worker.join(timeout)
+        self.workers.clear()
+        self.stopping.clear()
+
+
+def ensure_print_job_columns():
+    """Acrescenta PrintJob.reservado_em em bancos criados antes dela"""
+    with db.engine.begin() as conexao:
+        colunas = {coluna['name'] for coluna in inspect(conexao).get_columns(PrintJob.__tablename__)}
+        if 'reservado_em' not in colunas:
+            conexao.execute(text(f"ALTER TABLE {PrintJob.__tablename__} ADD COLUMN reservado_em DATETIME"))
+
+
+def job_status(job):
+    """Representação do job usada pelo endpoint de acompanhamento"""
+    return {
+        'id': job.id,
+        'status': job.status,
+        'tentativas': job.tentativas,
+        'erro': job.ultimo_erro or None,
+        'inc_id': job.inc_id,
+        'impresso_em': job.impresso_em.isoformat() if job.impresso_em else None,
+    }
+
+
+spooler = PrintSpooler()
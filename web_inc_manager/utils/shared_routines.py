@@ -0,0 +1,295 @@
+"""
+Rotinas de inspeção compartilhadas entre inspetores.
+
+Os registros ficam no banco (RegistroRotina) em vez da sessão do usuário.
+Cada alteração é um UPDATE condicionado à versão lida pelo inspetor
+(concorrência otimista) e incrementa a versão da rotina, que serve de
+cursor para o stream de eventos (Server-Sent Events) da tela de inspeção.
+"""
+import json
+import time
+import threading
+from datetime import datetime
+from collections import defaultdict
+from flask import abort
+from sqlalchemy import insert, update, select
+from models import db, RotinaCompartilhada, RegistroRotina, RotinaInspecao, AcaoSincronizada
+from utils.sqlite_profile import begin_write
+from utils.item_stats import registrar_descricoes, registrar_rotina
+from utils.supplier_ppm import registrar_recebimento
+
+ACOES = {
+    'inspecionar': {'inspecionado': True, 'adiado': False},
+    'adiar': {'inspecionado': False, 'adiado': True},
+}
+CAMPOS_REGISTRO = ('fornecedor', 'razao_social', 'item', 'descricao', 'num_aviso', 'qtd_recebida',
+                   'inspecionado', 'adiado', 'oc_value')
+
+
+class RoutineClosed(Exception):
+    """A rotina já foi salva (ou não existe)"""
+
+
+class VersionConflict(Exception):
+    """O registro foi alterado por outro inspetor depois de lido"""
+
+    def __init__(self, registro):
+        super().__init__("Registro alterado por outro inspetor")
+        self.registro = registro
+
+
+class Broker:
+    """Avisa os streams de eventos do mesmo processo que uma rotina mudou.
+
+    Outros processos percebem a mudança pela versão da rotina no banco, no
+    próximo intervalo de consulta.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.listeners = defaultdict(set)
+
+    def subscribe(self, channel):
+        event = threading.Event()
+        with self.lock:
+            self.listeners[channel].add(event)
+        return event
+
+    def unsubscribe(self, channel, event):
+        with self.lock:
+            self.listeners[channel].discard(event)
+            if not self.listeners[channel]:
+                del self.listeners[channel]
+
+    def publish(self, channel):
+        with self.lock:
+            for event in self.listeners.get(channel, ()):
+                event.set()
+
+
+broker = Broker()
+
+
+def registro_to_dict(registro):
+    data = {campo: getattr(registro, campo) for campo in CAMPOS_REGISTRO}
+    data.update({
+        'id': registro.id,
+        'versao': registro.versao,
+        'atualizado_por': registro.atualizado_por.username if registro.atualizado_por else None,
+    })
+    return data
+
+
+def create_shared_routine(registros, user_id):
+    """Cria a rotina compartilhada a partir dos registros lidos do .lst"""
+    rotina = RotinaCompartilhada(criado_por_id=user_id)
+    db.session.add(rotina)
+    db.session.flush()
+    db.session.execute(insert(RegistroRotina), [
+        dict({campo: registro.get(campo) for campo in CAMPOS_REGISTRO},
+             rotina_compartilhada_id=rotina.id, posicao=posicao)
+        for posicao, registro in enumerate(registros)
+    ])
+    registrar_descricoes(db.session, registros)
+    db.session.commit()
+    return rotina
+
+
+def routine_records(rotina_id):
+    return RegistroRotina.query.filter_by(rotina_compartilhada_id=rotina_id) \
+        .order_by(RegistroRotina.posicao).all()
+
+
+def _apply_action(rotina_id, registro_id, acao, versao, user_id):
+    """Aplica a ação sem commit; retorna ('ok' ou 'conflito', estado do registro).
+
+    A versão da rotina só é incrementada quando o registro muda. Repetir a
+    ação que já está aplicada não é conflito.
+    """
+    valores = ACOES[acao]
+    proxima_versao = select(RotinaCompartilhada.versao + 1) \
+        .where(RotinaCompartilhada.id == rotina_id).scalar_subquery()
+    alterado = db.session.execute(
+        update(RegistroRotina)
+        .where(RegistroRotina.id == registro_id,
+               RegistroRotina.rotina_compartilhada_id == rotina_id,
+               RegistroRotina.versao == versao)
+        .values(versao=RegistroRotina.versao + 1, seq=proxima_versao, atualizado_por_id=user_id,
+                atualizado_em=datetime.utcnow(), **valores)
+        .returning(RegistroRotina.id)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if alterado is not None:
+        db.session.execute(
+            update(RotinaCompartilhada).where(RotinaCompartilhada.id == rotina_id)
+            .values(versao=RotinaCompartilhada.versao + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+    registro = RegistroRotina.query.filter_by(id=registro_id, rotina_compartilhada_id=rotina_id) \
+        .populate_existing().first()
+    if registro is None:
+        raise LookupError(registro_id)
+    if alterado is None and not all(getattr(registro, campo) == valor for campo, valor in valores.items()):
+        return 'conflito', registro_to_dict(registro)
+    return 'ok', registro_to_dict(registro)
+
+
+def _open_routine(rotina_id):
+    """Carrega a rotina na conexão de escrita; levanta RoutineClosed se já foi salva"""
+    begin_write(db.session)
+    rotina = db.session.get(RotinaCompartilhada, rotina_id, populate_existing=True)
+    if rotina is None or rotina.status != 'aberta':
+        db.session.rollback()
+        raise RoutineClosed()
+    return rotina
+
+
+def update_record(rotina_id, registro_id, acao, versao, user_id):
+    """Aplica a ação ao registro se ele ainda estiver na versão informada.
+
+    Levanta VersionConflict (com o estado atual) se outro inspetor alterou o
+    registro antes.
+    """
+    _open_routine(rotina_id)
+    try:
+        status, registro = _apply_action(rotina_id, registro_id, acao, versao, user_id)
+    except LookupError:
+        db.session.rollback()
+        abort(404)
+    if status == 'conflito':
+        db.session.rollback()
+        raise VersionConflict(registro)
+    db.session.commit()
+    broker.publish(rotina_id)
+    return registro
+
+
+def sync_actions(rotina_id, acoes, user_id):
+    """Aplica em uma transação as ações enfileiradas offline.
+
+    Cada ação traz um id gerado no navegador; ids já processados devolvem o
+    mesmo resultado da primeira vez, então reenviar o lote é seguro.
+    """
+    _open_routine(rotina_id)
+    op_ids = [str(acao.get('id')) for acao in acoes if acao.get('id')]
+    processadas = {
+        op.op_id: json.loads(op.resultado)
+        for op in AcaoSincronizada.query.filter(AcaoSincronizada.op_id.in_(op_ids))
+    } if op_ids else {}
+
+    resultados = []
+    alterou = False
+    for acao in acoes:
+        op_id = str(acao.get('id') or '')
+        if op_id in processadas:
+            resultados.append(processadas[op_id])
+            continue
+        registro_id, versao = acao.get('registro_id'), acao.get('versao')
+        if not op_id or len(op_id) > 64 or acao.get('action') not in ACOES \
+                or not isinstance(registro_id, int) or not isinstance(versao, int):
+            resultados.append({'id': op_id, 'status': 'erro', 'erro': 'Ação inválida.'})
+            continue
+        try:
+            status, registro = _apply_action(rotina_id, registro_id, acao['action'], versao, user_id)
+        except LookupError:
+            resultado = {'id': op_id, 'status': 'erro', 'erro': 'Registro não encontrado.'}
+        else:
+            resultado = {'id': op_id, 'status': status, 'registro': registro}
+            alterou = alterou or status == 'ok'
+        db.session.add(AcaoSincronizada(op_id=op_id, rotina_compartilhada_id=rotina_id,
+                                        resultado=json.dumps(resultado, default=str)))
+        processadas[op_id] = resultado
+        resultados.append(resultado)
+
+    db.session.commit()
+    if alterou:
+        broker.publish(rotina_id)
+    return resultados
+
+
+def save_routine(rotina_id, user_id):
+    """Grava a RotinaInspecao final; retorna None se ainda houver registros pendentes.
+
+    A rotina é reservada antes de tudo com um UPDATE condicionado a
+    status='aberta': de dois salvamentos simultâneos só um altera a linha,
+    mesmo sem o gravador único do perfil SQLite, e o outro recebe
+    RoutineClosed em vez de gravar a rotina (e os recebimentos) de novo.
+    """
+    begin_write(db.session)
+    reservada = db.session.execute(
+        update(RotinaCompartilhada)
+        .where(RotinaCompartilhada.id == rotina_id, RotinaCompartilhada.status == 'aberta')
+        .values(status='salva', versao=RotinaCompartilhada.versao + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if reservada != 1:
+        db.session.rollback()
+        raise RoutineClosed()
+    registros = routine_records(rotina_id)
+    if any(not r.inspecionado and not r.adiado for r in registros):
+        db.session.rollback()  # desfaz a reserva
+        return None
+
+    dados = [{campo: getattr(r, campo) for campo in CAMPOS_REGISTRO} for r in registros]
+    final = RotinaInspecao(inspetor_id=user_id, registros=json.dumps(dados))
+    db.session.add(final)
+    db.session.flush()
+    registrar_rotina(db.session, dados, final.data_inspecao)
+    registrar_recebimento(db.session, dados, final.data_inspecao)
+    db.session.execute(
+        update(RotinaCompartilhada).where(RotinaCompartilhada.id == rotina_id)
+        .values(rotina_id=final.id)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    broker.publish(rotina_id)
+    return final
+
+
+def _sse(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, default=str)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def routine_events(rotina_id, desde, poll_interval=5, heartbeat=15, max_duration=600):
+    """Gera os eventos SSE das alterações da rotina a partir da versão `desde`.
+
+    O stream termina após max_duration segundos; o EventSource reconecta
+    sozinho enviando o último id recebido (Last-Event-ID).
+    """
+    listener = broker.subscribe(rotina_id)
+    inicio = ultimo_envio = time.monotonic()
+    try:
+        yield "retry: 3000\n\n"
+        while time.monotonic() - inicio < max_duration:
+            listener.clear()
+            estado = db.session.query(RotinaCompartilhada.versao, RotinaCompartilhada.status) \
+                .filter_by(id=rotina_id).first()
+            if estado is None:
+                break
+            versao, status = estado
+            if versao > desde:
+                alterados = RegistroRotina.query.filter(
+                    RegistroRotina.rotina_compartilhada_id == rotina_id,
+                    RegistroRotina.seq > desde
+                ).order_by(RegistroRotina.seq).all()
+                for registro in alterados:
+                    yield _sse('registro', registro_to_dict(registro), registro.seq)
+                desde = versao
+                ultimo_envio = time.monotonic()
+            if status != 'aberta':
+                yield _sse('salva', {'rotina_id': rotina_id}, versao)
+                break
+            # Não segura uma conexão do pool enquanto espera
+            db.session.close()
+            if not listener.wait(poll_interval) and time.monotonic() - ultimo_envio >= heartbeat:
+                yield ": ping\n\n"
+                ultimo_envio = time.monotonic()
+    finally:
+        broker.unsubscribe(rotina_id, listener)
+        db.session.close()
@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import logging
+from datetime import datetime
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+from flask import request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH')
+
+logger = logging.getLogger('slow_queries')
+logger.propagate = False
+
+
+def redact_parameters(parameters):
+    """Mantém números e nulos; textos e binários viram apenas tipo e tamanho"""
+    def redact(value):
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        if isinstance(value, (str, bytes)):
+            return f"<{type(value).__name__} len={len(value)}>"
+        return f"<{type(value).__name__}>"
+
+    if isinstance(parameters, dict):
+        return {k: redact(v) for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact(v) for v in parameters]
+    return redact(parameters)
+
+
+def full_scans(plan):
+    """Tabelas lidas por varredura completa segundo o EXPLAIN QUERY PLAN"""
+    scans = []
+    for detail in plan:
+        # SQLite >= 3.36 escreve "SCAN inc"; versões anteriores, "SCAN TABLE inc"
+        if detail.startswith('SCAN ') and 'CONSTANT ROW' not in detail:
+            parts = detail.split()
+            table = parts[2] if len(parts) > 2 and parts[1] == 'TABLE' else parts[1]
+            scans.append(table)
+    return scans
+
+
+class SlowQueryLog:
+    """Registra queries acima do limite com a rota de origem e o plano de execução"""
+
+    def __init__(self, app=None):
+        self.threshold = None
+        self.log_file = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', 100)
+        app.config.setdefault('SLOW_QUERY_LOG_FILE', os.path.join(app.instance_path, 'slow_queries.log'))
+        app.config.setdefault('SLOW_QUERY_LOG_MAX_BYTES', 5 * 1024 * 1024)
+        app.config.setdefault('SLOW_QUERY_LOG_BACKUPS', 3)
+        if app.config['SLOW_QUERY_THRESHOLD_MS'] is None:
+            return
+
+        self.threshold = app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000.0
+        self.log_file = app.config['SLOW_QUERY_LOG_FILE']
+        os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
+        if not logger.handlers:
+            handler = RotatingFileHandler(self.log_file, maxBytes=app.config['SLOW_QUERY_LOG_MAX_BYTES'],
+                                          backupCount=app.config['SLOW_QUERY_LOG_BACKUPS'], encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.extensions['slow_query_log'] = self
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('slow_query_start')
+        if not starts:
+            return
+        duration = time.perf_counter() - starts.pop()
+        if duration < self.threshold:
+            return
+
+        plan = []
+        if conn.dialect.name == 'sqlite' and not executemany and \
+                statement.lstrip().upper().startswith(EXPLAINABLE):
+            try:
+                # Usa a conexão DBAPI diretamente para não disparar os eventos de novo
+                rows = cursor.connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+                plan = [row[-1] for row in rows]
+            except Exception as e:
+                plan = [f"(plano indisponível: {e})"]
+
+        entry = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'duration_ms': round(duration * 1000, 2),
+            'statement': ' '.join(statement.split()),
+            'parameters': redact_parameters(parameters) if not executemany else f"<{len(parameters)} linhas>",
+            'route': f"{request.method} {request.endpoint}" if has_request_context() else None,
+            'path': request.path if has_request_context() else None,
+            'plan': plan,
+            'full_scans': full_scans(plan),
+        }
+        logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+    def recent(self, limit=200):
+        """Lê as entradas mais recentes do log (o mais novo primeiro)"""
+        if not self.log_file or not os.path.exists(self.log_file):
+            return []
+        with open(self.log_file, encoding='utf-8') as f:
+            lines = f.readlines()[-limit:]
+        entries = []
+        for line in reversed(lines):
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+        return entries
+
+
+def scan_summary(entries):
+    """Contagem de varreduras completas por tabela, para apontar índices faltando"""
+    counter = Counter()
+    for entry in entries:
+        counter.update(entry.get('full_scans', []))
+    return counter.most_common()
+
+
+slow_query_log = SlowQueryLog()
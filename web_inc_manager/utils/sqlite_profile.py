@@ -0,0 +1,124 @@
+"""
+Perfil de concorrência para SQLite.
+
+- WAL, busy_timeout, synchronous=NORMAL, mmap_size e cache_size em toda conexão;
+- escritas serializadas numa única conexão (o engine padrão, com pool de
+  tamanho 1) que abre as transações com BEGIN IMMEDIATE, evitando o
+  "database is locked" que ocorre quando duas transações tentam promover a
+  trava de leitura para escrita;
+- leituras do ORM num pool de conexões somente leitura (bind 'sqlite_reader').
+
+Como o engine padrão é o de escrita, db.engine, create_all e SQL textual
+continuam funcionando sem mudanças; só as consultas da sessão vão ao pool
+de leitura.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from flask_sqlalchemy.session import Session
+
+READER_BIND = 'sqlite_reader'
+WRITE_FLAG = 'sqlite_write'
+
+
+def is_file_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def configure_sqlite(app):
+    """Ajusta a configuração do Flask-SQLAlchemy antes do db.init_app"""
+    app.config.setdefault('SQLITE_PROFILE', True)
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    app.config.setdefault('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+    app.config.setdefault('SQLITE_CACHE_SIZE_KB', 64 * 1024)
+    app.config.setdefault('SQLITE_READ_POOL_SIZE', 10)
+    app.config.setdefault('SQLITE_WRITE_TIMEOUT', 30)
+
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not app.config['SQLITE_PROFILE'] or not is_file_sqlite(uri):
+        return False
+
+    timeout = app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000.0
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    # Uma única conexão de escrita: quem chega enquanto ela está em uso espera na fila do pool
+    options.update(pool_size=1, max_overflow=0, pool_timeout=app.config['SQLITE_WRITE_TIMEOUT'])
+    options.setdefault('connect_args', {}).setdefault('timeout', timeout)
+
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    binds[READER_BIND] = {
+        'url': uri,
+        'pool_size': app.config['SQLITE_READ_POOL_SIZE'],
+        'max_overflow': app.config['SQLITE_READ_POOL_SIZE'],
+        'connect_args': {'timeout': timeout},
+    }
+    return True
+
+
+def init_sqlite_profile(app, db):
+    """Registra os eventos de conexão nos engines de leitura e escrita"""
+    if READER_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+
+    config = app.config
+
+    def set_pragmas(dbapi_connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}")
+        cursor.execute(f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}")
+        cursor.close()
+
+    def on_reader_connect(dbapi_connection, connection_record):
+        set_pragmas(dbapi_connection)
+        dbapi_connection.execute("PRAGMA query_only=ON")
+
+    def on_writer_connect(dbapi_connection, connection_record):
+        # Desliga o controle de transação do pysqlite; o BEGIN é emitido no evento 'begin'
+        dbapi_connection.isolation_level = None
+        set_pragmas(dbapi_connection)
+
+    def on_writer_begin(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    with app.app_context():
+        writer = db.engines[None]
+        reader = db.engines[READER_BIND]
+    event.listen(reader, 'connect', on_reader_connect)
+    event.listen(writer, 'connect', on_writer_connect)
+    event.listen(writer, 'begin', on_writer_begin)
+
+
+class RoutingSession(Session):
+    """Sessão que manda leituras ao pool de leitura e escritas à conexão única de escrita.
+
+    Depois da primeira escrita, todas as queries da transação usam a conexão de
+    escrita, para enxergarem as próprias alterações.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None:
+            return engine
+        engines = self._db.engines
+        if READER_BIND in engines and engine is engines[None]:
+            if not (self.info.get(WRITE_FLAG) or self._flushing or getattr(clause, 'is_dml', False)):
+                return engines[READER_BIND]
+            self.info[WRITE_FLAG] = True
+        return engine
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _release_writer(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(WRITE_FLAG, None)
+
+
+def begin_write(session):
+    """Faz as próximas leituras da transação usarem a conexão de escrita.
+
+    Útil para ler-e-depois-gravar (ex.: próximo número de OC) sem que outra
+    escrita concorrente aconteça no meio.
+    """
+    session.info[WRITE_FLAG] = True
@@ -0,0 +1,112 @@
+"""
+Diretório de fornecedores em memória para o autocomplete.
+
+O cadastro inteiro é lido uma vez por processo e indexado em listas
+ordenadas (razão social completa, cada palavra da razão social, CNPJ e
+código Logix), já sem acentos e em minúsculas; a busca por prefixo é um
+bisect em cada lista. As telas que alteram fornecedores chamam
+invalidate(); outros processos recarregam depois de SUPPLIER_DIRECTORY_TTL
+segundos.
+"""
+import time
+import bisect
+import threading
+import unicodedata
+from models import db, Fornecedor
+
+
+def normalizar(texto):
+    """Sem acentos, minúsculo e com espaços simples"""
+    texto = unicodedata.normalize('NFKD', str(texto or '')).encode('ascii', 'ignore').decode()
+    return ' '.join(texto.casefold().split())
+
+
+def somente_digitos(texto):
+    return ''.join(c for c in str(texto or '') if c.isdigit())
+
+
+class _Indice:
+    """Índices imutáveis de uma carga do cadastro; trocados inteiros ao recarregar"""
+
+    def __init__(self, fornecedores):
+        self.fornecedores = fornecedores
+        self.por_razao = {f['razao_social']: f for f in fornecedores}
+        nomes, palavras, cnpjs, logix = [], [], [], []
+        for i, f in enumerate(fornecedores):
+            nome = normalizar(f['razao_social'])
+            nomes.append((nome, i))
+            palavras.extend((palavra, i) for palavra in set(nome.split()[1:]))
+            cnpjs.append((somente_digitos(f['cnpj']), i))
+            logix.append((normalizar(f['fornecedor_logix']), i))
+        # Ordem de relevância: início da razão social, início de outra palavra, CNPJ, Logix
+        self.listas = [sorted(lista) for lista in (nomes, palavras, cnpjs, logix)]
+        self.chaves = [[chave for chave, _ in lista] for lista in self.listas]
+
+    def buscar(self, termo, limit):
+        chave = normalizar(termo)
+        digitos = somente_digitos(termo)
+        achados = []
+        vistos = set()
+        for n, (lista, chaves) in enumerate(zip(self.listas, self.chaves)):
+            prefixo = digitos if n == 2 else chave
+            if not prefixo:
+                continue
+            i = bisect.bisect_left(chaves, prefixo)
+            while i < len(chaves) and chaves[i].startswith(prefixo) and len(achados) < limit:
+                indice = lista[i][1]
+                if indice not in vistos:
+                    vistos.add(indice)
+                    achados.append(self.fornecedores[indice])
+                i += 1
+            if len(achados) >= limit:
+                break
+        return achados
+
+
+class SupplierDirectory:
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.indice = None
+        self.carregado_em = 0
+        self.ttl = 300
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SUPPLIER_DIRECTORY_TTL', 300)
+        app.config.setdefault('SUPPLIER_AUTOCOMPLETE_LIMIT', 10)
+        self.ttl = app.config['SUPPLIER_DIRECTORY_TTL']
+        self.invalidate()
+        app.extensions['supplier_directory'] = self
+
+    def invalidate(self):
+        with self.lock:
+            self.indice = None
+
+    def _carregar(self):
+        linhas = db.session.query(Fornecedor.id, Fornecedor.razao_social, Fornecedor.cnpj,
+                                  Fornecedor.fornecedor_logix).order_by(Fornecedor.razao_social).all()
+        return _Indice([linha._asdict() for linha in linhas])
+
+    def _atual(self):
+        """Índice vigente; recarrega (precisa de app context) se invalidado ou vencido"""
+        indice = self.indice
+        if indice is not None and time.monotonic() - self.carregado_em < self.ttl:
+            return indice
+        with self.lock:
+            if self.indice is None or time.monotonic() - self.carregado_em >= self.ttl:
+                self.indice = self._carregar()
+                self.carregado_em = time.monotonic()
+            return self.indice
+
+    def search(self, termo, limit=10):
+        return self._atual().buscar(termo, limit)
+
+    def get(self, razao_social):
+        return self._atual().por_razao.get(razao_social)
+
+    def all(self):
+        return self._atual().fornecedores
+
+
+supplier_directory = SupplierDirectory()
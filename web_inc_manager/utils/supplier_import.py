@@ -0,0 +1,260 @@
+"""
+Sincronização em lote do cadastro de fornecedores com exportações do Logix.
+
+O arquivo (CSV com cabeçalho ou largura fixa) é lido em streaming e
+aplicado em lotes: para cada lote uma consulta traz os fornecedores já
+cadastrados pelo CNPJ normalizado (índice ix_fornecedor_cnpj_digitos) e
+outra os códigos Logix em uso; a diferença vira um INSERT e um UPDATE em
+massa na mesma transação. Toda linha inserida, alterada, em conflito ou com
+erro vai para o relatório CSV.
+"""
+import io
+import csv
+import logging
+import chardet
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex
+from models import db, Fornecedor, FornecedorAlias, INC, cnpj_digitos
+from utils.inc_import import iter_csv
+from utils.sqlite_profile import begin_write
+from utils.change_log import record_changes
+from utils.supplier_directory import supplier_directory, normalizar, somente_digitos
+from utils.supplier_ppm import renomear_fornecedor
+
+logger = logging.getLogger(__name__)
+
+CAMPOS = ('fornecedor_logix', 'cnpj', 'razao_social')
+# Largura das colunas da exportação padrão do Logix (cod_fornecedor, num_cgc_cpf, raz_social)
+LAYOUT_LARGURA_FIXA = 'fornecedor_logix:15,cnpj:19,razao_social:50'
+FORMATOS = ('csv', 'largura_fixa')
+
+# Nomes de coluna do Logix e variações -> campo do Fornecedor
+ALIASES = {
+    'cod_fornecedor': 'fornecedor_logix', 'cod_fornec': 'fornecedor_logix', 'codigo': 'fornecedor_logix',
+    'codigo_logix': 'fornecedor_logix', 'logix': 'fornecedor_logix',
+    'num_cgc_cpf': 'cnpj', 'cgc': 'cnpj', 'cnpj_cpf': 'cnpj', 'cgc_cpf': 'cnpj',
+    'raz_social': 'razao_social', 'nom_fornecedor': 'razao_social', 'nome': 'razao_social',
+}
+
+
+def parse_layout(layout):
+    """'campo:largura,...' -> [(campo, início, fim)]"""
+    colunas = []
+    inicio = 0
+    for parte in layout.split(','):
+        campo, _, largura = parte.strip().partition(':')
+        if campo not in CAMPOS or not largura.isdigit():
+            raise ValueError(f"Layout de largura fixa inválido: {parte.strip()}")
+        colunas.append((campo, inicio, inicio + int(largura)))
+        inicio += int(largura)
+    return colunas
+
+
+def _iter_csv(stream):
+    cabecalho = None
+    for numero, valores in enumerate(iter_csv(stream), start=1):
+        if cabecalho is None:
+            cabecalho = ['_'.join(normalizar(v).replace('-', ' ').split()) for v in valores]
+            cabecalho = [ALIASES.get(c, c) for c in cabecalho]
+            faltando = [c for c in CAMPOS if c not in cabecalho]
+            if faltando:
+                raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(faltando)}")
+            continue
+        if any(v.strip() for v in valores):
+            yield numero, dict(zip(cabecalho, valores))
+
+
+def _iter_largura_fixa(stream, layout):
+    colunas = parse_layout(layout)
+    encoding = chardet.detect(stream.read(64 * 1024))['encoding'] or 'latin-1'
+    stream.seek(0)
+    texto = io.TextIOWrapper(stream, encoding=encoding, errors='replace', newline='')
+    for numero, linha in enumerate(texto, start=1):
+        linha = linha.rstrip('\r\n')
+        if linha.strip():
+            yield numero, {campo: linha[inicio:fim] for campo, inicio, fim in colunas}
+
+
+def iter_fornecedores(stream, filename, formato=None, layout=LAYOUT_LARGURA_FIXA):
+    """Gera (número da linha, dict) do arquivo; sem formato, decide pela extensão"""
+    if not formato:
+        formato = 'csv' if filename.lower().endswith('.csv') else 'largura_fixa'
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato não suportado: {formato}")
+    if formato == 'csv':
+        return _iter_csv(stream)
+    return _iter_largura_fixa(stream, layout)
+
+
+def validar_fornecedor(linha):
+    cnpj = somente_digitos(linha.get('cnpj'))
+    if len(cnpj) not in (11, 14):
+        raise ValueError(f"CNPJ/CPF inválido: {(linha.get('cnpj') or '').strip()}")
+    razao_social = ' '.join((linha.get('razao_social') or '').split())
+    if not razao_social:
+        raise ValueError("razão social é obrigatória")
+    logix = (linha.get('fornecedor_logix') or '').strip()
+    if not logix:
+        raise ValueError("código Logix é obrigatório")
+    return {'cnpj': cnpj, 'razao_social': razao_social[:100], 'fornecedor_logix': logix[:100]}
+
+
+class _Relatorio:
+    def __init__(self, saida):
+        self.escritor = csv.writer(saida, delimiter=';')
+        self.escritor.writerow(['linha', 'acao', 'cnpj', 'razao_social', 'fornecedor_logix', 'detalhe'])
+        self.contagem = dict.fromkeys(('inseridos', 'atualizados', 'inalterados', 'conflitos', 'erros'), 0)
+        self.primeiros = []
+
+    def registrar(self, numero, acao, dados, detalhe=''):
+        self.contagem[acao] += 1
+        if acao == 'inalterados':
+            return
+        if acao in ('conflitos', 'erros') and len(self.primeiros) < 50:
+            self.primeiros.append((numero, detalhe))
+        self.escritor.writerow([numero, acao, dados.get('cnpj', ''), dados.get('razao_social', ''),
+                                dados.get('fornecedor_logix', ''), detalhe])
+
+
+def _registrar_nomes_antigos(renomeados):
+    """Grava a razão social antiga como alias confirmado do fornecedor renomeado.
+
+    Relatórios .lst e rotinas salvas com o nome antigo continuam resolvendo
+    para o mesmo fornecedor (inclusive em reconstruir_ppm).
+    """
+    por_alias = {normalizar(antigo): (fornecedor_id, antigo) for fornecedor_id, antigo, _ in renomeados}
+    existentes = dict(db.session.query(FornecedorAlias.alias, FornecedorAlias.id)
+                      .filter(FornecedorAlias.alias.in_(por_alias)))
+    novos, alterados = [], []
+    for alias, (fornecedor_id, antigo) in por_alias.items():
+        dados = {'fornecedor_id': fornecedor_id, 'metodo': 'renomeado', 'score': 1.0, 'confirmado': True}
+        if alias in existentes:
+            alterados.append(dict(dados, id=existentes[alias]))
+        elif alias:
+            novos.append(dict(dados, alias=alias, nome_original=antigo[:200]))
+    if novos:
+        db.session.execute(insert(FornecedorAlias), novos)
+    if alterados:
+        db.session.execute(update(FornecedorAlias), alterados)
+
+
+def aplicar_renomeacoes(renomeados):
+    """Propaga a troca de razão social [(id, antigo, novo)] sem commit.
+
+    As INCs guardam a razão social e acompanham o novo nome, os volumes do
+    PPM passam para ele e o nome antigo fica como alias confirmado. Usado
+    pela importação do Logix e pela edição manual do fornecedor.
+    """
+    if not renomeados:
+        return
+    begin_write(db.session)
+    for _, antigo, novo in renomeados:
+        alteradas = db.session.execute(
+            update(INC).where(INC.fornecedor == antigo).values(fornecedor=novo).returning(INC.id, INC.data)
+            .execution_options(synchronize_session=False)
+        ).all()
+        record_changes(db.session, INC, [inc_id for inc_id, _ in alteradas], 'update')
+        renomear_fornecedor(db.session, antigo, novo, {data for _, data in alteradas})
+    _registrar_nomes_antigos(renomeados)
+
+
+def _aplicar_lote(lote, relatorio):
+    """Compara o lote com o cadastro e grava inserções/alterações numa transação"""
+    begin_write(db.session)
+    digitos = cnpj_digitos(Fornecedor.cnpj)
+    existentes = {
+        linha.digitos: linha for linha in db.session.query(
+            Fornecedor.id, Fornecedor.razao_social, Fornecedor.cnpj, Fornecedor.fornecedor_logix,
+            digitos.label('digitos')
+        ).filter(digitos.in_([dados['cnpj'] for _, dados in lote]))
+    }
+    logix_em_uso = dict(db.session.query(Fornecedor.fornecedor_logix, digitos).filter(
+        Fornecedor.fornecedor_logix.in_([dados['fornecedor_logix'] for _, dados in lote])))
+
+    inserir, alterar, renomeados, aplicados = [], [], [], []
+    for numero, dados in lote:
+        dono_logix = logix_em_uso.get(dados['fornecedor_logix'])
+        if dono_logix is not None and dono_logix != dados['cnpj']:
+            relatorio.registrar(numero, 'conflitos', dados,
+                                f"código Logix {dados['fornecedor_logix']} já pertence ao CNPJ {dono_logix}")
+            continue
+        logix_em_uso[dados['fornecedor_logix']] = dados['cnpj']
+        atual = existentes.get(dados['cnpj'])
+        if atual is None:
+            inserir.append(dados)
+            aplicados.append((numero, 'inseridos', dados, ''))
+            continue
+        mudancas = [f"{campo}: {getattr(atual, campo)} -> {dados[campo]}" for campo in CAMPOS
+                    if getattr(atual, campo) != dados[campo]]
+        if not mudancas:
+            relatorio.registrar(numero, 'inalterados', dados)
+            continue
+        alterar.append(dict(dados, id=atual.id))
+        if atual.razao_social != dados['razao_social']:
+            renomeados.append((atual.id, atual.razao_social, dados['razao_social']))
+        aplicados.append((numero, 'atualizados', dados, '; '.join(mudancas)))
+
+    if inserir:
+        ids = db.session.execute(insert(Fornecedor).returning(Fornecedor.id), inserir).scalars().all()
+        record_changes(db.session, Fornecedor, ids, 'insert')
+    if alterar:
+        db.session.execute(update(Fornecedor), alterar)
+        record_changes(db.session, Fornecedor, [dados['id'] for dados in alterar], 'update')
+    aplicar_renomeacoes(renomeados)
+    db.session.commit()
+
+    for numero, acao, dados, detalhe in aplicados:
+        relatorio.registrar(numero, acao, dados, detalhe)
+
+
+def importar_fornecedores(stream, filename, saida, batch_size=2000, formato=None, layout=LAYOUT_LARGURA_FIXA):
+    """Insere/atualiza fornecedores pelo CNPJ; o relatório de diferenças vai para o CSV `saida`.
+
+    Retorna a contagem por ação e os primeiros conflitos/erros. Precisa de app context.
+    """
+    relatorio = _Relatorio(saida)
+    vistos = {}
+    lote = []
+    try:
+        for numero, linha in iter_fornecedores(stream, filename, formato, layout):
+            try:
+                dados = validar_fornecedor(linha)
+            except ValueError as e:
+                relatorio.registrar(numero, 'erros', {campo: (linha.get(campo) or '').strip() for campo in CAMPOS},
+                                    str(e))
+                continue
+            if dados['cnpj'] in vistos:
+                relatorio.registrar(numero, 'conflitos', dados, f"CNPJ repetido no arquivo (linha {vistos[dados['cnpj']]})")
+                continue
+            vistos[dados['cnpj']] = numero
+            lote.append((numero, dados))
+            if len(lote) >= batch_size:
+                _aplicar_lote(lote, relatorio)
+                lote = []
+        if lote:
+            _aplicar_lote(lote, relatorio)
+    except IntegrityError as e:
+        db.session.rollback()
+        logger.warning(f"Importação de fornecedores interrompida: {e.orig}")
+        raise ValueError("CNPJ duplicado no cadastro atual; corrija os fornecedores repetidos e importe de novo.")
+    finally:
+        supplier_directory.invalidate()
+
+    return dict(relatorio.contagem, primeiros=relatorio.primeiros)
+
+
+def ensure_cnpj_index():
+    """Cria o índice único do CNPJ normalizado em bancos criados antes dele.
+
+    Se o cadastro tiver CNPJs repetidos o índice não é criado e os repetidos
+    vão para o log.
+    """
+    indice = next(i for i in Fornecedor.__table__.indexes if i.name == 'ix_fornecedor_cnpj_digitos')
+    try:
+        with db.engine.begin() as conexao:
+            conexao.execute(CreateIndex(indice, if_not_exists=True))
+    except IntegrityError:
+        digitos = cnpj_digitos(Fornecedor.cnpj)
+        repetidos = db.session.query(digitos).group_by(digitos).having(db.func.count() > 1).limit(20).all()
+        logger.warning(f"Índice único de CNPJ não criado; CNPJs repetidos: {', '.join(r[0] for r in repetidos)}")
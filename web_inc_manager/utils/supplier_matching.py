@@ -0,0 +1,197 @@
+"""
+Vínculo dos fornecedores do relatório .lst com o cadastro.
+
+Cada nome é resolvido, nesta ordem, por: alias já gravado, código Logix,
+razão social normalizada, conjunto de palavras (sem LTDA, S/A etc.) e, por
+último, semelhança (difflib) contra os fornecedores que têm alguma palavra
+em comum. Os índices são dicionários montados a partir do diretório em
+memória (utils.supplier_directory), então as quatro primeiras etapas são
+O(1). Resultados aproximados e nomes sem correspondência ficam gravados
+em FornecedorAlias para revisão; depois disso o mesmo nome não é mais
+comparado.
+"""
+import re
+import difflib
+import threading
+from collections import Counter, defaultdict, namedtuple
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from models import db, FornecedorAlias
+from utils.supplier_directory import supplier_directory, normalizar
+from utils.sqlite_profile import begin_write
+
+Correspondencia = namedtuple('Correspondencia', 'fornecedor metodo score')
+SEM_CORRESPONDENCIA = Correspondencia(None, 'sem_correspondencia', 0.0)
+
+# Palavras que não distinguem fornecedores e abreviações comuns nos relatórios
+PALAVRAS_IGNORADAS = {'ltda', 'ltd', 'sa', 's', 'a', 'me', 'epp', 'eireli', 'cia', 'e', 'de', 'da', 'do', 'das', 'dos'}
+ABREVIACOES = {'industria': 'ind', 'comercio': 'com', 'companhia': 'cia', 'limitada': 'ltda'}
+MAX_CANDIDATOS = 25  # fornecedores comparados por semelhança para cada nome
+
+
+def palavras(nome):
+    tokens = (ABREVIACOES.get(t, t) for t in re.findall(r'[a-z0-9]+', normalizar(nome)))
+    return [t for t in tokens if t not in PALAVRAS_IGNORADAS]
+
+
+def chave_palavras(nome):
+    return ' '.join(sorted(set(palavras(nome))))
+
+
+class _IndiceNomes:
+    def __init__(self, fornecedores):
+        self.fornecedores = fornecedores
+        self.por_id = {f['id']: f for f in fornecedores}
+        self.por_nome = {}
+        self.por_palavras = {}
+        self.por_logix = {}
+        self.invertido = defaultdict(list)
+        self.textos = []
+        for i, f in enumerate(fornecedores):
+            self.por_nome.setdefault(normalizar(f['razao_social']), f)
+            self.por_logix.setdefault(normalizar(f['fornecedor_logix']), f)
+            chave = chave_palavras(f['razao_social'])
+            # Duas razões sociais com as mesmas palavras: a chave fica ambígua
+            self.por_palavras[chave] = None if chave in self.por_palavras else f
+            # Semelhança é medida nas palavras na ordem original, com repetições
+            self.textos.append(' '.join(palavras(f['razao_social'])))
+            for token in set(chave.split()):
+                self.invertido[token].append(i)
+
+    def aproximado(self, nome, limiar):
+        texto = ' '.join(palavras(nome))
+        # Candidatos pelas palavras em comum, com peso maior para as palavras raras no cadastro
+        pesos = Counter()
+        for token in set(texto.split()):
+            postagens = self.invertido.get(token, ())
+            for i in postagens:
+                pesos[i] += 1 / len(postagens)
+        melhor, melhor_score = None, 0.0
+        comparador = difflib.SequenceMatcher(None, b=texto, autojunk=False)
+        for i, _ in pesos.most_common(MAX_CANDIDATOS):
+            comparador.set_seq1(self.textos[i])
+            if comparador.real_quick_ratio() < limiar or comparador.quick_ratio() < limiar:
+                continue
+            score = comparador.ratio()
+            if score > melhor_score:
+                melhor, melhor_score = self.fornecedores[i], score
+        if melhor is not None and melhor_score >= limiar:
+            return Correspondencia(melhor, 'aproximado', round(melhor_score, 3))
+        return None
+
+    def resolver(self, codigo, nome, limiar):
+        fornecedor = self.por_logix.get(normalizar(codigo)) if codigo else None
+        if fornecedor is not None:
+            return Correspondencia(fornecedor, 'logix', 1.0)
+        fornecedor = self.por_nome.get(normalizar(nome))
+        if fornecedor is not None:
+            return Correspondencia(fornecedor, 'exato', 1.0)
+        fornecedor = self.por_palavras.get(chave_palavras(nome))
+        if fornecedor is not None:
+            return Correspondencia(fornecedor, 'palavras', 1.0)
+        return self.aproximado(nome, limiar)
+
+
+class SupplierMatcher:
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.base = None
+        self.indice = None
+        self.cache = {}
+        self.limiar = 0.88
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SUPPLIER_FUZZY_THRESHOLD', 0.88)
+        self.limiar = app.config['SUPPLIER_FUZZY_THRESHOLD']
+        self.invalidate()
+        app.extensions['supplier_matcher'] = self
+
+    def invalidate(self):
+        """Descarta os resultados em memória (após revisar aliases)"""
+        with self.lock:
+            self.cache = {}
+
+    def _indice(self):
+        fornecedores = supplier_directory.all()
+        with self.lock:
+            # O diretório foi recarregado: refaz os índices de nomes
+            if fornecedores is not self.base:
+                self.base = fornecedores
+                self.indice = _IndiceNomes(fornecedores)
+                self.cache = {}
+            return self.indice, self.cache
+
+    def resolve(self, nomes):
+        """Resolve em lote uma coleção de (código Logix, nome); retorna {(código, nome): Correspondencia}"""
+        indice, cache = self._indice()
+        pendentes = {chave for chave in set(nomes) if chave not in cache}
+        resultado = {chave: cache[chave] for chave in set(nomes) - pendentes}
+        if not pendentes:
+            return resultado
+
+        # Uma consulta para todos os aliases do lote
+        normalizados = {chave: normalizar(chave[1]) for chave in pendentes}
+        aliases = {a.alias: a for a in FornecedorAlias.query.filter(
+            FornecedorAlias.alias.in_(set(normalizados.values())))}
+
+        novos, atualizados = {}, {}
+        for chave in pendentes:
+            alias = aliases.get(normalizados[chave])
+            if alias is not None and (alias.confirmado or alias.fornecedor_id is not None):
+                fornecedor = indice.por_id.get(alias.fornecedor_id)
+                if fornecedor is not None or alias.fornecedor_id is None:
+                    metodo = 'alias' if alias.confirmado else alias.metodo
+                    correspondencia = Correspondencia(fornecedor, metodo, alias.score or 0.0) \
+                        if fornecedor is not None else SEM_CORRESPONDENCIA
+                    resultado[chave] = cache[chave] = correspondencia
+                    continue
+            correspondencia = indice.resolver(*chave, self.limiar) or SEM_CORRESPONDENCIA
+            resultado[chave] = cache[chave] = correspondencia
+            if alias is not None and correspondencia.fornecedor is not None:
+                # Nome que estava sem correspondência passou a ter (fornecedor cadastrado depois)
+                atualizados[alias.id] = {'id': alias.id, 'fornecedor_id': correspondencia.fornecedor['id'],
+                                         'metodo': correspondencia.metodo, 'score': correspondencia.score}
+            # Só o que precisa de revisão vai para a tabela de aliases
+            elif correspondencia.metodo in ('aproximado', 'sem_correspondencia') and alias is None \
+                    and normalizados[chave]:
+                novos.setdefault(normalizados[chave], {
+                    'alias': normalizados[chave],
+                    'nome_original': chave[1][:200],
+                    'fornecedor_id': correspondencia.fornecedor['id'] if correspondencia.fornecedor else None,
+                    'metodo': correspondencia.metodo,
+                    'score': correspondencia.score,
+                    'confirmado': False,
+                })
+        if novos or atualizados:
+            self._gravar(list(novos.values()), list(atualizados.values()))
+        return resultado
+
+    def _gravar(self, novos, atualizados):
+        try:
+            begin_write(db.session)
+            if novos:
+                db.session.execute(insert(FornecedorAlias), novos)
+            if atualizados:
+                db.session.execute(update(FornecedorAlias), atualizados)
+            db.session.commit()
+        except IntegrityError:
+            # Outro processo gravou os mesmos nomes ao mesmo tempo
+            db.session.rollback()
+
+
+def vincular_fornecedores(registros):
+    """Preenche razao_social dos registros do .lst com a do cadastro; retorna a contagem por método"""
+    chaves = [(r.get('codigo_fornecedor') or '', r.get('fornecedor') or '') for r in registros]
+    correspondencias = supplier_matcher.resolve(chaves)
+    contagem = Counter()
+    for registro, chave in zip(registros, chaves):
+        correspondencia = correspondencias[chave]
+        contagem[correspondencia.metodo] += 1
+        if correspondencia.fornecedor is not None:
+            registro['razao_social'] = correspondencia.fornecedor['razao_social']
+    return contagem
+
+
+supplier_matcher = SupplierMatcher()
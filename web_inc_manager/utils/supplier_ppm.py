@@ -0,0 +1,255 @@
+"""
+PPM de defeitos por fornecedor e mês.
+
+A tabela fornecedor_mes junta o volume recebido, que está nas rotinas
+salvas, com a quantidade com defeito das INCs, para que o PPM não precise
+decodificar o JSON de todas as rotinas:
+
+- volume recebido: somado quando a rotina é salva, pela razão social
+  vinculada no .lst e pelo mês da inspeção (só registros inspecionados,
+  como em utils.item_stats);
+- INCs e quantidade com defeito: recalculados para os pares fornecedor/mês
+  afetados a cada escrita de INC, com a faixa de datas no índice
+  ix_inc_periodo. Alterações pelo ORM são capturadas no flush; instruções
+  em lote do Core chamam refresh_supplier_months.
+
+reconstruir_ppm refaz a tabela a partir do histórico; as razões sociais
+antigas gravadas nas rotinas são trocadas pela atual através dos aliases
+confirmados (a importação do Logix grava o nome antigo ao renomear).
+"""
+import json
+from datetime import datetime
+from collections import defaultdict
+from sqlalchemy import event, inspect, select, func, bindparam, tuple_
+from models import db, Fornecedor, FornecedorAlias, FornecedorMes, INC, RotinaInspecao, data_iso
+from utils.sqlite_profile import RoutingSession, begin_write
+from utils.supplier_directory import normalizar
+
+tabela = FornecedorMes.__table__
+
+
+def mes_da_data(data):
+    """'DD-MM-YYYY' (INC.data) -> 'YYYY-MM'"""
+    data = str(data or '')
+    return f"{data[6:10]}-{data[3:5]}" if len(data) == 10 else ''
+
+
+def ppm(qtd_defeito, qtd_recebida):
+    return qtd_defeito / qtd_recebida * 1_000_000 if qtd_recebida else None
+
+
+def meses_entre(de, ate):
+    """Meses 'YYYY-MM' de `de` até `ate`, inclusive"""
+    ano, mes = int(de[:4]), int(de[5:7])
+    meses = []
+    while f"{ano:04d}-{mes:02d}" <= ate:
+        meses.append(f"{ano:04d}-{mes:02d}")
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+    return meses
+
+
+def tendencia(valores):
+    """(inclinação por mês, intercepto) da reta de mínimos quadrados dos pontos (posição, valor) não nulos"""
+    pontos = [(x, y) for x, y in enumerate(valores) if y is not None]
+    if len(pontos) < 2:
+        return None
+    media_x = sum(x for x, _ in pontos) / len(pontos)
+    media_y = sum(y for _, y in pontos) / len(pontos)
+    variancia = sum((x - media_x) ** 2 for x, _ in pontos)
+    inclinacao = sum((x - media_x) * (y - media_y) for x, y in pontos) / variancia
+    return inclinacao, media_y - inclinacao * media_x
+
+
+def _partes(valores, tamanho=500):
+    valores = list(valores)
+    for inicio in range(0, len(valores), tamanho):
+        yield valores[inicio:inicio + tamanho]
+
+
+def _garantir(conexao, pares):
+    """Cria as linhas (fornecedor, mês) que ainda não existem"""
+    existentes = set()
+    for parte in _partes(pares):
+        existentes.update(tuple(linha) for linha in conexao.execute(
+            select(tabela.c.fornecedor, tabela.c.mes).where(tuple_(tabela.c.fornecedor, tabela.c.mes).in_(parte))))
+    novos = [{'fornecedor': f, 'mes': m, 'atualizado_em': datetime.utcnow()} for f, m in pares if (f, m) not in existentes]
+    if novos:
+        conexao.execute(tabela.insert(), novos)
+
+
+def _atualizar(conexao, valores, **colunas):
+    """UPDATE em lote por (fornecedor, mês); `colunas` são expressões com os bindparams de `valores`"""
+    if valores:
+        conexao.execute(
+            tabela.update().where(tabela.c.fornecedor == bindparam('b_fornecedor'), tabela.c.mes == bindparam('b_mes'))
+            .values(atualizado_em=datetime.utcnow(), **colunas), valores)
+
+
+def _totais_incs(conexao, pares=None):
+    """{(fornecedor, mês): (INCs, quantidade com defeito)}; sem pares, de todas as INCs"""
+    mes = func.substr(data_iso(INC.data), 1, 7)
+    consulta = select(INC.fornecedor, mes, func.count(), func.coalesce(func.sum(INC.quantidade_com_defeito), 0)) \
+        .group_by(INC.fornecedor, mes)
+    if pares is None:
+        return {(f, m): (total, defeito) for f, m, total, defeito in conexao.execute(consulta)}
+    totais = {}
+    for parte in _partes(sorted(pares, key=lambda par: par[1])):
+        # A faixa de meses do lote deixa a busca no índice de período
+        periodo = data_iso(INC.data)
+        filtro = consulta.where(periodo >= f"{parte[0][1]}-01", periodo <= f"{parte[-1][1]}-31",
+                                tuple_(INC.fornecedor, mes).in_(parte))
+        totais.update(((f, m), (total, defeito)) for f, m, total, defeito in conexao.execute(filtro))
+    return totais
+
+
+def _recalcular_incs(conexao, pares):
+    pares = {(f, m) for f, m in pares if f and m}
+    if not pares:
+        return
+    _garantir(conexao, pares)
+    totais = _totais_incs(conexao, pares)
+    _atualizar(conexao, [{'b_fornecedor': f, 'b_mes': m, 'total_incs': totais.get((f, m), (0, 0))[0],
+                          'qtd_defeito': totais.get((f, m), (0, 0))[1]} for f, m in pares],
+               total_incs=bindparam('total_incs'), qtd_defeito=bindparam('qtd_defeito'))
+
+
+def _somar_recebido(conexao, volumes):
+    volumes = {par: qtd for par, qtd in volumes.items() if par[0] and par[1] and qtd}
+    if not volumes:
+        return
+    _garantir(conexao, volumes)
+    _atualizar(conexao, [{'b_fornecedor': f, 'b_mes': m, 'qtd': qtd} for (f, m), qtd in volumes.items()],
+               qtd_recebida=tabela.c.qtd_recebida + bindparam('qtd'))
+
+
+def _volumes(registros, mes, volumes):
+    for registro in registros:
+        if registro.get('inspecionado'):
+            fornecedor = (registro.get('razao_social') or registro.get('fornecedor') or '').strip()
+            volumes[(fornecedor, mes)] += float(registro.get('qtd_recebida') or 0)
+
+
+def refresh_supplier_months(session, pares):
+    """Recalcula INCs/defeitos dos pares (fornecedor, data DD-MM-YYYY); chamar depois de escritas em lote de INC"""
+    begin_write(session)
+    _recalcular_incs(session.connection(), {(f, mes_da_data(d)) for f, d in pares})
+
+
+def registrar_recebimento(session, registros, data_inspecao):
+    """Soma o volume inspecionado de uma rotina que acabou de ser salva (mesma transação)"""
+    volumes = defaultdict(float)
+    _volumes(registros, data_inspecao.strftime('%Y-%m'), volumes)
+    if volumes:
+        begin_write(session)
+        _somar_recebido(session.connection(), volumes)
+
+
+def renomear_fornecedor(session, antigo, novo, datas_incs):
+    """Move os volumes de `antigo` para `novo` depois que as INCs foram renomeadas"""
+    begin_write(session)
+    conexao = session.connection()
+    recebidos = conexao.execute(select(tabela.c.mes, tabela.c.qtd_recebida).where(tabela.c.fornecedor == antigo)).all()
+    conexao.execute(tabela.delete().where(tabela.c.fornecedor == antigo))
+    _somar_recebido(conexao, {(novo, mes): qtd for mes, qtd in recebidos})
+    _recalcular_incs(conexao, {(novo, mes_da_data(d)) for d in datas_incs})
+
+
+def _nomes_atuais(nomes):
+    """{nome: razão social atual} para os nomes que não estão no cadastro mas têm alias confirmado"""
+    atuais = {razao for razao, in db.session.query(Fornecedor.razao_social)}
+    aliases = dict(db.session.query(FornecedorAlias.alias, Fornecedor.razao_social)
+                   .join(Fornecedor, FornecedorAlias.fornecedor_id == Fornecedor.id)
+                   .filter(FornecedorAlias.confirmado))
+    return {nome: aliases[normalizar(nome)] for nome in nomes
+            if nome not in atuais and normalizar(nome) in aliases}
+
+
+def reconstruir_ppm(lote=500):
+    """Refaz a tabela a partir das rotinas salvas e das INCs; retorna o número de pares fornecedor/mês"""
+    lidos = defaultdict(float)
+    rotinas = db.session.query(RotinaInspecao.data_inspecao, RotinaInspecao.registros) \
+        .order_by(RotinaInspecao.id).yield_per(lote)
+    for data_inspecao, registros in rotinas:
+        _volumes(json.loads(registros or '[]'), data_inspecao.strftime('%Y-%m'), lidos)
+    # Rotinas salvas antes de o fornecedor ser renomeado
+    renomeados = _nomes_atuais({f for f, _ in lidos})
+    volumes = defaultdict(float)
+    for (fornecedor, mes), qtd in lidos.items():
+        volumes[(renomeados.get(fornecedor, fornecedor), mes)] += qtd
+
+    begin_write(db.session)
+    conexao = db.session.connection()
+    incs = _totais_incs(conexao)
+    agora = datetime.utcnow()
+    linhas = [{'fornecedor': f, 'mes': m, 'qtd_recebida': volumes.get((f, m), 0.0),
+               'total_incs': incs.get((f, m), (0, 0))[0], 'qtd_defeito': incs.get((f, m), (0, 0))[1],
+               'atualizado_em': agora}
+              for f, m in set(volumes) | set(incs) if f and m]
+    conexao.execute(tabela.delete())
+    for parte in _partes(linhas, 5000):
+        conexao.execute(tabela.insert(), parte)
+    db.session.commit()
+    return len(linhas)
+
+
+def serie_ppm(de, ate, fornecedores=None, limite=10):
+    """PPM mês a mês dos fornecedores (ou dos `limite` com mais defeitos no período)"""
+    meses = meses_entre(de, ate)
+    periodo = FornecedorMes.mes.between(de, ate)
+    if not fornecedores:
+        fornecedores = [f for f, in db.session.query(FornecedorMes.fornecedor).filter(periodo)
+                        .group_by(FornecedorMes.fornecedor)
+                        .order_by(func.sum(FornecedorMes.qtd_defeito).desc(), FornecedorMes.fornecedor)
+                        .limit(limite)]
+    por_fornecedor = {f: {} for f in fornecedores}
+    for linha in FornecedorMes.query.filter(periodo, FornecedorMes.fornecedor.in_(fornecedores)):
+        por_fornecedor[linha.fornecedor][linha.mes] = linha
+
+    resultado = []
+    for fornecedor, linhas in por_fornecedor.items():
+        recebida = sum(l.qtd_recebida or 0 for l in linhas.values())
+        defeito = sum(l.qtd_defeito or 0 for l in linhas.values())
+        valores = [ppm(linhas[m].qtd_defeito or 0, linhas[m].qtd_recebida) if m in linhas else None for m in meses]
+        resultado.append({
+            'fornecedor': fornecedor,
+            'qtd_recebida': recebida,
+            'qtd_defeito': defeito,
+            'total_incs': sum(l.total_incs or 0 for l in linhas.values()),
+            'ppm': ppm(defeito, recebida),
+            'meses': valores,
+            'tendencia': tendencia(valores),
+        })
+    return {'meses': meses, 'fornecedores': resultado}
+
+
+class SupplierPPM:
+    """Recalcula os pares fornecedor/mês das INCs alteradas em cada flush do ORM"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not event.contains(RoutingSession, 'after_flush', self._after_flush):
+            event.listen(RoutingSession, 'after_flush', self._after_flush)
+        app.extensions['supplier_ppm'] = self
+
+    def _after_flush(self, session, flush_context):
+        pares = set()
+        for obj in list(session.new) + list(session.deleted):
+            if isinstance(obj, INC):
+                pares.add((obj.fornecedor, mes_da_data(obj.data)))
+        for obj in session.dirty:
+            if not isinstance(obj, INC):
+                continue
+            atributos = inspect(obj).attrs
+            historicos = (atributos.fornecedor.history, atributos.data.history,
+                          atributos.quantidade_com_defeito.history)
+            if any(h.has_changes() for h in historicos):
+                # Fornecedor ou data trocados: recalcula os pares antigos e os novos
+                pares.update((f, mes_da_data(d)) for f in historicos[0].sum() for d in historicos[1].sum())
+        if pares:
+            _recalcular_incs(session.connection(), pares)
+
+
+supplier_ppm = SupplierPPM()
@@ -0,0 +1,70 @@
+import os
+import hashlib
+import mimetypes
+import threading
+from flask import current_app, url_for, send_from_directory, redirect, abort, make_response
+from werkzeug.security import safe_join
+
+# Cache de fingerprints por arquivo: caminho -> ((mtime, tamanho), fingerprint)
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def file_fingerprint(path):
+    """Retorna um hash curto do conteúdo do arquivo, recalculado só quando ele muda"""
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _fingerprints.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    fingerprint = digest.hexdigest()[:12]
+    with _fingerprints_lock:
+        _fingerprints[path] = (key, fingerprint)
+    return fingerprint
+
+
+def upload_url(foto):
+    """URL com fingerprint para uma foto salva como 'uploads/<arquivo>'"""
+    filename = os.path.basename(foto)
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+    if not os.path.isfile(path):
+        return url_for('static', filename=foto)
+    return url_for('upload_file', fingerprint=file_fingerprint(path), filename=filename)
+
+
+def send_upload(fingerprint, filename):
+    """Entrega um arquivo de upload com cache imutável.
+
+    Respostas condicionais (ETag/Last-Modified) são tratadas pelo send_file.
+    Com USE_X_SENDFILE a transferência fica com o Apache/lighttpd; com
+    UPLOAD_ACCEL_REDIRECT ela é delegada ao nginx via X-Accel-Redirect.
+    """
+    folder = current_app.config['UPLOAD_FOLDER']
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    current = file_fingerprint(path)
+    if fingerprint != current:
+        # Arquivo mudou desde que a URL foi gerada: aponta para a versão atual
+        return redirect(url_for('upload_file', fingerprint=current, filename=filename))
+
+    max_age = current_app.config.get('UPLOAD_CACHE_MAX_AGE', 31536000)
+    accel_prefix = current_app.config.get('UPLOAD_ACCEL_REDIRECT')
+    if accel_prefix:
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{filename}"
+        response.headers['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response.set_etag(current)
+    else:
+        response = send_from_directory(folder, filename, etag=current, conditional=True, max_age=max_age)
+
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,160 @@
+"""
+Exportação de INCs para Excel (.xlsx) com memória constante.
+
+A planilha usa o workbook write-only do openpyxl: cada linha vai direto
+para o arquivo temporário da aba (strings inline, sem tabela de strings
+compartilhadas em memória) e o .xlsx é montado em `saida`, normalmente um
+arquivo temporário enviado em blocos. As INCs são lidas em lotes
+(yield_per), só com as colunas exportadas, sem objetos do ORM.
+
+Com uma aba por fornecedor a consulta é ordenada por fornecedor e cada aba
+é fechada quando o fornecedor seguinte começa, então só um arquivo
+temporário fica aberto por vez; a primeira aba traz o resumo.
+"""
+import re
+from datetime import datetime
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+from models import INC
+
+# (cabeçalho, coluna, largura, formato numérico)
+COLUNAS = (
+    ('OC', INC.oc, 10, '0'),
+    ('NF-e', INC.nf, 10, '0'),
+    ('Data', INC.data, 12, 'DD/MM/YYYY'),
+    ('Representante', INC.representante, 30, None),
+    ('Fornecedor', INC.fornecedor, 40, None),
+    ('Item', INC.item, 12, None),
+    ('Qtd. Recebida', INC.quantidade_recebida, 14, '#,##0'),
+    ('Qtd. com Defeito', INC.quantidade_com_defeito, 16, '#,##0'),
+    ('Descrição do Defeito', INC.descricao_defeito, 50, None),
+    ('Urgência', INC.urgencia, 12, None),
+    ('Ação Recomendada', INC.acao_recomendada, 50, None),
+    ('Status', INC.status, 14, None),
+    ('Criada em', INC.created_at, 18, 'DD/MM/YYYY HH:MM'),
+)
+DATA, FORNECEDOR, RECEBIDA, DEFEITO = 2, 4, 6, 7  # posições em COLUNAS
+CARACTERES_ABA = re.compile(r'[\\/?*\[\]:]')
+TAMANHO_ABA = 31  # limite do Excel
+
+
+def titulo_aba(nome, usados):
+    """Nome de aba válido e único (sem diferenciar maiúsculas) para o fornecedor"""
+    base = CARACTERES_ABA.sub(' ', ' '.join(str(nome or '').split())).strip(" '") or 'Sem fornecedor'
+    titulo = base[:TAMANHO_ABA].rstrip()
+    contador = 2
+    while titulo.lower() in usados:
+        sufixo = f" ({contador})"
+        titulo = base[:TAMANHO_ABA - len(sufixo)].rstrip() + sufixo
+        contador += 1
+    usados.add(titulo.lower())
+    return titulo
+
+
+def _cabecalho(aba, titulos):
+    negrito = Font(bold=True)
+    celulas = []
+    for titulo in titulos:
+        celula = WriteOnlyCell(aba, titulo)
+        celula.font = negrito
+        celulas.append(celula)
+    aba.append(celulas)
+
+
+def _data(valor):
+    """'DD-MM-YYYY' -> date; o texto original se não estiver nesse formato"""
+    try:
+        return datetime.strptime(valor, '%d-%m-%Y').date()
+    except (TypeError, ValueError):
+        return valor
+
+
+class _Planilha:
+    """Escreve as linhas de INC numa aba write-only, com tipos e formatos por coluna"""
+
+    def __init__(self, workbook, titulo):
+        self.aba = workbook.create_sheet(titulo)
+        # Larguras e painel congelado precisam ser definidos antes da primeira linha
+        for indice, (_, _, largura, _) in enumerate(COLUNAS, start=1):
+            self.aba.column_dimensions[get_column_letter(indice)].width = largura
+        self.aba.freeze_panes = 'A2'
+        _cabecalho(self.aba, [titulo_coluna for titulo_coluna, *_ in COLUNAS])
+        self.linhas = 0
+        self.recebida = 0
+        self.defeito = 0
+
+    def _celula(self, valor, formato):
+        if isinstance(valor, str):
+            valor = ILLEGAL_CHARACTERS_RE.sub('', valor)
+            if valor.startswith('='):
+                # Texto começando com "=" viraria fórmula
+                celula = WriteOnlyCell(self.aba, valor)
+                celula.data_type = 's'
+                return celula
+            if formato is None:
+                return valor
+        if valor is None or formato is None:
+            return valor
+        celula = WriteOnlyCell(self.aba, valor)
+        celula.number_format = formato
+        return celula
+
+    def escrever(self, linha):
+        valores = list(linha)
+        valores[DATA] = _data(valores[DATA])
+        self.aba.append([self._celula(valor, coluna[3]) for valor, coluna in zip(valores, COLUNAS)])
+        self.linhas += 1
+        self.recebida += linha[RECEBIDA] or 0
+        self.defeito += linha[DEFEITO] or 0
+
+    def fechar(self):
+        if self.linhas:
+            self.aba.auto_filter.ref = f"A1:{get_column_letter(len(COLUNAS))}{self.linhas + 1}"
+        self.aba.close()
+
+
+def escrever_incs_xlsx(query, saida, por_fornecedor=False, lote=1000):
+    """Grava as INCs da consulta em `saida` (arquivo ou caminho); retorna o número de INCs.
+
+    Com por_fornecedor, uma aba por fornecedor precedida de uma aba de resumo.
+    """
+    workbook = Workbook(write_only=True)
+    colunas = [coluna for _, coluna, _, _ in COLUNAS]
+    query = query.with_entities(*colunas)
+    if not por_fornecedor:
+        planilha = _Planilha(workbook, 'INCs')
+        for linha in query.order_by(INC.id).yield_per(lote):
+            planilha.escrever(linha)
+        planilha.fechar()
+        workbook.save(saida)
+        return planilha.linhas
+
+    # O resumo é a primeira aba, mas só é preenchido no fim (cada aba tem o seu arquivo)
+    resumo = workbook.create_sheet('Resumo')
+    resumo.column_dimensions['A'].width = 40
+    resumo.column_dimensions['B'].width = 32
+    for letra in 'CDE':
+        resumo.column_dimensions[letra].width = 16
+    usados = {'resumo'}
+    totais = []
+    planilha, fornecedor = None, None
+    for linha in query.order_by(INC.fornecedor, INC.id).yield_per(lote):
+        if planilha is None or linha[FORNECEDOR] != fornecedor:
+            if planilha is not None:
+                planilha.fechar()
+                totais.append((fornecedor, planilha))
+            fornecedor = linha[FORNECEDOR]
+            planilha = _Planilha(workbook, titulo_aba(fornecedor, usados))
+        planilha.escrever(linha)
+    if planilha is not None:
+        planilha.fechar()
+        totais.append((fornecedor, planilha))
+
+    _cabecalho(resumo, ('Fornecedor', 'Aba', 'INCs', 'Qtd. Recebida', 'Qtd. com Defeito'))
+    for nome, planilha in totais:
+        resumo.append([nome, planilha.aba.title, planilha.linhas, planilha.recebida, planilha.defeito])
+    workbook.save(saida)
+    return sum(planilha.linhas for _, planilha in totais)
@@ -0,0 +1,64 @@
+from functools import lru_cache
+
+# Layout da etiqueta de INC (100 x 122 mm, 203 DPI)
+INC_LABEL_TEMPLATE = """^XA
+^PW800          ; Largura: 100 mm = 800 pontos (203 DPI)
+^LL976          ; Altura: 122 mm = 976 pontos (203 DPI)
+^CF0,30         ; Fonte padrão, tamanho 20 pontos
+^FO50,50^FDNF-e:^FS
+^FO300,50^FD{nf}^FS
+^FO50,100^FDData:^FS
+^FO300,100^FD{data}^FS
+^FO50,150^FDRepresentante:^FS
+^FO300,150^FD{representante}^FS    ; Limitar a 20 caracteres
+^FO50,200^FDFornecedor:^FS
+^FO300,200^FD{fornecedor}^FS      ; Limitar a 20 caracteres
+^FO50,250^FDItem:^FS
+^FO300,250^FD{item}^FS
+^FO50,300^FDQtd. Recebida:^FS
+^FO300,300^FD{quantidade_recebida}^FS
+^FO50,350^FDQtd. Defeituosa:^FS
+^FO300,350^FD{quantidade_com_defeito}^FS
+^FO50,400^FDDescricao:^FS
+^FO300,400^FB600,6,N,10^FD{descricao_defeito}^FS  ; Bloco de texto com quebra de linha
+^FO50,650^FDUrgencia:^FS
+^FO300,650^FD{urgencia}^FS
+^FO50,720^FDAcao Recomendada:^FS
+^FO300,720^FB600,3,N,10^FD{acao_recomendada}^FS  ; Bloco de texto com quebra de linha
+^FO50,830^FDStatus:^FS
+^FO300,830^FD{status}^FS
+^XZ"""
+
+
+@lru_cache(maxsize=2048)
+def _render_label(nf, data, representante, fornecedor, item, quantidade_recebida,
+                  quantidade_com_defeito, descricao_defeito, urgencia, acao_recomendada, status):
+    return INC_LABEL_TEMPLATE.format(
+        nf=nf,
+        data=data,
+        representante=representante[:20],
+        fornecedor=fornecedor[:20],
+        item=item,
+        quantidade_recebida=quantidade_recebida,
+        quantidade_com_defeito=quantidade_com_defeito,
+        descricao_defeito=descricao_defeito,
+        urgencia=urgencia,
+        acao_recomendada=acao_recomendada,
+        status=status,
+    )
+
+
+def render_inc_label(inc):
+    """Gera o ZPL da etiqueta de uma INC.
+
+    O cache é indexado pelos valores dos campos, então uma INC editada gera
+    uma etiqueta nova sem precisar invalidar nada.
+    """
+    return _render_label(inc.nf, inc.data, inc.representante, inc.fornecedor, inc.item,
+                         inc.quantidade_recebida, inc.quantidade_com_defeito,
+                         inc.descricao_defeito, inc.urgencia, inc.acao_recomendada, inc.status)
+
+
+def render_inc_labels(incs):
+    """Concatena as etiquetas de várias INCs em um único job ZPL"""
+    return "\n".join(render_inc_label(inc) for inc in incs)